@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UserProfile, Restaurant, Visinia, Booking, BookingItem
+from .models import UserProfile, Restaurant, Visinia, Booking, BookingItem, RestaurantStats, Task
 
 
 @admin.register(UserProfile)
@@ -37,3 +37,18 @@ class BookingAdmin(admin.ModelAdmin):
     search_fields = ['customer__username', 'restaurant__name']
     readonly_fields = ['created_at', 'updated_at']
     inlines = [BookingItemInline]
+
+
+@admin.register(RestaurantStats)
+class RestaurantStatsAdmin(admin.ModelAdmin):
+    list_display = ['restaurant', 'date', 'booking_count', 'pending_count', 'revenue']
+    list_filter = ['date', 'restaurant']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_after', 'locked_by', 'created_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'last_error']
+    readonly_fields = ['created_at', 'updated_at']
@@ -0,0 +1,12 @@
+from django.urls import path
+
+from . import async_views
+
+# Same paths as the DRF routes they shadow; see kisinia_project/asgi_urls.py.
+urlpatterns = [
+    path('restaurants/', async_views.restaurant_list, name='async-restaurant-list'),
+    path('restaurants/<int:pk>/', async_views.restaurant_detail, name='async-restaurant-detail'),
+    path('restaurants/<int:pk>/logo_file/', async_views.restaurant_logo, name='async-restaurant-logo-file'),
+    path('visiinias/by_restaurant/', async_views.visiinias_by_restaurant, name='async-visinia-by-restaurant'),
+    path('visiinias/<int:pk>/image_file/', async_views.visinia_image, name='async-visinia-image-file'),
+]
@@ -0,0 +1,189 @@
+import functools
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404, HttpResponse
+from django.shortcuts import aget_object_or_404
+from django.urls import resolve
+from PIL import UnidentifiedImageError
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+
+from .authentication import ClaimsJWTAuthentication
+from .images import VARIANT_WIDTHS, get_variant, preferred_format
+from .media import afile_response
+from .menu_cache import aget_cached_menu
+from .mixins import add_validators, detail_validators, list_aggregates, list_validators, not_modified
+from .models import Restaurant, Visinia
+from .query_plans import restaurant_queryset
+from .roles import aget_request_role
+from .throttling import acheck_throttles
+from .views import RestaurantViewSet, VisioniaViewSet, menu_response, variant_redirect
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status_code)
+
+
+def error_response(request, exc):
+    """The response DRF's exception handler would give for ``exc``"""
+    if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+        exc.auth_header = ClaimsJWTAuthentication().authenticate_header(request)
+    handled = exception_handler(exc, {})
+    response = json_response(handled.data, handled.status_code)
+    for header in ('WWW-Authenticate', 'Retry-After'):
+        if header in handled:
+            response[header] = handled[header]
+    return response
+
+
+async def authenticate(request):
+    """DRF Request carrying the JWT user, for serializers, paginators and role lookups"""
+    api_request = Request(request, authenticators=())
+    result = await ClaimsJWTAuthentication().aauthenticate(request)
+    api_request.user, api_request.auth = result if result is not None else (AnonymousUser(), None)
+    return api_request
+
+
+async def sync_api_view(request):
+    """Hand the request to the sync API view registered for the same path"""
+    match = resolve(request.path_info, urlconf=settings.ROOT_URLCONF)
+    return await sync_to_async(match.func)(request, *match.args, **match.kwargs)
+
+
+def async_read_view(public=False):
+    """Serve GET/HEAD with the decorated coroutine; other methods go to the sync API.
+
+    ``public`` matches AllowAny, otherwise IsAuthenticated. As in DRF, an
+    invalid token is rejected even on public endpoints.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in READ_METHODS:
+                return await sync_api_view(request)
+            try:
+                api_request = await authenticate(request)
+                if not public and not api_request.user.is_authenticated:
+                    raise NotAuthenticated()
+                await acheck_throttles(api_request)
+                return await view(api_request, *args, **kwargs)
+            except (APIException, Http404) as exc:
+                return error_response(request, exc)
+
+        # DRF views are csrf-exempt too; writes fall through to them.
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+async def restaurant_scope(request):
+    """RestaurantViewSet.get_queryset for an authenticated user"""
+    if await aget_request_role(request) == 'RESTAURANT_OWNER':
+        return restaurant_queryset(owner=request.user)
+    return restaurant_queryset(is_active=True)
+
+
+def serialize(viewset, request, instance, many=False):
+    return viewset.serializer_class(instance, many=many, context={'request': request}).data
+
+
+@async_read_view()
+async def restaurant_list(request):
+    queryset = await restaurant_scope(request)
+    fields = RestaurantViewSet.conditional_timestamps
+    stats = await queryset.order_by().aaggregate(**list_aggregates(fields))
+    etag, last_modified = list_validators(request, fields, stats)
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        paginator = RestaurantViewSet.pagination_class()
+        page = await paginator.apaginate_queryset(queryset, request)
+        data = serialize(RestaurantViewSet, request, page, many=True)
+        response = json_response(paginator.get_paginated_response(data).data)
+    return add_validators(response, etag, last_modified)
+
+
+@async_read_view()
+async def restaurant_detail(request, pk):
+    queryset = await restaurant_scope(request)
+    timestamps = await queryset.filter(pk=pk).values_list(*RestaurantViewSet.conditional_timestamps).afirst()
+    if timestamps is None:
+        restaurant = await aget_object_or_404(queryset, pk=pk)
+        return json_response(serialize(RestaurantViewSet, request, restaurant))
+
+    etag, last_modified = detail_validators(request, timestamps)
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        restaurant = await aget_object_or_404(queryset, pk=pk)
+        response = json_response(serialize(RestaurantViewSet, request, restaurant))
+    return add_validators(response, etag, last_modified)
+
+
+@async_read_view()
+async def visiinias_by_restaurant(request):
+    restaurant_id = request.query_params.get('restaurant_id')
+    if not restaurant_id:
+        return json_response(
+            {"detail": "restaurant_id parameter is required"}, status.HTTP_400_BAD_REQUEST
+        )
+    if not restaurant_id.isdigit():
+        return json_response(
+            {"detail": "restaurant_id must be an integer"}, status.HTTP_400_BAD_REQUEST
+        )
+
+    async def render_menu():
+        visiinias = [
+            visinia async for visinia in Visinia.objects.filter(restaurant_id=restaurant_id, is_available=True)
+        ]
+        return JSONRenderer().render(serialize(VisioniaViewSet, request, visiinias, many=True))
+
+    if 'fields' in request.query_params:
+        return HttpResponse(await render_menu(), content_type='application/json')
+
+    etag, body = await aget_cached_menu(int(restaurant_id), render_menu)
+    return menu_response(request, etag, body)
+
+
+async def serve_image(request, field_file):
+    """views.serve_image with file reads and resizing kept off the event loop"""
+    width = request.query_params.get('w')
+    if width is None:
+        try:
+            return await afile_response(request, field_file.storage, field_file.name)
+        except OSError:
+            raise Http404("Image not found")
+
+    if not width.isdigit() or int(width) not in VARIANT_WIDTHS:
+        return json_response(
+            {"detail": f"w must be one of {', '.join(str(w) for w in VARIANT_WIDTHS)}"},
+            status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        variant = await sync_to_async(get_variant, thread_sensitive=False)(
+            field_file, int(width), preferred_format(request)
+        )
+    except (OSError, UnidentifiedImageError):
+        raise Http404("Image not found")
+    return variant_redirect(field_file, variant)
+
+
+@async_read_view(public=True)
+async def restaurant_logo(request, pk):
+    restaurant = await aget_object_or_404(Restaurant, pk=pk)
+    if not restaurant.logo:
+        raise Http404("Logo not found")
+    return await serve_image(request, restaurant.logo)
+
+
+@async_read_view(public=True)
+async def visinia_image(request, pk):
+    visinia = await aget_object_or_404(Visinia, pk=pk)
+    if not visinia.image:
+        raise Http404("Image not found")
+    return await serve_image(request, visinia.image)
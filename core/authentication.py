@@ -0,0 +1,164 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import ClaimsUser, UserProfile
+from .roles import get_user_role
+
+AUTH_VERSION_CLAIM = 'ver'
+USER_CLAIMS = ('role', 'is_staff', 'is_superuser', AUTH_VERSION_CLAIM)
+DEFAULT_ROLE = UserProfile._meta.get_field('role').default
+
+
+def auth_version(role, is_staff, is_superuser, is_active):
+    """Fingerprint of everything a token vouches for; changes whenever one of them does"""
+    seed = f'{role}|{int(is_staff)}|{int(is_superuser)}|{int(is_active)}'
+    return hashlib.sha256(seed.encode()).hexdigest()[:12]
+
+
+def _cache():
+    return caches['default']
+
+
+def _version_key(user_id):
+    return f'auth:version:{user_id}'
+
+
+def _cache_ttl():
+    return getattr(settings, 'AUTH_VERSION_CACHE_TTL', 300)
+
+
+def _version_query(user_id):
+    return User.objects.filter(pk=user_id).values_list('profile__role', 'is_staff', 'is_superuser', 'is_active')
+
+
+def _version_of(row):
+    if row is None:
+        return None
+    role, is_staff, is_superuser, is_active = row
+    return auth_version(role or DEFAULT_ROLE, is_staff, is_superuser, is_active)
+
+
+def current_auth_version(user_id):
+    """The user's current claims version from the cache, one query on a miss; None if the user is gone"""
+    key = _version_key(user_id)
+    version = _cache().get(key)
+    if version is None:
+        version = _version_of(_version_query(user_id).first())
+        if version is not None:
+            _cache().set(key, version, _cache_ttl())
+    return version
+
+
+async def acurrent_auth_version(user_id):
+    key = _version_key(user_id)
+    version = await _cache().aget(key)
+    if version is None:
+        version = _version_of(await _version_query(user_id).afirst())
+        if version is not None:
+            await _cache().aset(key, version, _cache_ttl())
+    return version
+
+
+def invalidate_auth_version(*user_ids):
+    """Make the next request of these users re-read their role and flags"""
+    _cache().delete_many([_version_key(user_id) for user_id in user_ids])
+
+
+def add_auth_claims(token, user):
+    """Embed the role, staff flags and their version in a token"""
+    role = get_user_role(user)
+    version = auth_version(role, user.is_staff, user.is_superuser, user.is_active)
+    token['role'] = role
+    token['is_staff'] = user.is_staff
+    token['is_superuser'] = user.is_superuser
+    token[AUTH_VERSION_CLAIM] = version
+    _cache().set(_version_key(user.pk), version, _cache_ttl())
+    return token
+
+
+def token_user(validated_token):
+    """ClaimsUser with only the claimed fields loaded"""
+    values = {
+        'id': ClaimsUser._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM]),
+        'is_staff': validated_token['is_staff'],
+        'is_superuser': validated_token['is_superuser'],
+        # The version covers is_active, so a deactivated user's tokens fail it.
+        'is_active': True,
+    }
+    loaded = [field.attname for field in ClaimsUser._meta.concrete_fields if field.attname in values]
+    return ClaimsUser.from_db(DEFAULT_DB_ALIAS, loaded, [values[name] for name in loaded])
+
+
+class AsyncJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication with an ``aauthenticate`` that loads the user through the async ORM"""
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
+
+
+class ClaimsJWTAuthentication(AsyncJWTAuthentication):
+    """Authenticate from the access token's claims instead of loading the User row.
+
+    The token's version claim must match the user's current one (cached), so
+    changing the role, staff flags or active status invalidates older tokens
+    until the client refreshes. Tokens without the claims use the database.
+    """
+
+    def uses_claims(self, validated_token):
+        return not api_settings.CHECK_REVOKE_TOKEN and all(claim in validated_token for claim in USER_CLAIMS)
+
+    def check_version(self, validated_token, version):
+        if version is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if version != validated_token[AUTH_VERSION_CLAIM]:
+            raise AuthenticationFailed(
+                _("Token was issued before the user's role or status changed."), code="token_outdated"
+            )
+
+    def get_user(self, validated_token):
+        if not self.uses_claims(validated_token):
+            return super().get_user(validated_token)
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        self.check_version(validated_token, current_auth_version(user_id))
+        return token_user(validated_token)
+
+    async def aget_user(self, validated_token):
+        if not self.uses_claims(validated_token):
+            return await super().aget_user(validated_token)
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        self.check_version(validated_token, await acurrent_auth_version(user_id))
+        return token_user(validated_token)
@@ -0,0 +1,250 @@
+import asyncio
+import random
+import statistics
+import time
+from decimal import Decimal
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .models import UserProfile, Restaurant, Visinia, Booking, BookingItem
+from .roles import clear_role_cache
+from .serializers import RoleTokenObtainPairSerializer
+
+BATCH_SIZE = 500
+
+
+def generate_dataset(restaurants=10, items=20, bookings=1000, customers=50, seed=1):
+    """Bulk-insert owners, customers, restaurants, menus and bookings with items"""
+    rng = random.Random(seed)
+
+    owners = User.objects.bulk_create(
+        [User(username=f'bench_owner_{index}') for index in range(restaurants)], batch_size=BATCH_SIZE
+    )
+    buyers = User.objects.bulk_create(
+        [User(username=f'bench_customer_{index}') for index in range(customers)], batch_size=BATCH_SIZE
+    )
+    UserProfile.objects.bulk_create(
+        [UserProfile(user=owner, role='RESTAURANT_OWNER') for owner in owners]
+        + [UserProfile(user=buyer, role='CUSTOMER') for buyer in buyers],
+        batch_size=BATCH_SIZE,
+    )
+
+    venues = Restaurant.objects.bulk_create([
+        Restaurant(owner=owner, name=f'Bench Restaurant {index}', address='Bench St', phone='000')
+        for index, owner in enumerate(owners)
+    ], batch_size=BATCH_SIZE)
+    dishes = Visinia.objects.bulk_create([
+        Visinia(
+            restaurant=venue,
+            name=f'Dish {index}',
+            description=rng.choice(['biriyani', 'seafood', 'rice', 'grill', 'chips']) + ' platter',
+            price=Decimal(rng.randint(200, 3000)) / 100,
+        )
+        for venue in venues
+        for index in range(items)
+    ], batch_size=BATCH_SIZE)
+
+    menus = {}
+    for dish in dishes:
+        menus.setdefault(dish.restaurant_id, []).append(dish)
+
+    orders = []
+    for _ in range(bookings):
+        venue = rng.choice(venues)
+        orders.append(Booking(
+            customer=rng.choice(buyers),
+            restaurant=venue,
+            status=rng.choice(['PENDING', 'CONFIRMED', 'COMPLETED', 'CANCELLED']),
+        ))
+    orders = Booking.objects.bulk_create(orders, batch_size=BATCH_SIZE)
+
+    lines = []
+    for order in orders:
+        total = Decimal('0')
+        for dish in rng.sample(menus[order.restaurant_id], min(3, items)):
+            quantity = rng.randint(1, 3)
+            lines.append(BookingItem(booking=order, visinia=dish, quantity=quantity, price=dish.price))
+            total += dish.price * quantity
+        order.total_price = total
+    BookingItem.objects.bulk_create(lines, batch_size=BATCH_SIZE)
+    Booking.objects.bulk_update(orders, ['total_price'], batch_size=BATCH_SIZE)
+
+    return {'owners': owners, 'customers': buyers, 'restaurants': venues, 'menus': menus}
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(samples)
+    rank = max(int(round(fraction * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class ScenarioRunner:
+    """Drive the API in-process and record latency and query counts per endpoint"""
+
+    def __init__(self, dataset, seed=1):
+        self.dataset = dataset
+        self.rng = random.Random(seed)
+        self.samples = {}
+        self.clients = {}
+
+    def client_for(self, user):
+        client = self.clients.get(user.pk)
+        if client is None:
+            client = APIClient()
+            token = RoleTokenObtainPairSerializer.get_token(user).access_token
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.clients[user.pk] = client
+        return client
+
+    def call(self, name, user, method, path, data=None, expect=200):
+        client = self.client_for(user)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(client, method)(path, data, format='json')
+            elapsed = time.perf_counter() - started
+        if response.status_code != expect:
+            raise RuntimeError(f'{name}: {method.upper()} {path} returned {response.status_code}')
+        self.samples.setdefault(name, []).append((elapsed, len(queries)))
+        return response
+
+    def browse_menu(self):
+        customer = self.rng.choice(self.dataset['customers'])
+        venue = self.rng.choice(self.dataset['restaurants'])
+        self.call('restaurant-list', customer, 'get', '/api/restaurants/')
+        self.call('visinia-by-restaurant', customer, 'get',
+                  f'/api/visiinias/by_restaurant/?restaurant_id={venue.id}')
+        return customer, venue
+
+    def place_booking(self, customer, venue):
+        dishes = self.rng.sample(self.dataset['menus'][venue.id], min(3, len(self.dataset['menus'][venue.id])))
+        response = self.call('booking-create', customer, 'post', '/api/bookings/', {
+            'restaurant_id': venue.id,
+            'items': [{str(dish.id): self.rng.randint(1, 3)} for dish in dishes],
+        }, expect=201)
+        return response.data['id']
+
+    def owner_confirm(self, venue, booking_id):
+        owner = venue.owner
+        self.call('booking-list', owner, 'get', '/api/bookings/')
+        self.call('booking-confirm', owner, 'post', f'/api/bookings/{booking_id}/confirm/')
+
+    def run(self, iterations):
+        """browse menu -> place booking -> owner confirm, ``iterations`` times"""
+        caches['default'].clear()
+        clear_role_cache()
+        started = time.perf_counter()
+        for _ in range(iterations):
+            customer, venue = self.browse_menu()
+            booking_id = self.place_booking(customer, venue)
+            self.owner_confirm(venue, booking_id)
+        return time.perf_counter() - started
+
+    def report(self, wall_time):
+        endpoints = {}
+        for name, samples in sorted(self.samples.items()):
+            latencies = [elapsed * 1000 for elapsed, _ in samples]
+            queries = [count for _, count in samples]
+            endpoints[name] = {
+                'requests': len(samples),
+                'p50_ms': round(percentile(latencies, 0.50), 3),
+                'p95_ms': round(percentile(latencies, 0.95), 3),
+                'p99_ms': round(percentile(latencies, 0.99), 3),
+                'mean_ms': round(statistics.fmean(latencies), 3),
+                'requests_per_sec': round(len(samples) / (sum(latencies) / 1000), 1),
+                'queries_per_request': round(statistics.fmean(queries), 2),
+                'max_queries': max(queries),
+            }
+        total_requests = sum(len(samples) for samples in self.samples.values())
+        return {
+            'endpoints': endpoints,
+            'total': {
+                'requests': total_requests,
+                'wall_time_s': round(wall_time, 3),
+                'requests_per_sec': round(total_requests / wall_time, 1) if wall_time else None,
+            },
+        }
+
+
+def compare_reports(baseline, current, metric='p95_ms'):
+    """Percent change of ``metric`` per endpoint present in both reports"""
+    changes = {}
+    for name, stats in current['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name, {}).get(metric)
+        if before:
+            changes[name] = round((stats[metric] - before) / before * 100, 1)
+    return changes
+
+
+class ConcurrentReadRunner:
+    """Drive an ASGI application in-process with many concurrent keep-alive clients.
+
+    Each client sends GET requests back to back, so ``concurrency`` is the
+    number of connections one worker process is serving at any moment.
+    """
+
+    def __init__(self, application, paths, headers=()):
+        self.application = application
+        self.paths = list(paths)
+        self.headers = [(b'host', b'testserver'), *headers]
+        self.latencies = []
+        self.errors = 0
+
+    async def get(self, path):
+        url = urlsplit(path)
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': url.path, 'raw_path': url.path.encode(), 'root_path': '',
+            'query_string': url.query.encode(), 'headers': self.headers,
+            'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+        }
+        request_sent = False
+        disconnected = asyncio.Event()
+        status = None
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        started = time.perf_counter()
+        await self.application(scope, receive, send)
+        self.latencies.append(time.perf_counter() - started)
+        disconnected.set()
+        if status is None or status >= 400:
+            self.errors += 1
+
+    async def client(self, offset, requests):
+        for index in range(requests):
+            await self.get(self.paths[(offset + index) % len(self.paths)])
+
+    async def run(self, concurrency, requests):
+        """``requests`` in total, spread over ``concurrency`` clients; returns a report"""
+        self.latencies, self.errors = [], 0
+        per_client = max(requests // concurrency, 1)
+        started = time.perf_counter()
+        await asyncio.gather(*[self.client(index, per_client) for index in range(concurrency)])
+        wall_time = time.perf_counter() - started
+        latencies = [elapsed * 1000 for elapsed in self.latencies]
+        return {
+            'concurrency': concurrency,
+            'requests': len(latencies),
+            'errors': self.errors,
+            'requests_per_sec': round(len(latencies) / wall_time, 1),
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+        }
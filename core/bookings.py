@@ -0,0 +1,137 @@
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import NotFound, ValidationError
+
+from .models import Restaurant, Visinia, Booking, BookingItem
+from .events import publish_booking_event
+from .stats import record_booking_created, record_status_changes
+from .stock import release_stock, reserve_stock, schedule_restock
+
+# Queries issued by place_booking regardless of how many items are ordered:
+# restaurant lookup, menu lookup, booking insert, booking items bulk insert,
+# plus four for the daily restaurant and item stats upserts. Items with a
+# daily capacity add one stock upsert, one UPDATE per item and one sold-out check.
+BOOKING_CREATE_QUERY_BUDGET = 8
+
+# Status a booking may move to -> statuses it may move from. COMPLETED and
+# CANCELLED are final.
+BOOKING_TRANSITIONS = {
+    'CONFIRMED': ('PENDING',),
+    'COMPLETED': ('PENDING', 'CONFIRMED'),
+    'CANCELLED': ('PENDING', 'CONFIRMED'),
+}
+# Largest batch accepted by POST /api/bookings/batch_status/.
+MAX_STATUS_BATCH = 500
+
+
+def merge_booking_items(items_data):
+    """Collapse the [{visinia_id: quantity}, ...] payload into {visinia_id: quantity}"""
+    quantities = {}
+    for item in items_data:
+        for visinia_id, quantity in item.items():
+            try:
+                visinia_id = int(visinia_id)
+            except (TypeError, ValueError):
+                raise ValidationError({"items": f"Invalid visinia id: {visinia_id}"})
+            quantities[visinia_id] = quantities.get(visinia_id, 0) + quantity
+    return quantities
+
+
+def place_booking(customer, restaurant_id, items_data, notes=''):
+    """Create a booking and its items in a fixed number of queries.
+
+    Every requested visinia is resolved in a single query scoped to the
+    restaurant and validated before anything is written. Callers are
+    expected to run this inside a transaction.
+    """
+    quantities = merge_booking_items(items_data)
+
+    try:
+        restaurant = Restaurant.objects.get(id=restaurant_id)
+    except Restaurant.DoesNotExist:
+        raise NotFound("Restaurant not found")
+
+    menu = {
+        visinia.id: visinia
+        for visinia in Visinia.objects.filter(restaurant=restaurant, id__in=quantities.keys())
+    }
+
+    missing = [visinia_id for visinia_id in quantities if visinia_id not in menu]
+    if missing:
+        raise NotFound(f"Visinia {missing[0]} not found in this restaurant")
+
+    unavailable = [visinia_id for visinia_id in quantities if not menu[visinia_id].is_available]
+    if unavailable:
+        raise ValidationError({"items": f"Visinia {unavailable[0]} is not available"})
+
+    total_price = sum(menu[visinia_id].price * quantity for visinia_id, quantity in quantities.items())
+    reserve_stock(menu, quantities, timezone.localdate())
+
+    booking = Booking.objects.create(
+        customer=customer,
+        restaurant=restaurant,
+        notes=notes,
+        total_price=total_price,
+    )
+    items = BookingItem.objects.bulk_create([
+        BookingItem(
+            booking=booking,
+            visinia=menu[visinia_id],
+            quantity=quantity,
+            price=menu[visinia_id].price,
+        )
+        for visinia_id, quantity in quantities.items()
+    ])
+    record_booking_created(booking, items)
+    publish_booking_event(booking)
+    transaction.on_commit(schedule_restock)
+    return booking
+
+
+def can_manage_booking(booking, user):
+    """Owners of the booking's restaurant and staff may confirm and complete it"""
+    return user.is_staff or booking.restaurant.owner_id == user.pk
+
+
+def can_cancel_booking(booking, user):
+    return booking.customer_id == user.pk or can_manage_booking(booking, user)
+
+
+def transition_bookings(bookings, new_status):
+    """Move already-loaded bookings to ``new_status``; returns (changed, refused).
+
+    Each status a booking is moving from costs one
+    ``UPDATE ... WHERE id IN (...) AND status = <seen status>``, so a booking
+    changed by a concurrent request since it was read is left alone and
+    refused rather than overwritten. Changed bookings are updated in place,
+    counted in the stats and announced once the transaction commits. Call
+    inside a transaction.
+    """
+    allowed = BOOKING_TRANSITIONS[new_status]
+    groups = {}
+    refused = []
+    for booking in bookings:
+        if booking.status in allowed:
+            groups.setdefault(booking.status, []).append(booking)
+        else:
+            refused.append(booking)
+
+    changed = []
+    now = timezone.now()
+    for old_status, group in groups.items():
+        ids = [booking.pk for booking in group]
+        # Only status and updated_at are written; the rest of the row is untouched.
+        updated = Booking.objects.filter(pk__in=ids, status=old_status).update(status=new_status, updated_at=now)
+        if updated < len(group):
+            # Lost a race for some rows; ours are the ones carrying this exact stamp.
+            ours = set(Booking.objects.filter(pk__in=ids, status=new_status, updated_at=now).values_list('pk', flat=True))
+            refused += [booking for booking in group if booking.pk not in ours]
+            group = [booking for booking in group if booking.pk in ours]
+        for booking in group:
+            booking.status, booking.updated_at = new_status, now
+            publish_booking_event(booking, old_status)
+        record_status_changes(group, old_status, new_status)
+        if new_status == 'CANCELLED':
+            release_stock(group)
+        changed += group
+    return changed, refused
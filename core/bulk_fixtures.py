@@ -0,0 +1,323 @@
+import codecs
+import io
+import json
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core import serializers
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.utils import timezone
+
+from .catalogue import schedule_build
+from .menu_cache import bump_menu_version
+from .models import UserProfile
+from .authentication import invalidate_auth_version
+from .roles import clear_role_cache
+from .stats import rebuild_restaurant_stats
+
+# Parents before children. Other models in a fixture (contenttypes,
+# permissions, sessions, admin log) are skipped.
+IMPORT_ORDER = (
+    'auth.user',
+    'core.userprofile',
+    'core.restaurant',
+    'core.visinia',
+    'core.booking',
+    'core.bookingitem',
+)
+
+BATCH_SIZE = 2000
+READ_SIZE = 64 * 1024
+
+
+def open_fixture(path):
+    """Text stream over a fixture file, honouring UTF-8/UTF-16 byte order marks"""
+    raw = open(path, 'rb')
+    head = raw.peek(4)[:4]
+    if head.startswith(codecs.BOM_UTF16_LE) or head.startswith(codecs.BOM_UTF16_BE):
+        encoding = 'utf-16'
+    elif head.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+    else:
+        encoding = 'utf-8'
+    return io.TextIOWrapper(raw, encoding=encoding)
+
+
+def iter_fixture_objects(stream, read_size=READ_SIZE):
+    """Yield the objects of a JSON array fixture one at a time, reading in chunks"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    opened = False
+
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position >= len(buffer):
+            if eof:
+                raise ValueError('Fixture ended before the closing "]"')
+            buffer, position = stream.read(read_size), 0
+            eof = not buffer
+            continue
+
+        if not opened:
+            if buffer[position] != '[':
+                raise ValueError('Fixture must be a JSON array')
+            opened = True
+            position += 1
+            continue
+        if buffer[position] == ']':
+            return
+
+        try:
+            obj, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = stream.read(read_size)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        position = end
+        yield obj
+
+
+@contextmanager
+def preserve_timestamps(model):
+    """Keep fixture created_at/updated_at values instead of auto_now/auto_now_add"""
+    changed = []
+    for field in model._meta.concrete_fields:
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            changed.append((field, field.auto_now, field.auto_now_add))
+            field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in changed:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def copy_supported():
+    """COPY needs PostgreSQL through psycopg 3"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        return hasattr(cursor.cursor, 'copy')
+
+
+class FixtureLoader:
+    """Bulk-load fixture objects with one INSERT (or COPY) per batch and no signals.
+
+    Foreign key checks are deferred to the end of the surrounding transaction,
+    so rows with numeric references can be written in the order they appear;
+    rows pointing at users by natural key wait until those users exist.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, use_copy=None):
+        self.batch_size = batch_size
+        self.use_copy = copy_supported() if use_copy is None else use_copy
+        self.user_model = get_user_model()
+        self.models = {label: apps.get_model(label) for label in IMPORT_ORDER}
+        self.pending = {label: [] for label in IMPORT_ORDER}
+        self.waiting = []
+        self.usernames = {}
+        self.counts = {label: 0 for label in IMPORT_ORDER}
+        self.skipped = {}
+        self.user_ids = set()
+        self.restaurant_ids = set()
+
+    def load(self, objects):
+        for record in objects:
+            label = record.get('model', '').lower()
+            if label not in self.pending:
+                self.skipped[label] = self.skipped.get(label, 0) + 1
+                continue
+            self.pending[label].append(record)
+            if len(self.pending[label]) >= self.batch_size:
+                self.flush(label)
+        for label in IMPORT_ORDER:
+            self.flush(label)
+        self.flush_waiting(final=True)
+        return self.counts
+
+    def flush(self, label):
+        records, self.pending[label] = self.pending[label], []
+        if not records:
+            return
+        model = self.models[label]
+        self.resolve_usernames(model, records)
+        ready = []
+        for record in records:
+            instance = self.build(model, record)
+            if instance is None:
+                self.waiting.append((label, record))
+            else:
+                ready.append(instance)
+        self.write(model, ready)
+        if model is self.user_model:
+            self.flush_waiting()
+
+    def flush_waiting(self, final=False):
+        """Retry rows that were waiting for their users"""
+        waiting, self.waiting = self.waiting, []
+        labels = set()
+        for label, record in waiting:
+            self.pending[label].append(record)
+            labels.add(label)
+        for label in IMPORT_ORDER:
+            if label in labels:
+                self.flush(label)
+        if final and self.waiting:
+            label, record = self.waiting[0]
+            raise ValueError(f'{label} pk={record.get("pk")} refers to a user that is not in the fixture or database')
+
+    def resolve_usernames(self, model, records):
+        """Look up the ids of users referenced by natural key in one query"""
+        wanted = set()
+        for field in self.user_fields(model):
+            for record in records:
+                value = record['fields'].get(field.name)
+                if isinstance(value, list) and value[0] not in self.usernames:
+                    wanted.add(value[0])
+        if wanted:
+            username_field = self.user_model.USERNAME_FIELD
+            self.usernames.update(
+                self.user_model.objects.filter(**{f'{username_field}__in': wanted}).values_list(username_field, 'pk')
+            )
+
+    def user_fields(self, model):
+        return [
+            field for field in model._meta.concrete_fields
+            if field.is_relation and field.related_model is self.user_model
+        ]
+
+    def build(self, model, record):
+        """Field values by attname for a record, or None while a referenced user is unknown"""
+        values = {}
+        fields = record['fields']
+        for field in model._meta.concrete_fields:
+            if field.primary_key:
+                if record.get('pk') is not None:
+                    values[field.attname] = field.to_python(record['pk'])
+                continue
+            if field.name not in fields:
+                if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                    values[field.attname] = timezone.now()
+                elif field.has_default():
+                    values[field.attname] = field.get_default()
+                continue
+            value = fields[field.name]
+            if field.is_relation:
+                if isinstance(value, list):
+                    value = self.usernames.get(value[0])
+                    if value is None:
+                        return None
+                values[field.attname] = field.target_field.to_python(value)
+            else:
+                values[field.attname] = field.to_python(value)
+        return values
+
+    def write(self, model, rows):
+        if not rows:
+            return
+        pk_name = model._meta.pk.attname
+        if all(pk_name in row for row in rows):
+            self.insert_rows(model, rows)
+        else:
+            # Rows without a primary key need the ids handed back.
+            with preserve_timestamps(model):
+                instances = model.objects.bulk_create([model(**row) for row in rows], batch_size=self.batch_size)
+            for row, instance in zip(rows, instances):
+                row[pk_name] = instance.pk
+
+        label = model._meta.label_lower
+        self.counts[label] += len(rows)
+        if model is self.user_model:
+            username_field = self.user_model._meta.get_field(self.user_model.USERNAME_FIELD).attname
+            for row in rows:
+                self.usernames[row[username_field]] = row[pk_name]
+                self.user_ids.add(row[pk_name])
+        elif label == 'core.restaurant':
+            self.restaurant_ids.update(row[pk_name] for row in rows)
+        elif label in ('core.visinia', 'core.booking'):
+            self.restaurant_ids.update(row['restaurant_id'] for row in rows)
+
+    def insert_rows(self, model, rows):
+        """COPY (PostgreSQL) or a single executemany INSERT, skipping model instances"""
+        # The real connection, not the per-thread proxy, for the per-value calls.
+        db = connections[DEFAULT_DB_ALIAS]
+        fields = model._meta.concrete_fields
+        table = db.ops.quote_name(model._meta.db_table)
+        columns = ', '.join(db.ops.quote_name(field.column) for field in fields)
+        prepared = (
+            [field.get_db_prep_save(row.get(field.attname), db) for field in fields]
+            for row in rows
+        )
+        with db.cursor() as cursor:
+            if self.use_copy:
+                with cursor.cursor.copy(f'COPY {table} ({columns}) FROM STDIN') as copy:
+                    for values in prepared:
+                        copy.write_row(values)
+            else:
+                placeholders = ', '.join(['%s'] * len(fields))
+                cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', list(prepared))
+
+    def finish(self, rebuild_stats=True):
+        """Reset sequences, add missing profiles and refresh derived data"""
+        models = list(self.models.values())
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+
+        # The profile signal never ran for these users.
+        profiles = 0
+        if self.user_ids:
+            have_profile = set(
+                UserProfile.objects.filter(user_id__in=self.user_ids).values_list('user_id', flat=True)
+            )
+            missing = [UserProfile(user_id=user_id) for user_id in self.user_ids - have_profile]
+            profiles = len(UserProfile.objects.bulk_create(missing, batch_size=self.batch_size))
+
+        clear_role_cache()
+        invalidate_auth_version(*self.user_ids)
+        for restaurant_id in self.restaurant_ids:
+            bump_menu_version(restaurant_id)
+        if self.restaurant_ids:
+            schedule_build()
+        if rebuild_stats and self.restaurant_ids:
+            rebuild_restaurant_stats(self.restaurant_ids)
+        return profiles
+
+
+def iter_export_objects(labels=IMPORT_ORDER, batch_size=BATCH_SIZE):
+    """dumpdata-style dicts for each model, read in primary-key batches"""
+    for label in labels:
+        model = apps.get_model(label)
+        fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+        queryset = model._default_manager.order_by('pk')
+        last_pk = None
+        while True:
+            batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            batch = list(batch[:batch_size])
+            if not batch:
+                break
+            yield from serializers.serialize('python', batch, fields=fields)
+            last_pk = batch[-1].pk
+
+
+def write_fixture(stream, objects):
+    """Write objects as a JSON array, one object per line"""
+    count = 0
+    stream.write('[')
+    for obj in objects:
+        stream.write(',\n' if count else '\n')
+        stream.write(json.dumps(obj, cls=DjangoJSONEncoder, ensure_ascii=False))
+        count += 1
+    stream.write('\n]\n')
+    return count
@@ -0,0 +1,318 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Max
+from rest_framework.renderers import BaseRenderer
+
+from .menu_cache import MENU_CACHE_TIMEOUT, menu_cache
+from .models import Restaurant, Visinia
+from .tasks import task
+
+try:
+    import brotli
+except ModuleNotFoundError:
+    brotli = None
+
+try:
+    import msgpack
+except ModuleNotFoundError:
+    msgpack = None
+
+RESTAURANT_FIELDS = ('id', 'name', 'description', 'address', 'phone', 'logo')
+VISINIA_FIELDS = ('id', 'restaurant_id', 'name', 'description', 'price', 'image')
+
+# Files as written to CATALOGUE_ROOT: encoding -> suffix.
+ENCODINGS = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+
+# Incremented after every committed change to the catalogue's rows; the data
+# version is cached under the count it was computed at.
+CHANGES_KEY = 'catalogue:changes'
+
+
+def _encode(value):
+    return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def _media_url(name):
+    return default_storage.url(name) if name else None
+
+
+def data_version():
+    """Identifies the catalogue's data: the latest change to any restaurant or visinia, and the row counts.
+
+    Derived from the rows themselves, so every process, and every restart,
+    agrees on it. The counts catch deletions. Versions are not ordered:
+    deleting the latest change moves the timestamp back.
+    """
+    restaurants = Restaurant.objects.aggregate(changed=Max('updated_at'), count=Count('pk'))
+    visiinias = Visinia.objects.aggregate(changed=Max('updated_at'), count=Count('pk'))
+    changed = max(filter(None, (restaurants['changed'], visiinias['changed'])), default=None)
+    stamp = int(changed.timestamp() * 1000) if changed else 0
+    return f'{stamp}-{restaurants["count"]}-{visiinias["count"]}'
+
+
+def _changes():
+    cache = menu_cache()
+    changes = cache.get(CHANGES_KEY)
+    if changes is None:
+        # From a timestamp, so a lost counter never reuses a key an older version was cached under.
+        cache.add(CHANGES_KEY, int(time.time() * 1000), timeout=None)
+        changes = cache.get(CHANGES_KEY)
+    return changes
+
+
+def current_version():
+    """data_version() from the cache; only the first request after a change runs its aggregates"""
+    cache = menu_cache()
+    key = f'catalogue:version:{_changes()}'
+    version = cache.get(key)
+    if version is None:
+        # A change committed meanwhile moves the counter, so this cannot be cached as current.
+        version = data_version()
+        cache.set(key, version, MENU_CACHE_TIMEOUT)
+    return version
+
+
+def _note_change():
+    try:
+        menu_cache().incr(CHANGES_KEY)
+    except ValueError:
+        # Lost: the next read starts a new counter.
+        pass
+
+
+def schedule_build():
+    """Call on any change to restaurants or visiinias: invalidates the version and queues a build, on commit"""
+    transaction.on_commit(_note_change, robust=True)
+    build_catalogue.enqueue()
+
+
+def preferred_encoding(accept_encoding, available):
+    """br, then gzip, then identity: the first of ``available`` the Accept-Encoding header allows"""
+    weights = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.partition(';')
+        weight = 1.0
+        name, _, value = params.strip().partition('=')
+        if name.strip() == 'q':
+            try:
+                weight = float(value)
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+    for encoding in ('br', 'gzip'):
+        if encoding in available and weights.get(encoding, weights.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Accept: application/msgpack or ?format=msgpack; the catalogue itself is pre-encoded"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return msgpack.packb(data, default=str)
+
+
+class Snapshot:
+    """One version of the catalogue, pre-encoded in every representation it is served in"""
+
+    def __init__(self, version, body, compressed=None):
+        self.version = version
+        self.body = body
+        digest = hashlib.md5(body, usedforsecurity=False).hexdigest()
+        self.etags = {encoding: f'"{digest}{suffix.replace(".", "-")}"' for encoding, suffix in ENCODINGS.items()}
+        self.etags['msgpack'] = f'"{digest}-msgpack"'
+        if compressed is None:
+            compressed = {'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed['br'] = brotli.compress(body, quality=11)
+        self.encoded = {'identity': body, **compressed}
+        self._msgpack = None
+
+    @property
+    def msgpack(self):
+        if self._msgpack is None:
+            self._msgpack = msgpack.packb(json.loads(self.body))
+        return self._msgpack
+
+
+class Catalogue:
+    """All active restaurants with their available visiinias, kept ready to send.
+
+    The ``build_catalogue`` task renders a snapshot whenever a restaurant or
+    visinia is saved and writes it under CATALOGUE_ROOT. Requests only read:
+    the current version from the cache, then the snapshot for it if it has
+    been written, else the newest one they have, so a change shows up once
+    its build finishes.
+    The document is assembled from one encoded fragment per restaurant, keyed
+    by when that restaurant and its menu last changed, so a build re-renders
+    only the restaurants that did.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fragments = {}
+        self.snapshot = None
+
+    @property
+    def root(self):
+        return Path(getattr(settings, 'CATALOGUE_ROOT', Path(settings.BASE_DIR) / 'var' / 'catalogue'))
+
+    def get(self):
+        version = current_version()
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        loaded = self._load(version)
+        if loaded is None and snapshot is None:
+            loaded = self._load_latest()
+        if loaded is not None:
+            self.snapshot = snapshot = loaded
+        if snapshot is None:
+            # Nothing built yet, on a fresh disk: build once rather than fail.
+            snapshot = self.build()
+        return snapshot
+
+    def build(self):
+        """Write the snapshot for the current data unless it is already on disk"""
+        with self._lock:
+            version = data_version()
+            if self.snapshot is None or self.snapshot.version != version:
+                snapshot = self._load(version)
+                if snapshot is None:
+                    snapshot = self._build(version)
+                else:
+                    # Built before, e.g. ahead of a change since reverted: current again.
+                    self._touch(version)
+                self.snapshot = snapshot
+                self._prune(version)
+            return self.snapshot
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+            self.snapshot = None
+
+    def _render(self, restaurant_ids):
+        restaurants = {row['id']: row for row in Restaurant.objects.filter(pk__in=restaurant_ids).values(*RESTAURANT_FIELDS)}
+        menus = {restaurant_id: [] for restaurant_id in restaurants}
+        for row in Visinia.objects.filter(restaurant_id__in=restaurant_ids, is_available=True).values(*VISINIA_FIELDS):
+            row['image'] = _media_url(row['image'])
+            menus[row.pop('restaurant_id')].append(row)
+        fragments = {}
+        for restaurant_id, row in restaurants.items():
+            row['logo'] = _media_url(row['logo'])
+            row['visiinias'] = menus[restaurant_id]
+            fragments[restaurant_id] = _encode(row)
+        return fragments
+
+    def _build(self, version):
+        restaurants = Restaurant.objects.filter(is_active=True).annotate(
+            menu_changed=Max('visiinias__updated_at'), menu_items=Count('visiinias')
+        )
+        fragment_versions = {
+            row['id']: (row['updated_at'], row['menu_changed'], row['menu_items'])
+            for row in restaurants.values('id', 'updated_at', 'menu_changed', 'menu_items')
+        }
+        stale = [
+            restaurant_id for restaurant_id, fragment_version in fragment_versions.items()
+            if self._fragments.get(restaurant_id, (None,))[0] != fragment_version
+        ]
+        rendered = self._render(stale) if stale else {}
+        fragments = {}
+        for restaurant_id, fragment_version in fragment_versions.items():
+            if restaurant_id in rendered:
+                fragments[restaurant_id] = (fragment_version, rendered[restaurant_id])
+            elif restaurant_id not in stale:
+                fragments[restaurant_id] = self._fragments[restaurant_id]
+            # Otherwise deleted since the first query.
+        self._fragments = fragments
+        body = b'{"restaurants":[' + b','.join(fragment for _, fragment in fragments.values()) + b']}'
+        snapshot = Snapshot(version, body)
+        self._write(snapshot)
+        return snapshot
+
+    def _path(self, version, encoding):
+        return self.root / f'catalogue.{version}.json{ENCODINGS[encoding]}'
+
+    def _load(self, version):
+        try:
+            encoded = {
+                encoding: self._path(version, encoding).read_bytes()
+                for encoding in ENCODINGS if encoding != 'br' or brotli is not None
+            }
+        except OSError:
+            return None
+        return Snapshot(version, encoded.pop('identity'), encoded)
+
+    def _versions(self):
+        """{version: when it was written} of the complete snapshots on disk"""
+        versions = {}
+        for path in self.root.glob('catalogue.*.json'):
+            try:
+                versions[path.name[len('catalogue.'):-len('.json')]] = path.stat().st_mtime_ns
+            except OSError:
+                continue
+        return versions
+
+    def _load_latest(self):
+        versions = self._versions()
+        for version in sorted(versions, key=versions.get, reverse=True):
+            snapshot = self._load(version)
+            if snapshot is not None:
+                return snapshot
+        return None
+
+    def _write(self, snapshot):
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            # Each file is written aside and renamed, so a reader never sees half
+            # a file; the plain one goes last, so its presence marks a complete set.
+            for encoding in sorted(snapshot.encoded, key=lambda encoding: encoding == 'identity'):
+                fd, temporary = tempfile.mkstemp(dir=self.root, prefix='.catalogue-')
+                with os.fdopen(fd, 'wb') as fh:
+                    fh.write(snapshot.encoded[encoding])
+                os.replace(temporary, self._path(snapshot.version, encoding))
+        except OSError:
+            # The in-memory copy still serves; the disk copy only saves a rebuild.
+            pass
+
+    def _touch(self, version):
+        try:
+            os.utime(self._path(version, 'identity'))
+        except OSError:
+            pass
+
+    def _prune(self, version):
+        """Delete snapshots written before ``version``; one written since may be another worker's newer build"""
+        try:
+            versions = self._versions()
+            if version not in versions:
+                return
+            for old, written in versions.items():
+                if written < versions[version]:
+                    for encoding in ENCODINGS:
+                        self._path(old, encoding).unlink(missing_ok=True)
+        except OSError:
+            pass
+
+
+catalogue = Catalogue()
+
+
+@task(max_attempts=3)
+def build_catalogue():
+    """Queued whenever a restaurant or visinia changes; a no-op once the current version is built"""
+    catalogue.build()
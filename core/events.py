@@ -0,0 +1,189 @@
+import asyncio
+import json
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+SUBSCRIPTION_QUEUE_SIZE = 100
+STAFF_CHANNEL = 'bookings'
+STREAM_TICKET_SALT = 'core.events.stream'
+
+
+def restaurant_channel(restaurant_id):
+    return f'restaurant:{restaurant_id}'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+class Subscription:
+    """Messages for one listener, delivered onto the event loop that subscribed"""
+
+    def __init__(self, broker, channels, queue_size=SUBSCRIPTION_QUEUE_SIZE):
+        self.broker = broker
+        self.channels = tuple(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    def deliver(self, message):
+        """Thread-safe; called by the broker from any thread"""
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The subscriber's loop is gone.
+            self.close()
+
+    def _put(self, message):
+        if self.queue.full():
+            # A slow client loses the oldest update rather than stalling publishers.
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout=None):
+        """Next message, or None after ``timeout`` seconds without one"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    """Fan-out of JSON-serializable messages to subscribers of named channels.
+
+    ``publish`` is called from synchronous request code in any thread;
+    ``subscribe`` from the event loop serving the stream. A broker shared
+    between processes (Redis, a message bus) implements the same two methods
+    and delivers into Subscription objects.
+    """
+
+    def publish(self, channels, message):
+        raise NotImplementedError
+
+    def subscribe(self, channels):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class InProcessBroker(Broker):
+    """Delivers to subscribers connected to this process only"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channels, message):
+        with self._lock:
+            targets = set()
+            for channel in channels:
+                targets.update(self._subscribers.get(channel, ()))
+        for subscription in targets:
+            subscription.deliver(message)
+        return len(targets)
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                listeners = self._subscribers.get(channel)
+                if listeners is not None:
+                    listeners.discard(subscription)
+                    if not listeners:
+                        del self._subscribers[channel]
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(getattr(settings, 'EVENT_BROKER', 'core.events.InProcessBroker'))()
+
+
+def publish_booking_event(booking, old_status=None):
+    """Announce a new booking or a status change once the transaction commits"""
+    message = {
+        'event': 'booking.created' if old_status is None else 'booking.status',
+        'data': {
+            'booking_id': booking.pk,
+            'restaurant_id': booking.restaurant_id,
+            'customer_id': booking.customer_id,
+            'status': booking.status,
+            'old_status': old_status,
+            'total_price': str(booking.total_price),
+            'updated_at': booking.updated_at.isoformat() if booking.updated_at else None,
+        },
+    }
+    channels = [
+        restaurant_channel(booking.restaurant_id),
+        user_channel(booking.customer_id),
+        STAFF_CHANNEL,
+    ]
+    transaction.on_commit(lambda: get_broker().publish(channels, message))
+
+
+def channels_for(user, role):
+    """Channels a user may listen to: everything for staff, own restaurants for owners, own bookings otherwise"""
+    from .models import Restaurant
+
+    if user.is_staff or role == 'ADMIN':
+        return [STAFF_CHANNEL]
+    channels = [user_channel(user.pk)]
+    if role == 'RESTAURANT_OWNER':
+        channels += [
+            restaurant_channel(pk) for pk in Restaurant.objects.filter(owner=user).values_list('pk', flat=True)
+        ]
+    return channels
+
+
+def issue_stream_ticket(user, role):
+    """Signed ticket for one event stream connection, valid for SSE_TICKET_TTL seconds.
+
+    EventSource cannot send headers, so this goes in the query string in place
+    of the access token, and is worthless soon after it lands in a log.
+    """
+    return signing.dumps({'user': user.pk, 'role': role, 'staff': user.is_staff}, salt=STREAM_TICKET_SALT)
+
+
+def stream_ticket_channels(ticket):
+    """Channels a ticket grants, or None if it is invalid or expired"""
+    from django.contrib.auth.models import User
+
+    try:
+        claims = signing.loads(ticket, salt=STREAM_TICKET_SALT, max_age=settings.SSE_TICKET_TTL)
+    except signing.BadSignature:
+        return None
+    return channels_for(User(pk=claims['user'], is_staff=claims['staff']), claims['role'])
+
+
+async def sse_stream(channels, expires_at):
+    """Server-Sent Events for ``channels`` until ``expires_at`` (epoch seconds); the client then reconnects"""
+    heartbeat = getattr(settings, 'SSE_HEARTBEAT', 15)
+    subscription = get_broker().subscribe(channels)
+    try:
+        yield f'retry: {getattr(settings, "SSE_RETRY_MS", 3000)}\n\n'
+        while True:
+            remaining = expires_at - time.time()
+            if remaining <= 0:
+                return
+            message = await subscription.get(timeout=min(heartbeat, remaining))
+            if message is None:
+                # Keeps proxies from closing an idle connection.
+                yield ': keep-alive\n\n'
+            else:
+                yield f"event: {message['event']}\ndata: {json.dumps(message['data'])}\n\n"
+    finally:
+        subscription.close()
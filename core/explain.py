@@ -0,0 +1,23 @@
+import re
+
+from django.db import connections
+
+# A plan line that reads a whole table instead of searching an index.
+SEQUENTIAL_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (\w+)(?!.*\bUSING\b)'),
+}
+
+
+def sequential_scans(queryset):
+    """Tables the database plans to read with a sequential scan for this queryset"""
+    vendor = connections[queryset.db].vendor
+    pattern = SEQUENTIAL_SCAN_PATTERNS.get(vendor)
+    if pattern is None:
+        return []
+    tables = []
+    for line in queryset.explain().splitlines():
+        match = pattern.search(line)
+        if match and match.group(1) != 'CONSTANT':
+            tables.append(match.group(1))
+    return tables
@@ -0,0 +1,95 @@
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+from .models import Booking
+
+# Bookings fetched per keyset batch; memory stays bounded by this no matter
+# how many rows the export contains.
+EXPORT_CHUNK_SIZE = 2000
+
+# (column, values() lookup); one row per booking item.
+EXPORT_COLUMNS = (
+    ('booking_id', 'id'),
+    ('created_at', 'created_at'),
+    ('status', 'status'),
+    ('restaurant_id', 'restaurant_id'),
+    ('restaurant', 'restaurant__name'),
+    ('customer', 'customer__username'),
+    ('total_price', 'total_price'),
+    ('notes', 'notes'),
+    ('item_id', 'items__id'),
+    ('visinia_id', 'items__visinia_id'),
+    ('visinia', 'items__visinia__name'),
+    ('quantity', 'items__quantity'),
+    ('price', 'items__price'),
+)
+
+
+class _StreamRenderer(BaseRenderer):
+    """Lets DRF negotiate export formats; the action streams its own body"""
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only error responses reach the renderer.
+        return json.dumps(data).encode(self.charset)
+
+
+class CSVRenderer(_StreamRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONRenderer(_StreamRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+def iter_booking_rows(bookings, chunk_size=EXPORT_CHUNK_SIZE):
+    """Flat export rows for a booking queryset, newest booking first.
+
+    Walks the primary key in keyset batches instead of holding a cursor
+    open, which also works behind a transaction-mode connection pooler.
+    """
+    lookups = [lookup for _, lookup in EXPORT_COLUMNS]
+    last_id = None
+    while True:
+        batch = bookings.order_by('-id')
+        if last_id is not None:
+            batch = batch.filter(id__lt=last_id)
+        ids = list(batch.values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield from Booking.objects.filter(id__in=ids).order_by('-id', 'items__id').values_list(*lookups)
+        last_id = ids[-1]
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([column for column, _ in EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow([_cell(value) for value in row])
+
+
+def stream_ndjson(rows):
+    columns = [column for column, _ in EXPORT_COLUMNS]
+    for row in rows:
+        record = {
+            column: value if value is None or isinstance(value, (int, str)) else _cell(value)
+            for column, value in zip(columns, row)
+        }
+        yield json.dumps(record) + '\n'
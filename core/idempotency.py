@@ -0,0 +1,148 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+from .tasks import task
+
+MAX_KEY_LENGTH = 255
+WAIT_POLL_INTERVAL = 0.1
+SWEEP_BATCH_SIZE = 1000
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def request_fingerprint(request):
+    """Hash of what the request asks for, so a key cannot be reused for a different one"""
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _claim(user, key, fingerprint):
+    """('claimed' | 'done' | 'mismatch' | 'busy', record)"""
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            return 'claimed', IdempotencyKey.objects.create(
+                user=user, key=key, fingerprint=fingerprint, locked_at=now
+            )
+    except IntegrityError:
+        record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is None:
+        # Released by a request that failed between our INSERT and SELECT.
+        return 'busy', None
+
+    if record.created_at < now - timedelta(seconds=_setting('IDEMPOTENCY_KEY_TTL', 86400)):
+        # Expired but not swept yet; the key starts over with this request.
+        IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).delete()
+        return _claim(user, key, fingerprint)
+    if record.fingerprint != fingerprint:
+        return 'mismatch', record
+    if record.response_status is not None:
+        return 'done', record
+
+    stale = now - timedelta(seconds=_setting('IDEMPOTENCY_LOCK_TIMEOUT', 30))
+    if record.locked_at < stale:
+        # The request holding the key died without finishing; take it over.
+        taken = IdempotencyKey.objects.filter(
+            pk=record.pk, response_status__isnull=True, locked_at=record.locked_at
+        ).update(locked_at=now)
+        if taken:
+            return 'claimed', record
+    return 'busy', record
+
+
+def run_idempotent(request, handler):
+    """Run ``handler`` once per (user, Idempotency-Key) and replay its response to retries.
+
+    ``handler`` returns a Response. Only successful responses are stored; when
+    it fails the key is released so the client can retry. Concurrent
+    duplicates poll for the stored response for up to IDEMPOTENCY_WAIT seconds.
+    Must be called outside a transaction so other requests see the claim.
+    """
+    key = request.headers.get('Idempotency-Key')
+    if key is None:
+        return handler()
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return Response(
+            {"detail": f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    fingerprint = request_fingerprint(request)
+    deadline = time.monotonic() + _setting('IDEMPOTENCY_WAIT', 5)
+    while True:
+        state, record = _claim(request.user, key, fingerprint)
+        if state != 'busy':
+            break
+        if time.monotonic() >= deadline:
+            response = Response(
+                {"detail": "A request with this Idempotency-Key is still being processed."},
+                status=status.HTTP_409_CONFLICT
+            )
+            response['Retry-After'] = '1'
+            return response
+        time.sleep(WAIT_POLL_INTERVAL)
+
+    if state == 'mismatch':
+        return Response(
+            {"detail": "This Idempotency-Key was already used for a different request."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    if state == 'done':
+        return _replay(record)
+
+    try:
+        with transaction.atomic():
+            response = handler()
+            if status.is_success(response.status_code):
+                # Saved with the work itself: a stored response always has its booking.
+                IdempotencyKey.objects.filter(pk=record.pk).update(
+                    response_status=response.status_code, response_body=response.data
+                )
+    except BaseException:
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+        raise
+    if not status.is_success(response.status_code):
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+    transaction.on_commit(schedule_sweep)
+    return response
+
+
+@task(max_attempts=3)
+def sweep_expired_keys(batch_size=SWEEP_BATCH_SIZE):
+    """Delete keys older than IDEMPOTENCY_KEY_TTL in batches; returns the number removed"""
+    cutoff = timezone.now() - timedelta(seconds=_setting('IDEMPOTENCY_KEY_TTL', 86400))
+    removed = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(created_at__lt=cutoff).values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return removed
+        removed += IdempotencyKey.objects.filter(pk__in=ids).delete()[0]
+
+
+def schedule_sweep():
+    """Queue a sweep if no process has queued one within IDEMPOTENCY_SWEEP_INTERVAL"""
+    interval = _setting('IDEMPOTENCY_SWEEP_INTERVAL', 3600)
+    if interval and caches['default'].add('idempotency:sweep', 1, timeout=interval):
+        sweep_expired_keys.enqueue()
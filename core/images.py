@@ -0,0 +1,136 @@
+import hashlib
+import io
+import os
+import re
+import threading
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .tasks import task
+
+# Widths the image endpoints accept as ?w=; anything else would let a
+# client fill the disk with arbitrary sizes.
+VARIANT_WIDTHS = (160, 480, 960)
+
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Derivatives are named <original>.w<width>.<content hash>.<ext>, so a
+# changed original always produces a new URL and old ones can be cached forever.
+VARIANT_NAME_RE = re.compile(r'\.w\d+\.[0-9a-f]{12}\.(webp|jpg)$')
+
+# name -> (size, modified time, digest); avoids re-hashing multi-megabyte
+# originals on every request.
+_digest_cache = {}
+_digest_lock = threading.Lock()
+
+
+def is_variant_name(name):
+    return bool(VARIANT_NAME_RE.search(name))
+
+
+def file_stamp(storage, name):
+    try:
+        return storage.size(name), storage.get_modified_time(name).timestamp()
+    except (NotImplementedError, OSError):
+        return None
+
+
+def content_digest(storage, name):
+    """Short content hash of a stored file"""
+    stamp = file_stamp(storage, name)
+    with _digest_lock:
+        cached = _digest_cache.get(name)
+    if stamp is not None and cached and cached[0] == stamp:
+        return cached[1]
+
+    sha = hashlib.sha256()
+    with storage.open(name, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(64 * 1024), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()[:12]
+    if stamp is not None:
+        with _digest_lock:
+            _digest_cache[name] = (stamp, digest)
+    return digest
+
+
+def variant_name(name, width, fmt, digest):
+    base, _ = os.path.splitext(name)
+    return f'{base}.w{width}.{digest}.{VARIANT_FORMATS[fmt][1]}'
+
+
+def _render_variant(storage, name, width, fmt):
+    pil_format, _, save_options = VARIANT_FORMATS[fmt]
+    with storage.open(name, 'rb') as fh:
+        image = Image.open(fh)
+        image = ImageOps.exif_transpose(image)
+        # Bound only the width; thumbnail() keeps the aspect ratio and never upscales.
+        image.thumbnail((width, image.height), Image.Resampling.LANCZOS)
+
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        if fmt == 'jpeg' or not has_alpha:
+            if has_alpha:
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            else:
+                image = image.convert('RGB')
+        else:
+            image = image.convert('RGBA')
+
+        buffer = io.BytesIO()
+        image.save(buffer, pil_format, **save_options)
+    return buffer.getvalue()
+
+
+def get_variant(field_file, width, fmt='webp'):
+    """Storage name of a resized derivative of an image, generating it on first use"""
+    if width not in VARIANT_WIDTHS:
+        raise ValueError(f'Unsupported variant width: {width}')
+    if fmt not in VARIANT_FORMATS:
+        raise ValueError(f'Unsupported variant format: {fmt}')
+
+    storage = field_file.storage
+    name = field_file.name
+    target = variant_name(name, width, fmt, content_digest(storage, name))
+    if not storage.exists(target):
+        saved = storage.save(target, ContentFile(_render_variant(storage, name, width, fmt)))
+        if saved != target:
+            # Another worker rendered the same variant first; keep theirs.
+            storage.delete(saved)
+    return target
+
+
+def preferred_format(request):
+    """Pick WebP when the client advertises it, JPEG otherwise"""
+    requested = request.query_params.get('format')
+    if requested in VARIANT_FORMATS:
+        return requested
+    if 'image/webp' in request.headers.get('Accept', ''):
+        return 'webp'
+    return 'jpeg'
+
+
+class StoredImage:
+    """Minimal stand-in for a FieldFile pointing at a name in default storage"""
+    storage = default_storage
+
+    def __init__(self, name):
+        self.name = name
+
+
+@task(max_attempts=3)
+def build_variants(name):
+    """Render every variant of an uploaded image before its first request asks for one"""
+    field_file = StoredImage(name)
+    if not field_file.storage.exists(name):
+        return
+    for width in VARIANT_WIDTHS:
+        for fmt in VARIANT_FORMATS:
+            get_variant(field_file, width, fmt)
@@ -0,0 +1,85 @@
+import json
+import platform
+from datetime import datetime, timezone as dt_timezone
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from core.benchmark import ScenarioRunner, compare_reports, generate_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the booking and menu APIs on a throwaway test database: '
+        'browse menu -> place booking -> owner confirm'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=20)
+        parser.add_argument('--items', type=int, default=30, help='Visiinias per restaurant')
+        parser.add_argument('--bookings', type=int, default=5000, help='Pre-existing bookings')
+        parser.add_argument('--customers', type=int, default=200)
+        parser.add_argument('--iterations', type=int, default=200, help='Scenario runs to measure')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--compare', help='Baseline JSON report to compare p95 latency against')
+        parser.add_argument(
+            '--max-regression', type=float,
+            help='With --compare, fail if any endpoint p95 grew by more than this percent',
+        )
+
+    # One client sends every request; rate limits would measure themselves.
+    @override_settings(THROTTLE_ENABLED=False)
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            dataset = generate_dataset(
+                restaurants=options['restaurants'],
+                items=options['items'],
+                bookings=options['bookings'],
+                customers=options['customers'],
+                seed=options['seed'],
+            )
+            runner = ScenarioRunner(dataset, seed=options['seed'])
+            wall_time = runner.run(options['iterations'])
+            report = runner.report(wall_time)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report['meta'] = {
+            'timestamp': datetime.now(dt_timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'parameters': {
+                key: options[key]
+                for key in ('restaurants', 'items', 'bookings', 'customers', 'iterations', 'seed')
+            },
+        }
+
+        self.stdout.write(f"{'endpoint':<24}{'req':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}{'queries':>9}")
+        for name, stats in report['endpoints'].items():
+            self.stdout.write(
+                f"{name:<24}{stats['requests']:>6}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+                f"{stats['p99_ms']:>10}{stats['requests_per_sec']:>9}{stats['queries_per_request']:>9}"
+            )
+        self.stdout.write(f"total: {report['total']['requests']} requests, {report['total']['requests_per_sec']} req/s")
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as fh:
+                changes = compare_reports(json.load(fh), report)
+            for name, change in changes.items():
+                self.stdout.write(f'{name}: p95 {change:+.1f}%')
+            limit = options['max_regression']
+            regressed = {name: change for name, change in changes.items() if limit is not None and change > limit}
+            if regressed:
+                raise CommandError(f'p95 regression above {limit}%: {regressed}')
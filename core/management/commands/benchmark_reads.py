@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from core.benchmark import ConcurrentReadRunner, generate_dataset
+from core.serializers import RoleTokenObtainPairSerializer
+from kisinia_project.asgi import KisiniaASGIHandler
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the sync DRF views with the async read views under concurrent connections '
+        'to one ASGI worker: restaurant list/detail and by_restaurant, on a throwaway test database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=20)
+        parser.add_argument('--items', type=int, default=30, help='Visiinias per restaurant')
+        parser.add_argument(
+            '--concurrency', type=int, action='append',
+            help='Concurrent connections (repeatable; default 1, 16 and 64)',
+        )
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per run')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Write the JSON report to this file')
+
+    # One client sends every request; rate limits would measure themselves.
+    @override_settings(THROTTLE_ENABLED=False)
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            report = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f"{'views':<8}{'conns':>6}{'req':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for row in report:
+            self.stdout.write(
+                f"{row['views']:<8}{row['concurrency']:>6}{row['requests']:>7}{row['errors']:>8}"
+                f"{row['requests_per_sec']:>9}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+            )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+    def run(self, options):
+        dataset = generate_dataset(
+            restaurants=options['restaurants'], items=options['items'], bookings=0, customers=1,
+            seed=options['seed'],
+        )
+        token = RoleTokenObtainPairSerializer.get_token(dataset['customers'][0]).access_token
+        paths = []
+        for venue in dataset['restaurants']:
+            paths += [
+                '/api/restaurants/',
+                f'/api/restaurants/{venue.id}/',
+                f'/api/visiinias/by_restaurant/?restaurant_id={venue.id}',
+            ]
+        applications = {
+            # KisiniaASGIHandler only swaps the URLconf, so the views are the only difference.
+            'sync': ASGIHandler(),
+            'async': KisiniaASGIHandler(),
+        }
+
+        report = []
+        for concurrency in options['concurrency'] or [1, 16, 64]:
+            for name, application in applications.items():
+                runner = ConcurrentReadRunner(
+                    application, paths, headers=[(b'authorization', f'Bearer {token}'.encode())]
+                )
+                result = asyncio.run(runner.run(concurrency, options['requests']))
+                report.append({'views': name, **result})
+        return report
@@ -0,0 +1,42 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from PIL import UnidentifiedImageError
+
+from core.images import VARIANT_FORMATS, VARIANT_WIDTHS, StoredImage, get_variant
+from core.models import Restaurant, Visinia
+from core.serializers import AUTO_RESTAURANT_LOGOS, AUTO_VISINIA_IMAGES
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/JPEG variants for bundled and uploaded images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--uploads',
+            action='store_true',
+            help='Also process every Restaurant.logo and Visinia.image stored in the database',
+        )
+
+    def handle(self, *args, **options):
+        names = set(AUTO_RESTAURANT_LOGOS) | set(AUTO_VISINIA_IMAGES)
+        if options['uploads']:
+            names.update(Restaurant.objects.exclude(logo='').exclude(logo=None).values_list('logo', flat=True))
+            names.update(Visinia.objects.exclude(image='').exclude(image=None).values_list('image', flat=True))
+
+        created = 0
+        for name in sorted(names):
+            if not default_storage.exists(name):
+                self.stdout.write(self.style.WARNING(f'Missing original: {name}'))
+                continue
+            field_file = StoredImage(name)
+            for width in VARIANT_WIDTHS:
+                for fmt in VARIANT_FORMATS:
+                    try:
+                        get_variant(field_file, width, fmt)
+                    except (OSError, UnidentifiedImageError) as exc:
+                        self.stdout.write(self.style.ERROR(f'Failed {name} w{width} {fmt}: {exc}'))
+                        continue
+                    created += 1
+            self.stdout.write(f'Processed {name}')
+
+        self.stdout.write(self.style.SUCCESS(f'\n=== {created} variants ready ==='))
@@ -0,0 +1,68 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from core.bulk_fixtures import (
+    BATCH_SIZE, IMPORT_ORDER, FixtureLoader, iter_export_objects, iter_fixture_objects, open_fixture, write_fixture,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Fast seeding: stream a dumpdata-style JSON fixture into an empty database with bulk inserts '
+        '(COPY on PostgreSQL), or export the core tables in the same format'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['import', 'export'])
+        parser.add_argument('path', help='Fixture file; "-" for stdout on export')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--no-copy', action='store_true', help='Use INSERT even on PostgreSQL')
+        parser.add_argument(
+            '--skip-stats', action='store_true',
+            help='Do not rebuild daily restaurant stats for the imported bookings',
+        )
+        parser.add_argument(
+            '--model', action='append', choices=IMPORT_ORDER,
+            help='Export only these models (repeatable)',
+        )
+
+    def handle(self, *args, **options):
+        if options['action'] == 'import':
+            self.import_fixture(options)
+        else:
+            self.export_fixture(options)
+
+    def import_fixture(self, options):
+        started = time.perf_counter()
+        loader = FixtureLoader(options['batch_size'], use_copy=False if options['no_copy'] else None)
+        try:
+            with open_fixture(options['path']) as stream, transaction.atomic():
+                counts = loader.load(iter_fixture_objects(stream))
+                profiles = loader.finish(rebuild_stats=not options['skip_stats'])
+        except FileNotFoundError:
+            raise CommandError(f"Fixture not found: {options['path']}")
+        except (ValueError, IntegrityError) as exc:
+            raise CommandError(f'Import failed, nothing was written: {exc}')
+
+        for label in IMPORT_ORDER:
+            self.stdout.write(f'{label}: {counts[label]}')
+        if profiles:
+            self.stdout.write(f'core.userprofile: {profiles} default profiles added')
+        for label, skipped in sorted(loader.skipped.items()):
+            self.stdout.write(self.style.WARNING(f'{label}: {skipped} skipped'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {sum(counts.values())} objects in {time.perf_counter() - started:.2f}s'
+            f"{' using COPY' if loader.use_copy else ''}"
+        ))
+
+    def export_fixture(self, options):
+        objects = iter_export_objects(options['model'] or IMPORT_ORDER, options['batch_size'])
+        if options['path'] == '-':
+            write_fixture(sys.stdout, objects)
+            return
+        with open(options['path'], 'w', encoding='utf-8') as stream:
+            count = write_fixture(stream, objects)
+        self.stdout.write(self.style.SUCCESS(f"Exported {count} objects to {options['path']}"))
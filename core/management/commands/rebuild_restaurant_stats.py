@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.stats import rebuild_restaurant_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute RestaurantStats/RestaurantItemStats daily buckets from existing bookings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurant', type=int, action='append', help='Limit to these restaurant IDs')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            buckets = rebuild_restaurant_stats(options['restaurant'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {buckets} daily buckets'))
@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.tasks import Worker
+
+
+def env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def work(threads, poll_interval):
+    """Run ``threads`` workers in this process until SIGTERM or SIGINT, then let them finish their task"""
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: stop.set())
+    workers = [
+        threading.Thread(target=Worker().run_forever, args=(stop, poll_interval), name=f'task-worker-{index}')
+        for index in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    # A timed wait keeps the main thread able to run signal handlers.
+    while not stop.wait(1):
+        pass
+    for worker in workers:
+        worker.join()
+
+
+class Command(BaseCommand):
+    help = 'Run background tasks from the database queue until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=env_int('TASK_PROCESSES', 1))
+        parser.add_argument('--threads', type=int, default=env_int('TASK_THREADS', 2), help='Worker threads per process')
+        parser.add_argument('--poll-interval', type=float, help='Seconds between polls of an empty queue')
+        parser.add_argument('--burst', action='store_true', help='Run the tasks that are due now, then exit')
+
+    def handle(self, *args, **options):
+        if options['burst']:
+            count = Worker().run_pending()
+            self.stdout.write(self.style.SUCCESS(f'Ran {count} tasks'))
+            return
+
+        processes, threads = max(options['processes'], 1), max(options['threads'], 1)
+        self.stdout.write(f'Running tasks in {processes} processes x {threads} threads')
+        if processes == 1:
+            work(threads, options['poll_interval'])
+            return
+
+        # Sockets opened here must never be shared with the children.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        work_args = (threads, options['poll_interval'])
+        children = [
+            context.Process(target=work, args=work_args, name=f'task-process-{index}') for index in range(processes)
+        ]
+        stopping = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: stopping.set())
+        for child in children:
+            child.start()
+        while not stopping.wait(1):
+            for index, child in enumerate(children):
+                if not child.is_alive():
+                    self.stderr.write(f'{child.name} exited with {child.exitcode}; restarting')
+                    children[index] = context.Process(target=work, args=work_args, name=child.name)
+                    children[index].start()
+        for child in children:
+            child.terminate()
+        for child in children:
+            child.join()
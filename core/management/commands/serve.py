@@ -0,0 +1,176 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import get_resolver
+
+try:
+    from gunicorn.app.base import BaseApplication
+    HAS_GUNICORN = True
+except ModuleNotFoundError:
+    BaseApplication = object
+    HAS_GUNICORN = False
+
+
+def default_workers():
+    return min(multiprocessing.cpu_count() * 2 + 1, 8)
+
+
+def env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def warm_up():
+    """Load URL patterns, views and serializers before any worker forks"""
+    get_resolver().url_patterns
+    import core.views  # noqa: F401
+
+
+def open_connections(*args, **kwargs):
+    """Open every configured DB connection of the calling thread"""
+    for connection in connections.all():
+        connection.ensure_connection()
+
+
+def open_request_connections(worker):
+    """Open the DB connections of the threads that will serve requests, before the worker takes traffic.
+
+    Django connections are per thread, so for the gthread worker each pool
+    thread opens its own; the sync worker serves requests on its main thread.
+    """
+    pool = getattr(worker, 'tpool', None)
+    if pool is None:
+        open_connections()
+        return
+    threads = worker.cfg.threads
+    # Every job waits for the others, so each runs on a thread of its own.
+    barrier = threading.Barrier(threads)
+
+    def warm():
+        barrier.wait(timeout=30)
+        open_connections()
+
+    for future in [pool.submit(warm) for _ in range(threads)]:
+        future.result()
+
+
+def close_connections_per_request(worker):
+    """Make every connection close at the end of its request, whatever DB_CONN_MAX_AGE says.
+
+    Under uvicorn, sync views and the ORM run on executor threads created on
+    demand; a connection one of them keeps open is never reused or closed.
+    """
+    for alias in connections:
+        connections.settings[alias]['CONN_MAX_AGE'] = 0
+
+
+def close_connections(*args, **kwargs):
+    # Sockets opened in the master must never be shared with forked workers.
+    connections.close_all()
+
+
+class TaskWorkers:
+    """``run_workers`` as a child of the gunicorn master, so one box needs one start command"""
+
+    def __init__(self, processes):
+        self.processes = processes
+        self.process = None
+
+    def start(self, server):
+        if self.processes:
+            self.process = subprocess.Popen(
+                [sys.executable, sys.argv[0], 'run_workers', '--processes', str(self.processes)]
+            )
+
+    def stop(self, server):
+        if self.process is not None:
+            # SIGTERM lets each worker finish the task it is running.
+            self.process.terminate()
+            self.process.wait()
+
+
+class DjangoApplication(BaseApplication):
+    def __init__(self, app_uri, options):
+        self.app_uri = app_uri
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        module_name, _, attribute = self.app_uri.partition(':')
+        module = __import__(module_name, fromlist=[attribute])
+        return getattr(module, attribute)
+
+
+class Command(BaseCommand):
+    help = 'Run the API under a pre-forking multi-worker server (production entry point)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default=os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}"))
+        parser.add_argument('--workers', type=int, default=env_int('WEB_CONCURRENCY', default_workers()))
+        parser.add_argument('--threads', type=int, default=env_int('WEB_THREADS', 4))
+        parser.add_argument('--timeout', type=int, default=env_int('WEB_TIMEOUT', 30))
+        parser.add_argument('--graceful-timeout', type=int, default=env_int('WEB_GRACEFUL_TIMEOUT', 30))
+        parser.add_argument('--keepalive', type=int, default=env_int('WEB_KEEPALIVE', 5))
+        parser.add_argument(
+            '--max-requests', type=int, default=env_int('WEB_MAX_REQUESTS', 2000),
+            help='Recycle a worker after this many requests (0 disables)',
+        )
+        parser.add_argument(
+            '--task-workers', type=int, default=env_int('TASK_WORKERS', 1),
+            help='Background task processes to run next to the web workers (0: run them elsewhere)',
+        )
+        parser.add_argument(
+            '--asgi', action='store_true', default=os.getenv('WEB_ASGI', '').lower() == 'true',
+            help='Serve kisinia_project.asgi with uvicorn workers instead of WSGI',
+        )
+
+    def handle(self, *args, **options):
+        if not HAS_GUNICORN:
+            raise CommandError('gunicorn is not installed; run "pip install -r requirement.txt".')
+
+        if options['asgi']:
+            app_uri = 'kisinia_project.asgi:application'
+            worker_class = 'uvicorn_worker.UvicornWorker'
+        else:
+            app_uri = 'kisinia_project.wsgi:application'
+            worker_class = 'gthread' if options['threads'] > 1 else 'sync'
+
+        warm_up()
+        close_connections()
+
+        max_requests = options['max_requests']
+        task_workers = TaskWorkers(options['task_workers'])
+        gunicorn_options = {
+            'bind': options['bind'],
+            'workers': options['workers'],
+            'threads': options['threads'],
+            'worker_class': worker_class,
+            'timeout': options['timeout'],
+            'graceful_timeout': options['graceful_timeout'],
+            'keepalive': options['keepalive'],
+            'max_requests': max_requests,
+            'max_requests_jitter': max_requests // 10 if max_requests else 0,
+            'preload_app': True,
+            'accesslog': '-',
+            'errorlog': '-',
+            'pre_fork': lambda server, worker: close_connections(),
+            'post_worker_init': close_connections_per_request if options['asgi'] else open_request_connections,
+            'worker_exit': lambda server, worker: close_connections(),
+            'when_ready': task_workers.start,
+            'on_exit': task_workers.stop,
+        }
+        self.stdout.write(
+            f"Serving {app_uri} on {options['bind']} with {options['workers']} workers "
+            f"x {options['threads']} threads ({worker_class})"
+        )
+        DjangoApplication(app_uri, gunicorn_options).run()
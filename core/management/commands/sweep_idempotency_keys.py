@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.idempotency import sweep_expired_keys
+
+
+class Command(BaseCommand):
+    help = 'Delete stored Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL'
+
+    def handle(self, *args, **options):
+        removed = sweep_expired_keys()
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} expired idempotency keys'))
@@ -0,0 +1,216 @@
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_etags, parse_http_date_safe
+
+from .images import file_stamp, is_variant_name
+
+# Derivative names embed a content hash, so their URLs never change meaning.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE_CONTROL = 'public, max-age=3600'
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+MAGIC_NUMBERS = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# name -> (stamp, content type)
+_content_types = {}
+_content_types_lock = threading.Lock()
+
+
+def _sniff(head):
+    for magic, content_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return content_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:12] in (b'ftypavif', b'ftypavis'):
+        return 'image/avif'
+    return None
+
+
+def content_type_for(storage, name, stamp=None):
+    """Real content type of a stored file, sniffed from its first bytes and cached"""
+    with _content_types_lock:
+        cached = _content_types.get(name)
+    if cached and stamp is not None and cached[0] == stamp:
+        return cached[1]
+
+    with storage.open(name, 'rb') as fh:
+        head = fh.read(32)
+    content_type = _sniff(head) or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    if stamp is not None:
+        with _content_types_lock:
+            _content_types[name] = (stamp, content_type)
+    return content_type
+
+
+def _parse_range(header, size):
+    """(start, end) inclusive for a single byte range, None to ignore, or False if unsatisfiable"""
+    match = RANGE_RE.match(header.strip())
+    if not match or size == 0:
+        return None
+    start, end = match.groups()
+    if start == '' and end == '':
+        return None
+    if start == '':
+        # Suffix range: the last N bytes.
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return etag in parse_etags(if_range)
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _iter_range(fh, start, length):
+    try:
+        fh.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = fh.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        fh.close()
+
+
+async def _aiter_range(storage, name, start, length):
+    """_iter_range for ASGI: the file is opened on first iteration and all I/O
+    runs on the executor, never on the event loop"""
+    fh = await sync_to_async(storage.open, thread_sensitive=False)(name, 'rb')
+    read = sync_to_async(fh.read, thread_sensitive=False)
+    try:
+        await sync_to_async(fh.seek, thread_sensitive=False)(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await sync_to_async(fh.close, thread_sensitive=False)()
+
+
+def _offload(storage, name):
+    """Response handing the transfer to the front-end server, if configured"""
+    mode = getattr(settings, 'MEDIA_OFFLOAD', '')
+    if mode == 'x-accel':
+        response = HttpResponse()
+        # nginx decodes this URI, so spaces, '%', '?' and '#' in a name must be escaped.
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + quote(name)
+        return response
+    if mode == 'x-sendfile':
+        response = HttpResponse()
+        response['X-Sendfile'] = storage.path(name)
+        return response
+    return None
+
+
+def file_response(request, storage, name, cache_control=DEFAULT_CACHE_CONTROL, asynchronous=False):
+    """Serve a stored file with validators, Range support and optional server offload.
+
+    ``asynchronous`` streams the body with an async iterator for ASGI views.
+    """
+    stamp = file_stamp(storage, name)
+    size, modified = stamp if stamp else (storage.size(name), None)
+    last_modified = int(modified) if modified is not None else None
+    etag = '"%x-%x"' % (int((modified or 0) * 1000), size)
+    content_type = content_type_for(storage, name, stamp)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _offload(storage, name)
+    if response is None:
+        byte_range = None
+        if request.headers.get('Range') and _if_range_matches(request, etag, last_modified):
+            byte_range = _parse_range(request.headers['Range'], size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        elif byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            if asynchronous:
+                body = _aiter_range(storage, name, start, length)
+            else:
+                body = _iter_range(storage.open(name, 'rb'), start, length)
+            response = StreamingHttpResponse(body, status=206)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(length)
+        elif asynchronous:
+            response = StreamingHttpResponse(_aiter_range(storage, name, 0, size))
+            response['Content-Length'] = str(size)
+            response['Content-Disposition'] = content_disposition_header(False, posixpath.basename(name))
+        else:
+            response = FileResponse(storage.open(name, 'rb'))
+            response['Content-Length'] = str(size)
+
+    if response.status_code != 304:
+        response['Content-Type'] = content_type
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    return response
+
+
+async def afile_response(request, storage, name, cache_control=DEFAULT_CACHE_CONTROL):
+    """file_response for async views; the stat and sniff calls run on the executor"""
+    return await sync_to_async(file_response, thread_sensitive=False)(
+        request, storage, name, cache_control, asynchronous=True
+    )
+
+
+def serve_media(request, path):
+    """Serve MEDIA_ROOT files, marking hashed image variants as immutable"""
+    name = posixpath.normpath(path).lstrip('/')
+    storage = default_storage
+    try:
+        exists = bool(name) and not name.startswith('..') and storage.exists(name)
+    except SuspiciousFileOperation:
+        exists = False
+    if not exists:
+        raise Http404("File not found")
+    try:
+        if os.path.isdir(storage.path(name)):
+            raise Http404("File not found")
+    except NotImplementedError:
+        pass
+
+    cache_control = IMMUTABLE_CACHE_CONTROL if is_variant_name(name) else DEFAULT_CACHE_CONTROL
+    return file_response(request, storage, name, cache_control)
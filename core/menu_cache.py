@@ -0,0 +1,91 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Serialized menus are stored under a per-restaurant version number so a
+# single increment invalidates every cached copy, in every process that
+# shares the cache backend.
+MENU_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def menu_cache():
+    return caches[getattr(settings, 'MENU_CACHE_ALIAS', 'default')]
+
+
+def _version_key(restaurant_id):
+    return f'menu:version:{restaurant_id}'
+
+
+def _menu_key(restaurant_id, version):
+    return f'menu:{restaurant_id}:v{version}'
+
+
+def _initial_version():
+    # Start from a timestamp so a cache that lost its version keys never
+    # hands out a version number that an older menu was stored under.
+    return int(time.time() * 1000)
+
+
+def get_menu_version(restaurant_id):
+    cache = menu_cache()
+    key = _version_key(restaurant_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_menu_version(restaurant_id):
+    """Invalidate the cached menu of a restaurant"""
+    cache = menu_cache()
+    key = _version_key(restaurant_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), timeout=None)
+
+
+def get_cached_menu(restaurant_id, render):
+    """Return (etag, body) for a restaurant menu.
+
+    ``render`` is called on a miss and must return the serialized JSON bytes.
+    """
+    cache = menu_cache()
+    version = get_menu_version(restaurant_id)
+    key = _menu_key(restaurant_id, version)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    body = render()
+    etag = '"%s"' % hashlib.md5(body, usedforsecurity=False).hexdigest()
+    cache.set(key, (etag, body), timeout=MENU_CACHE_TIMEOUT)
+    return etag, body
+
+
+async def aget_menu_version(restaurant_id):
+    cache = menu_cache()
+    key = _version_key(restaurant_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _initial_version(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+async def aget_cached_menu(restaurant_id, render):
+    """get_cached_menu for async views; ``render`` is a coroutine function"""
+    cache = menu_cache()
+    version = await aget_menu_version(restaurant_id)
+    key = _menu_key(restaurant_id, version)
+    cached = await cache.aget(key)
+    if cached is not None:
+        return cached
+
+    body = await render()
+    etag = '"%s"' % hashlib.md5(body, usedforsecurity=False).hexdigest()
+    await cache.aset(key, (etag, body), timeout=MENU_CACHE_TIMEOUT)
+    return etag, body
@@ -0,0 +1,191 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+UNRESOLVED = '<unresolved>'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class QueryLog:
+    """Queries run on behalf of one request, in whichever thread runs them"""
+
+    def __init__(self, keep_sql=False):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+        self.sql = [] if keep_sql else None
+
+    @property
+    def duplicates(self):
+        """Executions of a statement beyond its first: the N+1 signature"""
+        return self.count - len(self.statements)
+
+    def record(self, sql, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[sql] += 1
+        if self.sql is not None:
+            self.sql.append((sql, seconds))
+
+
+def _timed_execute(execute, sql, params, many, context):
+    log = _current.get()
+    if log is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        log.record(sql, time.perf_counter() - start)
+
+
+def install_query_timer(connection):
+    """Time every query on ``connection``; a no-op outside a measured request"""
+    if _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_execute)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        counts = self.series.get(labels)
+        if counts is None:
+            # One count per bucket, then +Inf, then the running sum.
+            counts = self.series[labels] = [0] * (len(self.buckets) + 1) + [0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def render(self, label_names):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, counts in sorted(self.series.items()):
+            base = _format_labels(label_names, labels)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                yield f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}'
+            yield f'{self.name}_sum{{{base}}} {_number(counts[-1])}'
+            yield f'{self.name}_count{{{base}}} {cumulative}'
+
+
+class CounterMetric:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.series = Counter()
+
+    def inc(self, labels, value=1):
+        self.series[labels] += value
+
+    def render(self, label_names):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in sorted(self.series.items()):
+            yield f'{self.name}{{{_format_labels(label_names, labels)}}} {_number(value)}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _number(value):
+    return repr(round(value, 6)) if isinstance(value, float) else str(value)
+
+
+class RequestMetrics:
+    """In-process aggregates per (endpoint, method); each worker process keeps its own"""
+
+    LABELS = ('endpoint', 'method')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = CounterMetric('kisinia_requests_total', 'Requests by endpoint, method and status.')
+            self.duration = Histogram('kisinia_request_duration_seconds', 'Wall time until the response object is returned.', SECONDS_BUCKETS)
+            self.db_time = Histogram('kisinia_request_db_seconds', 'Time spent executing SQL per request.', SECONDS_BUCKETS)
+            self.queries = Histogram('kisinia_request_queries', 'SQL queries per request.', QUERY_BUCKETS)
+            self.duplicates = CounterMetric('kisinia_request_duplicate_queries_total', 'Repeated executions of an identical SQL statement within a request.')
+            self.size = Histogram('kisinia_response_bytes', 'Response body size; streaming responses are not counted.', BYTES_BUCKETS)
+
+    def observe(self, endpoint, method, status_code, seconds, log, size):
+        labels = (endpoint, method)
+        with self._lock:
+            self.requests.inc((endpoint, method, status_code))
+            self.duration.observe(labels, seconds)
+            self.db_time.observe(labels, log.seconds)
+            self.queries.observe(labels, log.count)
+            if log.duplicates:
+                self.duplicates.inc(labels, log.duplicates)
+            if size is not None:
+                self.size.observe(labels, size)
+
+    def render(self):
+        with self._lock:
+            lines = [*self.requests.render((*self.LABELS, 'status'))]
+            for metric in (self.duration, self.db_time, self.queries, self.duplicates, self.size):
+                lines.extend(metric.render(self.LABELS))
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
+
+
+def endpoint_name(request):
+    """URL name of the resolved view, e.g. booking-list or visinia-by-restaurant"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNRESOLVED
+    return match.view_name
+
+
+def start_request():
+    log = QueryLog(keep_sql=bool(_setting('METRICS_SLOW_REQUEST_MS', 0)))
+    return log, _current.set(log), time.perf_counter()
+
+
+def stop_request(token):
+    _current.reset(token)
+
+
+def finish_request(request, response, log, started):
+    seconds = time.perf_counter() - started
+    endpoint = endpoint_name(request)
+    size = None if response.streaming else len(response.content)
+    request_metrics.observe(endpoint, request.method, response.status_code, seconds, log, size)
+
+    slow_ms = _setting('METRICS_SLOW_REQUEST_MS', 0)
+    if slow_ms and seconds * 1000 >= slow_ms:
+        logger.warning(
+            'Slow request %s %s (%s) %d in %.0f ms: %d queries (%d duplicate) in %.0f ms\n%s',
+            request.method, request.get_full_path(), endpoint, response.status_code, seconds * 1000,
+            log.count, log.duplicates, log.seconds * 1000,
+            '\n'.join(f'  {duration * 1000:.1f} ms  {sql}' for sql, duration in log.sql),
+        )
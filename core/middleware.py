@@ -0,0 +1,85 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+
+from .metrics import finish_request, start_request, stop_request
+from .throttling import concurrency_limit, overloaded_response, queue_wait
+
+
+class RequestMetricsMiddleware:
+    """Record wall time, SQL time, query counts and response size per endpoint.
+
+    Runs natively in both sync and async chains, so async views are measured
+    without an extra thread hop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        log, token, started = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_request(token)
+        finish_request(request, response, log, started)
+        return response
+
+    async def __acall__(self, request):
+        log, token, started = start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_request(token)
+        finish_request(request, response, log, started)
+        return response
+
+
+class AdmissionControlMiddleware:
+    """Shed load with 503 before any work is done on a request.
+
+    A request is refused when MAX_INFLIGHT_REQUESTS are already in progress
+    in this process, or when it waited longer than MAX_QUEUE_WAIT_MS behind
+    the front-end proxy (X-Request-Start); its client has likely given up.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def admit(self, request):
+        max_wait = getattr(settings, 'MAX_QUEUE_WAIT_MS', 0)
+        if max_wait:
+            waited = queue_wait(request)
+            if waited is not None and waited * 1000 > max_wait:
+                return False
+        return concurrency_limit('inflight').acquire(getattr(settings, 'MAX_INFLIGHT_REQUESTS', 0))
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.admit(request):
+            return overloaded_response()
+        try:
+            return self.get_response(request)
+        finally:
+            concurrency_limit('inflight').release()
+
+    async def __acall__(self, request):
+        if not self.admit(request):
+            return overloaded_response()
+        try:
+            return await self.get_response(request)
+        finally:
+            concurrency_limit('inflight').release()
@@ -0,0 +1,35 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_visinia_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['customer', '-created_at'], name='booking_customer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['restaurant', 'status', '-created_at'], name='booking_restaurant_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['restaurant', '-created_at'], name='booking_restaurant_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at'], name='restaurant_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visinia',
+            index=models.Index(fields=['restaurant', 'is_available', '-created_at'], name='visinia_menu_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 6.0.1 on 2026-10-18 01:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_query_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestaurantItemStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_item_stats', to='core.restaurant')),
+                ('visinia', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='core.visinia')),
+            ],
+            options={
+                'verbose_name_plural': 'Restaurant item stats',
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('restaurant', 'date', 'visinia'), name='restaurant_item_stats_day_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RestaurantStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('booking_count', models.IntegerField(default=0)),
+                ('pending_count', models.IntegerField(default=0)),
+                ('confirmed_count', models.IntegerField(default=0)),
+                ('completed_count', models.IntegerField(default=0)),
+                ('cancelled_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='core.restaurant')),
+            ],
+            options={
+                'verbose_name_plural': 'Restaurant stats',
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('restaurant', 'date'), name='restaurant_stats_day_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-18 02:10
+
+from django.db import migrations
+
+from core.search import drop_sqlite_search_index, ensure_sqlite_search_index, search_index
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('core', 'Visinia'), search_index())
+    elif vendor == 'sqlite':
+        ensure_sqlite_search_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('core', 'Visinia'), search_index())
+    elif vendor == 'sqlite':
+        drop_sqlite_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_restaurant_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_claims_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visinia',
+            name='daily_capacity',
+            field=models.PositiveIntegerField(blank=True, help_text='Portions that can be booked per day; empty means unlimited', null=True),
+        ),
+        migrations.AddField(
+            model_name='visinia',
+            name='sold_out_on',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='VisiniaStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('capacity', models.PositiveIntegerField()),
+                ('reserved', models.PositiveIntegerField(default=0)),
+                ('visinia', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock', to='core.visinia')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('visinia', 'date'), name='visinia_stock_day_unique'), models.CheckConstraint(condition=models.Q(('reserved__lte', models.F('capacity'))), name='visinia_stock_not_oversold')],
+            },
+        ),
+    ]
@@ -0,0 +1,87 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+def validator_etag(request, *parts):
+    """Weak validator for a role-scoped read: path, user and the given data versions"""
+    # The path carries cursor, page size and ?fields=, and the user
+    # decides which rows a role-scoped queryset contains.
+    seed = '|'.join(str(part) for part in (request.get_full_path(), request.user.pk, *parts))
+    return '"%s"' % hashlib.md5(seed.encode(), usedforsecurity=False).hexdigest()
+
+
+def list_aggregates(fields):
+    """Aggregates for list_validators: the latest of each timestamp field, and the row count"""
+    return {'count': Count('pk'), **{f'max_{index}': Max(field) for index, field in enumerate(fields)}}
+
+
+def list_validators(request, fields, stats):
+    """(etag, last_modified) of a list from the result of list_aggregates(fields)"""
+    timestamps = [stats[f'max_{index}'] for index in range(len(fields))]
+    return validator_etag(request, *timestamps, stats['count']), max(filter(None, timestamps), default=None)
+
+
+def detail_validators(request, timestamps):
+    """(etag, last_modified) of one row from its values of the timestamp fields"""
+    return validator_etag(request, *timestamps), max(filter(None, timestamps))
+
+
+def not_modified(request, etag, last_modified):
+    """304 response when the client's validators still match, else None"""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def add_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(int(last_modified.timestamp()))
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+class ConditionalGetMixin:
+    """Answer If-None-Match/If-Modified-Since on list and retrieve before serializing.
+
+    Lists are validated by the latest of each ``conditional_timestamps``
+    field plus the row count of the filtered queryset, details by the row's
+    own values of those fields. A view whose serializer embeds related rows
+    lists their timestamps too.
+    """
+    conditional_timestamps = ('updated_at',)
+
+    def _conditional(self, request, etag, last_modified, build_response):
+        response = not_modified(request, etag, last_modified) or build_response()
+        return add_validators(response, etag, last_modified)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        stats = queryset.order_by().aggregate(**list_aggregates(self.conditional_timestamps))
+        etag, last_modified = list_validators(request, self.conditional_timestamps, stats)
+        return self._conditional(
+            request, etag, last_modified,
+            lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            timestamps = (
+                self.filter_queryset(self.get_queryset())
+                .filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+                .values_list(*self.conditional_timestamps)
+                .first()
+            )
+        except (TypeError, ValueError, ValidationError):
+            timestamps = None
+        if timestamps is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag, last_modified = detail_validators(request, timestamps)
+        return self._conditional(
+            request, etag, last_modified,
+            lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs),
+        )
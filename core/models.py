@@ -1,5 +1,7 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 # User Role Choices
 USER_ROLES = (
@@ -22,6 +24,22 @@ class UserProfile(models.Model):
         return f"{self.user.username} ({self.role})"
 
 
+class ClaimsUser(User):
+    """auth.User rebuilt from access-token claims by core.authentication.
+
+    Only the claimed fields are loaded; reading any other field loads the
+    rest of the row in one query instead of one query per field.
+    """
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred.issuperset(fields):
+            fields = deferred
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
+
 class Restaurant(models.Model):
     """Restaurant model owned by restaurant owners"""
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='restaurants')
@@ -36,6 +54,14 @@ class Restaurant(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Customers only ever list active restaurants, newest first.
+            models.Index(
+                fields=['-created_at'],
+                condition=models.Q(is_active=True),
+                name='restaurant_active_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -53,12 +79,22 @@ class Visinia(models.Model):
     price = models.DecimalField(max_digits=8, decimal_places=2)
     image = models.ImageField(upload_to='visiinias/', blank=True, null=True)
     is_available = models.BooleanField(default=True)
+    daily_capacity = models.PositiveIntegerField(
+        null=True, blank=True, help_text='Portions that can be booked per day; empty means unlimited'
+    )
+    # Set when the day's capacity ran out and is_available was switched off
+    # for it, so the item can be switched back on the next day.
+    sold_out_on = models.DateField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = "Visiinias"
+        indexes = [
+            # by_restaurant and the customer menu list.
+            models.Index(fields=['restaurant', 'is_available', '-created_at'], name='visinia_menu_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.restaurant.name}"
@@ -84,6 +120,13 @@ class Booking(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Customer booking lists and my_bookings.
+            models.Index(fields=['customer', '-created_at'], name='booking_customer_idx'),
+            # Owner booking lists, optionally narrowed by status.
+            models.Index(fields=['restaurant', 'status', '-created_at'], name='booking_restaurant_status_idx'),
+            models.Index(fields=['restaurant', '-created_at'], name='booking_restaurant_idx'),
+        ]
 
     def __str__(self):
         return f"Booking #{self.id} - {self.customer.username}"
@@ -98,3 +141,128 @@ class BookingItem(models.Model):
 
     def __str__(self):
         return f"{self.visinia.name} x{self.quantity}"
+
+
+class RestaurantStats(models.Model):
+    """Daily booking counters per restaurant, kept up to date as bookings change.
+
+    Bookings are bucketed by the day they were placed. Revenue excludes
+    cancelled bookings.
+    """
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    booking_count = models.IntegerField(default=0)
+    pending_count = models.IntegerField(default=0)
+    confirmed_count = models.IntegerField(default=0)
+    completed_count = models.IntegerField(default=0)
+    cancelled_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = "Restaurant stats"
+        constraints = [
+            models.UniqueConstraint(fields=['restaurant', 'date'], name='restaurant_stats_day_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.restaurant.name} {self.date}"
+
+
+class RestaurantItemStats(models.Model):
+    """Daily quantity sold and revenue per visinia, excluding cancelled bookings"""
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='daily_item_stats')
+    visinia = models.ForeignKey(Visinia, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name_plural = "Restaurant item stats"
+        constraints = [
+            models.UniqueConstraint(fields=['restaurant', 'date', 'visinia'], name='restaurant_item_stats_day_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.visinia.name} {self.date}"
+
+
+class VisiniaStock(models.Model):
+    """Portions of a visinia with a daily capacity reserved by bookings placed on one day"""
+    visinia = models.ForeignKey(Visinia, on_delete=models.CASCADE, related_name='stock')
+    date = models.DateField()
+    capacity = models.PositiveIntegerField()
+    reserved = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['visinia', 'date'], name='visinia_stock_day_unique'),
+            # The last line of defence against overselling.
+            models.CheckConstraint(condition=models.Q(reserved__lte=models.F('capacity')), name='visinia_stock_not_oversold'),
+        ]
+
+    def __str__(self):
+        return f"{self.visinia_id} {self.date}: {self.reserved}/{self.capacity}"
+
+
+class IdempotencyKey(models.Model):
+    """Outcome of a POST sent with an Idempotency-Key header, replayed to retries.
+
+    A row without a response is in flight; ``locked_at`` tells retries whether
+    the request holding it is still likely to finish.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    locked_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key_unique'),
+        ]
+        indexes = [
+            # Expiry sweep.
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key}"
+
+
+class Task(models.Model):
+    """A queued call of a function registered with ``core.tasks.task``, run by ``manage.py run_workers``.
+
+    Finished tasks are deleted; ones that ran out of attempts stay as FAILED.
+    """
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('FAILED', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=255)
+    args = models.JSONField(default=list, blank=True, encoder=DjangoJSONEncoder)
+    kwargs = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='QUEUED')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Workers polling for due tasks, and the lease check on running ones.
+            models.Index(fields=['status', 'run_after'], name='task_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
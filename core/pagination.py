@@ -0,0 +1,158 @@
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, _reverse_ordering
+
+
+class AsyncCursorPaginationMixin:
+    """CursorPagination split around its single query so the page can be read
+    with the async ORM: ``await apaginate_queryset(...)``.
+
+    The two halves are DRF's paginate_queryset unchanged.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_query = self._page_query(queryset, request, view)
+        if page_query is None:
+            return None
+        return self._set_page(list(page_query))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_query = self._page_query(queryset, request, view)
+        if page_query is None:
+            return None
+        return self._set_page([obj async for obj in page_query])
+
+    def _page_query(self, queryset, request, view):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            offset, reverse, self._current_position = 0, False, None
+        else:
+            offset, reverse, self._current_position = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if self._current_position is not None:
+            order = self.ordering[0]
+            order_attr = order.lstrip('-')
+            if self.cursor.reverse != order.startswith('-'):
+                queryset = queryset.filter(**{order_attr + '__lt': self._current_position})
+            else:
+                queryset = queryset.filter(**{order_attr + '__gt': self._current_position})
+
+        # One extra row tells whether another page follows.
+        return queryset[offset:offset + self.page_size + 1]
+
+    def _set_page(self, results):
+        offset, reverse = (self.cursor.offset, self.cursor.reverse) if self.cursor else (0, False)
+        current_position = self._current_position
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+
+class CreatedAtCursorPagination(AsyncCursorPaginationMixin, CursorPagination):
+    """Keyset pagination over (-created_at, -id) so deep pages stay cheap"""
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class DateJoinedCursorPagination(CreatedAtCursorPagination):
+    """Keyset pagination for auth.User, which has date_joined instead of created_at"""
+    ordering = ('-date_joined', '-id')
+
+
+
+class SearchRankCursorPagination(CursorPagination):
+    """Keyset pagination over (-rank, id).
+
+    Many rows share a rank, and DRF's single-field positions step through ties
+    by offset (capped at offset_cutoff), so the cursor carries both values.
+    """
+    ordering = ('-rank', 'id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+        position = self.cursor.position if self.cursor else None
+
+        if position is not None:
+            rank, pk = self.parse_position(position)
+            if reverse:
+                queryset = queryset.filter(Q(rank__gt=rank) | Q(rank=rank, id__lt=pk))
+            else:
+                queryset = queryset.filter(Q(rank__lt=rank) | Q(rank=rank, id__gt=pk))
+        queryset = queryset.order_by('rank', '-id') if reverse else queryset.order_by('-rank', 'id')
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+        self.has_next = position is not None if reverse else has_more
+        self.has_previous = has_more if reverse else position is not None
+        return self.page
+
+    def parse_position(self, position):
+        try:
+            rank, pk = position.rsplit(':', 1)
+            return float(rank), int(pk)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def _get_position_from_instance(self, instance, ordering):
+        return f'{instance.rank!r}:{instance.pk}'
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[-1], self.ordering)
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[0], self.ordering)
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
@@ -1,13 +1,14 @@
 from rest_framework.permissions import BasePermission
 
+from .roles import get_request_role
+
 
 class IsRestaurantOwner(BasePermission):
     """Permission check for restaurant owners"""
     def has_permission(self, request, view):
-        try:
-            return request.user.profile.role == 'RESTAURANT_OWNER'
-        except:
+        if not request.user or not request.user.is_authenticated:
             return False
+        return get_request_role(request) == 'RESTAURANT_OWNER'
 
 
 class IsAdminUser(BasePermission):
@@ -0,0 +1,79 @@
+from collections import namedtuple
+
+from django.contrib.auth.models import User
+from django.db.models import Prefetch
+
+from .models import Restaurant, Booking, BookingItem
+
+# select_related/prefetch_related sets needed to serialize a queryset
+# without per-row lookups.
+QueryPlan = namedtuple('QueryPlan', ['select_related', 'prefetch_related'])
+
+
+def booking_items_prefetch():
+    """BookingItemSerializer reads visinia.name for every item"""
+    return Prefetch('items', queryset=BookingItem.objects.select_related('visinia'))
+
+
+def customer_prefetch():
+    """A customer's own bookings share one customer: fetched once instead of joined into every row"""
+    return Prefetch('customer', queryset=User.objects.select_related('profile'))
+
+
+def owner_prefetch():
+    """An owner's bookings are all for their own restaurants: one owner, fetched once"""
+    return Prefetch('restaurant__owner', queryset=User.objects.select_related('profile'))
+
+
+BOOKING_PLANS = {
+    # Admins list bookings across every restaurant and customer.
+    'ADMIN': QueryPlan(
+        select_related=('customer__profile', 'restaurant__owner__profile'),
+        prefetch_related=(booking_items_prefetch,),
+    ),
+    # Owners list bookings for their own restaurants; customers vary per row.
+    'RESTAURANT_OWNER': QueryPlan(
+        select_related=('customer__profile', 'restaurant'),
+        prefetch_related=(booking_items_prefetch, owner_prefetch),
+    ),
+    # Customers list their own bookings; restaurants vary per row.
+    'CUSTOMER': QueryPlan(
+        select_related=('restaurant__owner__profile',),
+        prefetch_related=(booking_items_prefetch, customer_prefetch),
+    ),
+}
+
+RESTAURANT_PLAN = QueryPlan(select_related=('owner__profile',), prefetch_related=())
+
+
+def apply_plan(queryset, plan):
+    """Attach a QueryPlan's joins and prefetches to a queryset"""
+    if plan.select_related:
+        queryset = queryset.select_related(*plan.select_related)
+    if plan.prefetch_related:
+        queryset = queryset.prefetch_related(*[
+            lookup() if callable(lookup) else lookup
+            for lookup in plan.prefetch_related
+        ])
+    return queryset
+
+
+def scoped_bookings(user, role):
+    """Bookings visible to a user with the given role, without any joins"""
+    if role == 'ADMIN':
+        return Booking.objects.all()
+    if role == 'RESTAURANT_OWNER':
+        return Booking.objects.filter(restaurant__owner=user)
+    return Booking.objects.filter(customer=user)
+
+
+def booking_queryset(user, role):
+    """Bookings visible to a user with the given role, ready for BookingSerializer"""
+    if role not in BOOKING_PLANS:
+        role = 'CUSTOMER'
+    return apply_plan(scoped_bookings(user, role), BOOKING_PLANS[role])
+
+
+def restaurant_queryset(**filters):
+    """Restaurants ready for RestaurantSerializer"""
+    return apply_plan(Restaurant.objects.filter(**filters), RESTAURANT_PLAN)
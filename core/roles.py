@@ -0,0 +1,90 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .models import UserProfile, USER_ROLES
+
+VALID_ROLES = {role for role, _ in USER_ROLES}
+
+# user_id -> (role, expires_at); process-local, invalidated from signals.
+_role_cache = {}
+_role_cache_lock = threading.Lock()
+
+
+def _cache_ttl():
+    return getattr(settings, 'ROLE_CACHE_TTL', 300)
+
+
+def invalidate_user_role(user_id):
+    """Drop the cached role for a user"""
+    with _role_cache_lock:
+        _role_cache.pop(user_id, None)
+
+
+def clear_role_cache():
+    with _role_cache_lock:
+        _role_cache.clear()
+
+
+def get_user_role(user):
+    """Role for a user, served from the TTL cache and loaded from UserProfile on a miss"""
+    now = time.monotonic()
+    with _role_cache_lock:
+        cached = _role_cache.get(user.pk)
+    if cached and cached[1] > now:
+        return cached[0]
+
+    # Ensure a UserProfile exists to avoid RelatedObjectDoesNotExist
+    profile, _ = UserProfile.objects.get_or_create(user_id=user.pk)
+    with _role_cache_lock:
+        _role_cache[user.pk] = (profile.role, now + _cache_ttl())
+    return profile.role
+
+
+def get_request_role(request):
+    """Resolve the requesting user's role once per request.
+
+    The role claim embedded in the access token wins; otherwise the
+    process-local cache is consulted.
+    """
+    role = getattr(request, '_user_role', None)
+    if role is not None:
+        return role
+
+    token = getattr(request, 'auth', None)
+    role = token.get('role') if hasattr(token, 'get') else None
+    if role not in VALID_ROLES:
+        role = get_user_role(request.user)
+
+    request._user_role = role
+    return role
+
+
+async def aget_user_role(user):
+    """get_user_role for async views"""
+    now = time.monotonic()
+    with _role_cache_lock:
+        cached = _role_cache.get(user.pk)
+    if cached and cached[1] > now:
+        return cached[0]
+
+    profile, _ = await UserProfile.objects.aget_or_create(user_id=user.pk)
+    with _role_cache_lock:
+        _role_cache[user.pk] = (profile.role, now + _cache_ttl())
+    return profile.role
+
+
+async def aget_request_role(request):
+    """get_request_role for async views"""
+    role = getattr(request, '_user_role', None)
+    if role is not None:
+        return role
+
+    token = getattr(request, 'auth', None)
+    role = token.get('role') if hasattr(token, 'get') else None
+    if role not in VALID_ROLES:
+        role = await aget_user_role(request.user)
+
+    request._user_role = role
+    return role
@@ -0,0 +1,106 @@
+import re
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+# Menus mix Swahili and English, so no language-specific stemming.
+SEARCH_CONFIG = 'simple'
+SEARCH_INDEX_NAME = 'visinia_search_idx'
+MAX_SEARCH_TERMS = 8
+
+FTS_TABLE = 'core_visinia_fts'
+FTS_TRIGGERS = {
+    'core_visinia_fts_insert': (
+        "AFTER INSERT ON core_visinia BEGIN "
+        "INSERT INTO core_visinia_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END"
+    ),
+    'core_visinia_fts_delete': (
+        "AFTER DELETE ON core_visinia BEGIN "
+        "INSERT INTO core_visinia_fts(core_visinia_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); END"
+    ),
+    'core_visinia_fts_update': (
+        "AFTER UPDATE OF name, description ON core_visinia BEGIN "
+        "INSERT INTO core_visinia_fts(core_visinia_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); "
+        "INSERT INTO core_visinia_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END"
+    ),
+}
+
+
+def search_terms(query):
+    """Lower-cased word tokens of a user query; safe to embed in tsquery/FTS5 syntax"""
+    return re.findall(r'\w+', (query or '').lower())[:MAX_SEARCH_TERMS]
+
+
+def search_vector():
+    """The indexed expression; queries must use exactly this to hit the GIN index"""
+    return SearchVector('name', 'description', config=SEARCH_CONFIG)
+
+
+def search_index():
+    return GinIndex(search_vector(), name=SEARCH_INDEX_NAME)
+
+
+def ensure_sqlite_search_index(connection):
+    """Create the FTS5 table and its sync triggers if missing.
+
+    SQLite drops triggers when a migration rebuilds core_visinia, so this runs
+    after every migrate, not only from the migration that introduced it.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "name, description, content='core_visinia', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'core_visinia'")
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [name for name in FTS_TRIGGERS if name not in existing]
+        for name in missing:
+            cursor.execute(f'CREATE TRIGGER {name} {FTS_TRIGGERS[name]}')
+        if missing:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_sqlite_search_index(connection):
+    with connection.cursor() as cursor:
+        for name in FTS_TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def search_visiinias(queryset, terms):
+    """Filter to rows matching every term (prefix match) and annotate ``rank``, higher is better"""
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        query = SearchQuery(
+            ' & '.join(f'{term}:*' for term in terms), config=SEARCH_CONFIG, search_type='raw'
+        )
+        weighted = (
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+        )
+        return queryset.annotate(search=search_vector()).filter(search=query).annotate(
+            # ts_rank is a real; compare cursors in double precision.
+            rank=Cast(SearchRank(weighted, query), FloatField()),
+        )
+
+    if vendor == 'sqlite':
+        # Join the FTS table once; a correlated bm25() subquery re-runs the
+        # match for every row. There is no model for the virtual table, hence extra().
+        match = ' '.join(f'"{term}"*' for term in terms)
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = core_visinia.id', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+        ).annotate(rank=RawSQL(
+            # bm25 is lower-is-better; name matches weigh more than description.
+            f'-bm25({FTS_TABLE}, 10.0, 1.0)', (), output_field=FloatField(),
+        ))
+
+    raise NotImplementedError(f'Full-text search is not available on {vendor}')
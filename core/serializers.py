@@ -1,8 +1,15 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from django.contrib.auth.models import User
 from django.db import transaction
-import os
-from .models import UserProfile, Restaurant, Visinia, Booking, BookingItem, USER_ROLES
+from .models import (
+    UserProfile, Restaurant, Visinia, Booking, BookingItem, RestaurantStats, USER_ROLES
+)
+from .authentication import add_auth_claims
+from .bookings import BOOKING_TRANSITIONS, MAX_STATUS_BATCH
+from .images import build_variants
+from .signals import suppress_profile_creation
 
 AUTO_RESTAURANT_LOGOS = [
     'restaurants/al_noor_food_beverage_logo.png',
@@ -62,7 +69,22 @@ class RelativeImageField(serializers.ImageField):
             return None
 
 
-class UserSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """Limit GET output to the comma-separated ?fields= list on the top-level serializer"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        requested = request.query_params.get('fields')
+        if not requested:
+            return
+        allowed = {name.strip() for name in requested.split(',') if name.strip()}
+        for name in set(self.fields) - allowed:
+            self.fields.pop(name)
+
+
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     profile = serializers.SerializerMethodField()
 
     class Meta:
@@ -78,13 +100,13 @@ class UserSerializer(serializers.ModelSerializer):
             return None
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = UserProfile
         fields = ['id', 'role', 'phone', 'avatar', 'created_at', 'updated_at']
 
 
-class RestaurantSerializer(serializers.ModelSerializer):
+class RestaurantSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     owner = UserSerializer(read_only=True)
     owner_id = serializers.IntegerField(write_only=True, required=False)
     logo = RelativeImageField(required=False, allow_null=True)
@@ -137,12 +159,16 @@ class RestaurantSerializer(serializers.ModelSerializer):
                 f"{restaurant.owner_id}-{restaurant.name}-{restaurant.id}",
             )
             restaurant.save(update_fields=['logo'])
+        else:
+            build_variants.enqueue(restaurant.logo.name)
         return restaurant
 
     def update(self, instance, validated_data):
         logo_choice = validated_data.pop('logo_choice', None)
         restaurant = super().update(instance, validated_data)
         if logo_choice is None or logo_choice == '':
+            if validated_data.get('logo'):
+                build_variants.enqueue(restaurant.logo.name)
             return restaurant
         if logo_choice == '__auto__':
             restaurant.logo = pick_auto_media_path(
@@ -154,7 +180,7 @@ class RestaurantSerializer(serializers.ModelSerializer):
         restaurant.save(update_fields=['logo'])
         return restaurant
 
-class VisioniaSerializer(serializers.ModelSerializer):
+class VisioniaSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     image = RelativeImageField(required=False, allow_null=True)
     image_choice = serializers.CharField(write_only=True, required=False, allow_blank=True)
     image_file_url = serializers.SerializerMethodField()
@@ -171,6 +197,7 @@ class VisioniaSerializer(serializers.ModelSerializer):
             'image_choice',
             'image_file_url',
             'is_available',
+            'daily_capacity',
             'created_at',
             'updated_at',
         ]
@@ -203,12 +230,16 @@ class VisioniaSerializer(serializers.ModelSerializer):
                 f"{visinia.restaurant_id}-{visinia.name}-{visinia.id}",
             )
             visinia.save(update_fields=['image'])
+        else:
+            build_variants.enqueue(visinia.image.name)
         return visinia
 
     def update(self, instance, validated_data):
         image_choice = validated_data.pop('image_choice', None)
         visinia = super().update(instance, validated_data)
         if image_choice is None or image_choice == '':
+            if validated_data.get('image'):
+                build_variants.enqueue(visinia.image.name)
             return visinia
         if image_choice == '__auto__':
             visinia.image = pick_visinia_image_by_name(visinia.name) or pick_auto_media_path(
@@ -221,7 +252,28 @@ class VisioniaSerializer(serializers.ModelSerializer):
         return visinia
 
 
-class BookingItemSerializer(serializers.ModelSerializer):
+class VisiniaSearchSerializer(VisioniaSerializer):
+    restaurant_name = serializers.CharField(source='restaurant.name', read_only=True)
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta(VisioniaSerializer.Meta):
+        fields = VisioniaSerializer.Meta.fields + ['restaurant_name', 'rank']
+
+
+class VisiniaSearchParamsSerializer(serializers.Serializer):
+    """Query parameters of /api/visiinias/search/"""
+    q = serializers.CharField(max_length=200)
+    min_price = serializers.DecimalField(max_digits=8, decimal_places=2, min_value=0, required=False)
+    max_price = serializers.DecimalField(max_digits=8, decimal_places=2, min_value=0, required=False)
+    restaurant_id = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, attrs):
+        if 'min_price' in attrs and 'max_price' in attrs and attrs['min_price'] > attrs['max_price']:
+            raise serializers.ValidationError("min_price cannot be greater than max_price.")
+        return attrs
+
+
+class BookingItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     visinia_name = serializers.CharField(source='visinia.name', read_only=True)
 
     class Meta:
@@ -229,7 +281,7 @@ class BookingItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'visinia', 'visinia_name', 'quantity', 'price']
 
 
-class BookingSerializer(serializers.ModelSerializer):
+class BookingSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     customer = UserSerializer(read_only=True)
     restaurant = RestaurantSerializer(read_only=True)
     items = BookingItemSerializer(many=True, read_only=True)
@@ -240,15 +292,48 @@ class BookingSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'customer', 'created_at', 'updated_at']
 
 
+class RestaurantStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RestaurantStats
+        fields = [
+            'date', 'booking_count', 'pending_count', 'confirmed_count',
+            'completed_count', 'cancelled_count', 'revenue',
+        ]
+
+
+class RestaurantStatsTotalsSerializer(serializers.Serializer):
+    booking_count = serializers.IntegerField()
+    pending_count = serializers.IntegerField()
+    confirmed_count = serializers.IntegerField()
+    completed_count = serializers.IntegerField()
+    cancelled_count = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class RestaurantItemStatsSerializer(serializers.Serializer):
+    visinia = serializers.IntegerField(source='visinia_id')
+    visinia_name = serializers.CharField(source='visinia__name')
+    quantity = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
 class BookingCreateSerializer(serializers.Serializer):
     restaurant_id = serializers.IntegerField()
     items = serializers.ListField(
-        child=serializers.DictField(child=serializers.IntegerField()),
+        child=serializers.DictField(child=serializers.IntegerField(min_value=1)),
+        allow_empty=False,
         help_text='List of {visinia_id: quantity}'
     )
     notes = serializers.CharField(required=False, allow_blank=True)
 
 
+class BookingStatusBatchSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=sorted(BOOKING_TRANSITIONS))
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=MAX_STATUS_BATCH
+    )
+
+
 class RegistrationSerializer(serializers.ModelSerializer):
     """Serializer for user registration with role assignment"""
     password = serializers.CharField(write_only=True, min_length=8)
@@ -294,37 +379,28 @@ class RegistrationSerializer(serializers.ModelSerializer):
         role = validated_data.pop('role', 'CUSTOMER')
         phone = validated_data.pop('phone', '')
 
-        try:
-            # Temporarily disable automatic profile creation
-            os.environ['DISABLE_AUTO_CREATE_PROFILE'] = '1'
-            
+        # The profile is created here with the submitted role and phone
+        with suppress_profile_creation():
             user = User.objects.create_user(
                 password=password,
                 **validated_data
             )
 
-            # Create profile manually with role and phone
-            profile, created = UserProfile.objects.get_or_create(
-                user=user,
-                defaults={
-                    'role': role,
-                    'phone': phone
-                }
-            )
+        profile, created = UserProfile.objects.get_or_create(
+            user=user,
+            defaults={
+                'role': role,
+                'phone': phone
+            }
+        )
 
-            # If profile already existed, update it
-            if not created:
-                profile.role = role
-                profile.phone = phone
-                profile.save()
+        # If profile already existed, update it
+        if not created:
+            profile.role = role
+            profile.phone = phone
+            profile.save()
 
-            return user
-        except Exception as e:
-            # Re-raise the exception to be handled by the view
-            raise e
-        finally:
-            # Re-enable automatic profile creation
-            os.environ.pop('DISABLE_AUTO_CREATE_PROFILE', None)
+        return user
 
 
 class AdminOwnerRegistrationSerializer(serializers.ModelSerializer):
@@ -358,25 +434,37 @@ class AdminOwnerRegistrationSerializer(serializers.ModelSerializer):
         password = validated_data.pop('password')
         phone = validated_data.pop('phone', '')
 
-        try:
-            os.environ['DISABLE_AUTO_CREATE_PROFILE'] = '1'
+        with suppress_profile_creation():
             user = User.objects.create_user(
                 password=password,
                 **validated_data
             )
-            profile, created = UserProfile.objects.get_or_create(
-                user=user,
-                defaults={
-                    'role': 'RESTAURANT_OWNER',
-                    'phone': phone
-                }
-            )
-            if not created:
-                profile.role = 'RESTAURANT_OWNER'
-                profile.phone = phone
-                profile.save()
-            return user
-        except Exception as e:
-            raise e
-        finally:
-            os.environ.pop('DISABLE_AUTO_CREATE_PROFILE', None)
+        profile, created = UserProfile.objects.get_or_create(
+            user=user,
+            defaults={
+                'role': 'RESTAURANT_OWNER',
+                'phone': phone
+            }
+        )
+        if not created:
+            profile.role = 'RESTAURANT_OWNER'
+            profile.phone = phone
+            profile.save()
+        return user
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Issue tokens carrying the user's role and staff flags so requests skip the user and profile lookups"""
+    @classmethod
+    def get_token(cls, user):
+        return add_auth_claims(super().get_token(user), user)
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """Re-read the claims on refresh, so a role or staff change only costs the client one refresh"""
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.get(pk=refresh[jwt_settings.USER_ID_CLAIM])
+        data['access'] = str(add_auth_claims(refresh.access_token, user))
+        return data
@@ -1,15 +1,100 @@
-from django.db.models.signals import post_save
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.signals import post_save, post_delete, post_migrate
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-import os
+from django.utils import timezone
+
+from .models import UserProfile, Restaurant, Visinia
+from .authentication import invalidate_auth_version
+from .roles import invalidate_user_role
+from .menu_cache import bump_menu_version
+from .catalogue import schedule_build
+from .search import ensure_sqlite_search_index
+from .metrics import install_query_timer
+from .stock import sync_capacity
+
+_profile_creation_suppressed = ContextVar('profile_creation_suppressed', default=False)
+
 
-from .models import UserProfile
+@contextmanager
+def suppress_profile_creation():
+    """Skip the automatic UserProfile for users created inside this block"""
+    token = _profile_creation_suppressed.set(True)
+    try:
+        yield
+    finally:
+        _profile_creation_suppressed.reset(token)
 
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
-    # Allow disabling automatic profile creation (useful when loading fixtures)
-    if os.environ.get('DISABLE_AUTO_CREATE_PROFILE'):
+    # Fixture loading (raw) and callers that create the profile themselves
+    # skip the default one.
+    if kwargs.get('raw') or _profile_creation_suppressed.get():
         return
     if created:
         UserProfile.objects.create(user=instance)
+
+
+@receiver(post_save, sender=User)
+def touch_user_profile(sender, instance, created, update_fields=None, **kwargs):
+    # User has no updated_at; the profile's stands for both in conditional GETs
+    # of anything that embeds the user. last_login is never serialized.
+    if kwargs.get('raw') or created or update_fields == frozenset({'last_login'}):
+        return
+    UserProfile.objects.filter(user_id=instance.pk).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_cached_role(sender, instance, **kwargs):
+    invalidate_user_role(instance.user_id)
+    invalidate_auth_version(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_claims(sender, instance, **kwargs):
+    # Staff flags and is_active live on User and are part of the token's claims.
+    invalidate_auth_version(instance.pk)
+
+
+@receiver(post_save, sender=Visinia)
+@receiver(post_delete, sender=Visinia)
+def invalidate_visinia_menu(sender, instance, **kwargs):
+    bump_menu_version(instance.restaurant_id)
+    schedule_build()
+
+
+@receiver(post_save, sender=Visinia)
+def apply_capacity_change(sender, instance, created, **kwargs):
+    if kwargs.get('raw') or created:
+        return
+    sync_capacity(instance)
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def invalidate_restaurant_menu(sender, instance, **kwargs):
+    bump_menu_version(instance.pk)
+    schedule_build()
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    # SQLite loses the FTS triggers whenever a migration rebuilds core_visinia.
+    connection = connections[using]
+    if sender.name != 'core' or connection.vendor != 'sqlite':
+        return
+    if ('core', '0005_visinia_search') in MigrationRecorder(connection).applied_migrations():
+        ensure_sqlite_search_index(connection)
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    install_query_timer(connection)
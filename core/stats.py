@@ -0,0 +1,162 @@
+from django.db.models import Case, Count, F, Q, Sum, Value, When, DecimalField, IntegerField
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Booking, BookingItem, RestaurantStats, RestaurantItemStats
+
+STATUS_COUNTERS = {
+    'PENDING': 'pending_count',
+    'CONFIRMED': 'confirmed_count',
+    'COMPLETED': 'completed_count',
+    'CANCELLED': 'cancelled_count',
+}
+
+
+def _bucket(booking):
+    return timezone.localdate(booking.created_at)
+
+
+def _ensure_day(restaurant_id, date):
+    RestaurantStats.objects.bulk_create(
+        [RestaurantStats(restaurant_id=restaurant_id, date=date)], ignore_conflicts=True
+    )
+
+
+def _apply_items(restaurant_id, date, lines, sign):
+    """Add (sign=1) or remove (sign=-1) (visinia_id, quantity, price) lines in two queries"""
+    if not lines:
+        return
+    quantities = {}
+    revenues = {}
+    for visinia_id, quantity, price in lines:
+        quantities[visinia_id] = quantities.get(visinia_id, 0) + quantity
+        revenues[visinia_id] = revenues.get(visinia_id, 0) + price * quantity
+
+    RestaurantItemStats.objects.bulk_create(
+        [RestaurantItemStats(restaurant_id=restaurant_id, visinia_id=visinia_id, date=date) for visinia_id in quantities],
+        ignore_conflicts=True,
+    )
+    RestaurantItemStats.objects.filter(
+        restaurant_id=restaurant_id, date=date, visinia_id__in=quantities.keys()
+    ).update(
+        quantity=F('quantity') + Case(
+            *[When(visinia_id=visinia_id, then=Value(sign * quantity)) for visinia_id, quantity in quantities.items()],
+            output_field=IntegerField(),
+        ),
+        revenue=F('revenue') + Case(
+            *[When(visinia_id=visinia_id, then=Value(sign * revenue)) for visinia_id, revenue in revenues.items()],
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+def record_booking_created(booking, items):
+    """Count a new booking and its BookingItem rows; call inside the creating transaction"""
+    date = _bucket(booking)
+    _ensure_day(booking.restaurant_id, date)
+    counter = STATUS_COUNTERS[booking.status]
+    changes = {
+        'booking_count': F('booking_count') + 1,
+        counter: F(counter) + 1,
+    }
+    if booking.status != 'CANCELLED':
+        changes['revenue'] = F('revenue') + booking.total_price
+    RestaurantStats.objects.filter(restaurant_id=booking.restaurant_id, date=date).update(**changes)
+    if booking.status != 'CANCELLED':
+        _apply_items(
+            booking.restaurant_id, date,
+            [(item.visinia_id, item.quantity, item.price) for item in items], 1,
+        )
+
+
+def record_status_change(booking, old_status, new_status):
+    """Move a booking between status counters; call inside the updating transaction"""
+    record_status_changes([booking], old_status, new_status)
+
+
+def record_status_changes(bookings, old_status, new_status):
+    """record_status_change for many bookings: one counter update per (restaurant, day)"""
+    if old_status == new_status or not bookings:
+        return
+    days = {}
+    for booking in bookings:
+        day = days.setdefault((booking.restaurant_id, _bucket(booking)), {'count': 0, 'revenue': 0, 'ids': []})
+        day['count'] += 1
+        day['revenue'] += booking.total_price
+        day['ids'].append(booking.pk)
+    RestaurantStats.objects.bulk_create(
+        [RestaurantStats(restaurant_id=restaurant_id, date=date) for restaurant_id, date in days],
+        ignore_conflicts=True,
+    )
+    old_counter = STATUS_COUNTERS[old_status]
+    new_counter = STATUS_COUNTERS[new_status]
+
+    # Cancelling takes the booking out of revenue and items sold; reopening
+    # a cancelled booking puts it back.
+    sign = 0
+    if new_status == 'CANCELLED':
+        sign = -1
+    elif old_status == 'CANCELLED':
+        sign = 1
+
+    lines = {}
+    if sign:
+        booking_days = {pk: key for key, day in days.items() for pk in day['ids']}
+        for booking_id, visinia_id, quantity, price in BookingItem.objects.filter(
+            booking_id__in=booking_days.keys()
+        ).values_list('booking_id', 'visinia_id', 'quantity', 'price'):
+            lines.setdefault(booking_days[booking_id], []).append((visinia_id, quantity, price))
+
+    for (restaurant_id, date), day in days.items():
+        changes = {
+            old_counter: F(old_counter) - day['count'],
+            new_counter: F(new_counter) + day['count'],
+        }
+        if sign:
+            changes['revenue'] = F('revenue') + sign * day['revenue']
+        RestaurantStats.objects.filter(restaurant_id=restaurant_id, date=date).update(**changes)
+        if sign:
+            _apply_items(restaurant_id, date, lines.get((restaurant_id, date), []), sign)
+
+
+def rebuild_restaurant_stats(restaurant_ids=None):
+    """Recompute all buckets from the bookings table with two GROUP BY queries"""
+    stats = RestaurantStats.objects.all()
+    item_stats = RestaurantItemStats.objects.all()
+    bookings = Booking.objects.all()
+    items = BookingItem.objects.exclude(booking__status='CANCELLED')
+    if restaurant_ids is not None:
+        stats = stats.filter(restaurant_id__in=restaurant_ids)
+        item_stats = item_stats.filter(restaurant_id__in=restaurant_ids)
+        bookings = bookings.filter(restaurant_id__in=restaurant_ids)
+        items = items.filter(booking__restaurant_id__in=restaurant_ids)
+    stats.delete()
+    item_stats.delete()
+
+    money = DecimalField(max_digits=12, decimal_places=2)
+    counters = {
+        counter: Count('id', filter=Q(status=status)) for status, counter in STATUS_COUNTERS.items()
+    }
+    days = bookings.annotate(date=TruncDate('created_at')).values('restaurant_id', 'date').annotate(
+        booking_count=Count('id'),
+        revenue=Coalesce(Sum('total_price', filter=~Q(status='CANCELLED')), Value(0), output_field=money),
+        **counters,
+    ).order_by()
+    lines = items.annotate(
+        restaurant_id=F('booking__restaurant_id'), date=TruncDate('booking__created_at'),
+    ).values('restaurant_id', 'date', 'visinia_id').annotate(
+        total_quantity=Sum('quantity'),
+        total_revenue=Sum(F('price') * F('quantity'), output_field=money),
+    ).order_by()
+
+    created = RestaurantStats.objects.bulk_create(
+        [RestaurantStats(**day) for day in days], batch_size=500
+    )
+    RestaurantItemStats.objects.bulk_create([
+        RestaurantItemStats(
+            restaurant_id=line['restaurant_id'], visinia_id=line['visinia_id'], date=line['date'],
+            quantity=line['total_quantity'], revenue=line['total_revenue'],
+        )
+        for line in lines
+    ], batch_size=500)
+    return len(created)
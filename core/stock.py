@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .catalogue import schedule_build
+from .menu_cache import bump_menu_version
+from .models import BookingItem, Visinia, VisiniaStock
+from .tasks import task
+
+
+def _bump_menus_on_commit(restaurant_ids):
+    # After commit, so a menu rebuilt meanwhile cannot be cached under the new version.
+    for restaurant_id in set(restaurant_ids):
+        transaction.on_commit(lambda restaurant_id=restaurant_id: bump_menu_version(restaurant_id))
+
+
+def _set_availability(visinia_ids, available, date):
+    """Switch sold-out items off (or back on); only items this module switched off are switched on"""
+    items = Visinia.objects.filter(pk__in=visinia_ids)
+    if available:
+        items = items.filter(sold_out_on=date)
+        changes = {'is_available': True, 'sold_out_on': None}
+    else:
+        items = items.filter(is_available=True)
+        changes = {'is_available': False, 'sold_out_on': date}
+    restaurant_ids = list(items.values_list('restaurant_id', flat=True))
+    if restaurant_ids:
+        items.update(updated_at=timezone.now(), **changes)
+        _bump_menus_on_commit(restaurant_ids)
+        schedule_build()
+
+
+def reserve_stock(menu, quantities, date):
+    """Reserve portions of the items with a daily capacity, or raise ValidationError.
+
+    Each item is one ``UPDATE ... WHERE reserved + quantity <= capacity``, so
+    there is no read-modify-write to race on. Rows are always locked in item
+    id order, so concurrent bookings of the same items cannot deadlock. A
+    failure leaves earlier reservations to the caller's transaction rollback.
+    """
+    limited = sorted(visinia_id for visinia_id in quantities if menu[visinia_id].daily_capacity is not None)
+    if not limited:
+        return
+    VisiniaStock.objects.bulk_create(
+        [VisiniaStock(visinia_id=visinia_id, date=date, capacity=menu[visinia_id].daily_capacity) for visinia_id in limited],
+        ignore_conflicts=True,
+    )
+    for visinia_id in limited:
+        quantity = quantities[visinia_id]
+        reserved = VisiniaStock.objects.filter(
+            visinia_id=visinia_id, date=date, reserved__lte=F('capacity') - quantity
+        ).update(reserved=F('reserved') + quantity)
+        if not reserved:
+            raise ValidationError({"items": f"Visinia {visinia_id} has fewer than {quantity} portions left today"})
+
+    sold_out = VisiniaStock.objects.filter(visinia_id__in=limited, date=date, reserved__gte=F('capacity'))
+    sold_out = list(sold_out.values_list('visinia_id', flat=True))
+    if sold_out:
+        _set_availability(sold_out, False, date)
+
+
+def release_stock(bookings):
+    """Give back the portions reserved by bookings being cancelled"""
+    booking_days = {booking.pk: timezone.localdate(booking.created_at) for booking in bookings}
+    released = {}
+    for booking_id, visinia_id, quantity in BookingItem.objects.filter(
+        booking_id__in=booking_days.keys(), visinia__daily_capacity__isnull=False
+    ).values_list('booking_id', 'visinia_id', 'quantity'):
+        key = (visinia_id, booking_days[booking_id])
+        released[key] = released.get(key, 0) + quantity
+    if not released:
+        return
+
+    for (visinia_id, date), quantity in sorted(released.items()):
+        # Greatest guards bookings placed before the item had a capacity.
+        VisiniaStock.objects.filter(visinia_id=visinia_id, date=date).update(
+            reserved=Greatest(F('reserved') - quantity, Value(0))
+        )
+    today = timezone.localdate()
+    _set_availability([visinia_id for visinia_id, date in released if date == today], True, today)
+
+
+def sync_capacity(visinia):
+    """Apply an owner's capacity change to today's reservations"""
+    today = timezone.localdate()
+    full = False
+    if visinia.daily_capacity is not None:
+        stock = VisiniaStock.objects.filter(visinia=visinia, date=today)
+        # Never below what is already booked, or the check constraint would fail.
+        stock.update(capacity=Greatest(F('reserved'), Value(visinia.daily_capacity)))
+        full = stock.filter(reserved__gte=F('capacity')).exists()
+    if full and visinia.is_available:
+        _set_availability([visinia.pk], False, today)
+    elif not full and visinia.sold_out_on == today:
+        _set_availability([visinia.pk], True, today)
+
+
+@task(max_attempts=3)
+def restock_sold_out():
+    """Switch items that sold out on an earlier day back on; returns how many"""
+    today = timezone.localdate()
+    items = Visinia.objects.filter(sold_out_on__lt=today)
+    restaurant_ids = list(items.values_list('restaurant_id', flat=True))
+    if not restaurant_ids:
+        return 0
+    count = items.update(is_available=True, sold_out_on=None, updated_at=timezone.now())
+    _bump_menus_on_commit(restaurant_ids)
+    schedule_build()
+    return count
+
+
+def schedule_restock():
+    """Queue restock_sold_out if no process has within STOCK_RESTOCK_INTERVAL seconds"""
+    interval = getattr(settings, 'STOCK_RESTOCK_INTERVAL', 300)
+    if interval and caches['default'].add('stock:restock', 1, timeout=interval):
+        restock_sold_out.enqueue()
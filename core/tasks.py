@@ -0,0 +1,164 @@
+import functools
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+# Due tasks a worker looks at per claim attempt; it takes the first one no
+# other worker has claimed in the meantime.
+CLAIM_BATCH = 10
+MAX_ERROR_LENGTH = 10000
+
+_registry = {}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class TaskFunction:
+    """A function that can be queued with ``.enqueue()``; calling it runs it inline"""
+
+    def __init__(self, func, name, max_attempts):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, **kwargs):
+        """Queue a call for when the current transaction commits; arguments must be JSON-serialisable.
+
+        Nothing is queued if the transaction rolls back, and a worker can never
+        pick the task up before the rows it refers to are visible.
+        """
+        if _setting('TASKS_RUN_INLINE', False):
+            transaction.on_commit(lambda: self.func(*args, **kwargs), robust=True)
+            return
+        transaction.on_commit(
+            lambda: Task.objects.create(name=self.name, args=list(args), kwargs=kwargs, max_attempts=self.max_attempts),
+            robust=True,
+        )
+
+
+def task(max_attempts=5):
+    """Register a function as a task, named after its import path"""
+    def decorator(func):
+        name = f'{func.__module__}.{func.__qualname__}'
+        wrapper = _registry[name] = TaskFunction(func, name, max_attempts)
+        return wrapper
+    return decorator
+
+
+def get_task(name):
+    if name not in _registry:
+        # Importing the module runs its @task decorators.
+        import_string(name)
+    return _registry[name]
+
+
+def retry_delay(attempts):
+    """Seconds before the next attempt: exponential from TASK_RETRY_DELAY, capped, with jitter"""
+    base = _setting('TASK_RETRY_DELAY', 10)
+    delay = min(base * 2 ** (attempts - 1), _setting('TASK_RETRY_MAX_DELAY', 3600))
+    # Tasks that failed together (a database blip) should not all retry together.
+    return delay * random.uniform(0.5, 1)
+
+
+def requeue_stale():
+    """Recover tasks whose worker died: RUNNING for longer than TASK_LEASE_SECONDS"""
+    now = timezone.now()
+    stale = Task.objects.filter(status='RUNNING', locked_at__lt=now - timedelta(seconds=_setting('TASK_LEASE_SECONDS', 600)))
+    requeued = stale.filter(attempts__lt=F('max_attempts')).update(
+        status='QUEUED', locked_by='', locked_at=None, run_after=now, updated_at=now
+    )
+    stale.update(status='FAILED', last_error='Worker lease expired', updated_at=now)
+    return requeued
+
+
+class Worker:
+    """Claims due tasks and runs them one at a time; one per thread"""
+
+    def __init__(self, name=None):
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+    def claim(self):
+        now = timezone.now()
+        due = Task.objects.filter(status='QUEUED', run_after__lte=now).order_by('run_after', 'pk')
+        for pk in due.values_list('pk', flat=True)[:CLAIM_BATCH]:
+            # Conditional update: exactly one worker wins each task, on any database.
+            claimed = Task.objects.filter(pk=pk, status='QUEUED').update(
+                status='RUNNING', locked_by=self.name, locked_at=now, attempts=F('attempts') + 1, updated_at=now
+            )
+            if claimed:
+                return Task.objects.get(pk=pk)
+        return None
+
+    def run(self, job):
+        # Matching the attempt keeps a worker that overran its lease from touching the retry.
+        mine = Task.objects.filter(pk=job.pk, status='RUNNING', attempts=job.attempts)
+        started = time.perf_counter()
+        try:
+            get_task(job.name).func(*job.args, **job.kwargs)
+        except Exception as exc:
+            error = ''.join(traceback.format_exception(exc))[-MAX_ERROR_LENGTH:]
+            now = timezone.now()
+            if job.attempts >= job.max_attempts:
+                logger.error('Task %s (%s) failed for good after %d attempts', job.pk, job.name, job.attempts, exc_info=exc)
+                mine.update(status='FAILED', last_error=error, updated_at=now)
+            else:
+                delay = retry_delay(job.attempts)
+                logger.warning('Task %s (%s) failed, retrying in %.0f s: %s', job.pk, job.name, delay, exc)
+                mine.update(
+                    status='QUEUED', locked_by='', locked_at=None, last_error=error,
+                    run_after=now + timedelta(seconds=delay), updated_at=now,
+                )
+            return False
+        mine.delete()
+        logger.info('Task %s (%s) done in %.0f ms', job.pk, job.name, (time.perf_counter() - started) * 1000)
+        return True
+
+    def run_pending(self):
+        """Run due tasks until none are left; returns how many ran"""
+        count = 0
+        while (job := self.claim()) is not None:
+            self.run(job)
+            count += 1
+        return count
+
+    def run_forever(self, stop, poll_interval=None):
+        poll_interval = _setting('TASK_POLL_INTERVAL', 1) if poll_interval is None else poll_interval
+        lease_check = 0
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                try:
+                    if time.monotonic() >= lease_check:
+                        requeue_stale()
+                        lease_check = time.monotonic() + 60
+                    job = self.claim()
+                    if job is not None:
+                        self.run(job)
+                        continue
+                except Exception:
+                    # Usually the database restarting; keep polling.
+                    logger.exception('Task worker %s lost its database connection', self.name)
+                stop.wait(poll_interval)
+        finally:
+            connection.close()
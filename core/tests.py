@@ -1,8 +1,57 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.dummy import DummyCache
+from django.db import OperationalError, connection, connections, transaction
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.client import AsyncClientHandler
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
+from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import UserProfile, Restaurant, Visinia, Booking
+from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.tokens import AccessToken
+from PIL import Image
+from .models import UserProfile, Restaurant, Visinia, VisiniaStock, Booking, BookingItem, RestaurantStats, IdempotencyKey, Task
+from .bookings import BOOKING_CREATE_QUERY_BUDGET, place_booking, transition_bookings
+from .roles import clear_role_cache
+from .authentication import AUTH_VERSION_CLAIM, current_auth_version
+from .menu_cache import menu_cache
+from .catalogue import build_catalogue, catalogue, msgpack, schedule_build
+from .benchmark import ScenarioRunner, generate_dataset
+from .media import _aiter_range
+from .management.commands.serve import close_connections_per_request, open_request_connections
+from .explain import sequential_scans
+from .stats import rebuild_restaurant_stats
+from .exports import iter_booking_rows
+from .bulk_fixtures import FixtureLoader, iter_export_objects, iter_fixture_objects, write_fixture
+from .signals import suppress_profile_creation
+from .idempotency import sweep_expired_keys
+from .metrics import request_metrics, start_request, stop_request
+from .throttling import concurrency_limit, take_token
+from .stock import restock_sold_out
+from .tasks import Worker, requeue_stale, task
+from .events import InProcessBroker, STAFF_CHANNEL, get_broker, restaurant_channel, user_channel
+from .query_plans import booking_queryset, restaurant_queryset
+from .serializers import RoleTokenObtainPairSerializer
+from .views import RestaurantViewSet, VisioniaViewSet
 
 
 class AuthenticationTestCase(TestCase):
@@ -68,3 +117,1878 @@ class VisioniaTestCase(TestCase):
     def test_visinia_creation(self):
         self.assertEqual(self.visinia.name, 'Test Dish')
         self.assertEqual(self.visinia.restaurant, self.restaurant)
+
+
+class BookingCreateTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.owner = User.objects.create_user(username='owner', password='testpass123')
+        self.owner.profile.role = 'RESTAURANT_OWNER'
+        self.owner.profile.save()
+        self.customer = User.objects.create_user(username='customer', password='testpass123')
+
+        self.restaurant = Restaurant.objects.create(
+            owner=self.owner,
+            name='Test Restaurant',
+            address='123 Test St',
+            phone='1234567890'
+        )
+        self.dishes = [
+            Visinia.objects.create(
+                restaurant=self.restaurant,
+                name=f'Dish {index}',
+                description='A delicious test dish',
+                price='2.50'
+            )
+            for index in range(10)
+        ]
+
+    def test_place_booking_stays_within_query_budget(self):
+        items = [{str(dish.id): 2} for dish in self.dishes]
+        with self.assertNumQueries(BOOKING_CREATE_QUERY_BUDGET):
+            booking = place_booking(self.customer, self.restaurant.id, items)
+
+        self.assertEqual(booking.total_price, Decimal('50.00'))
+        self.assertEqual(booking.items.count(), 10)
+
+    def test_create_booking_endpoint(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.post('/api/bookings/', {
+            'restaurant_id': self.restaurant.id,
+            'items': [{str(self.dishes[0].id): 1}, {str(self.dishes[1].id): 3}],
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Decimal(response.data['total_price']), Decimal('10.00'))
+        self.assertEqual(len(response.data['items']), 2)
+
+    def test_unknown_item_rejected_before_any_write(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.post('/api/bookings/', {
+            'restaurant_id': self.restaurant.id,
+            'items': [{str(self.dishes[0].id): 1}, {'999999': 1}],
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_unavailable_item_rejected(self):
+        self.dishes[0].is_available = False
+        self.dishes[0].save()
+        self.client.force_authenticate(self.customer)
+        response = self.client.post('/api/bookings/', {
+            'restaurant_id': self.restaurant.id,
+            'items': [{str(self.dishes[0].id): 1}],
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Booking.objects.exists())
+
+
+class BookingListQueryCountTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.owner = User.objects.create_user(username='owner', password='testpass123')
+        self.owner.profile.role = 'RESTAURANT_OWNER'
+        self.owner.profile.save()
+        self.admin = User.objects.create_user(username='admin', password='testpass123', is_staff=True)
+        self.admin.profile.role = 'ADMIN'
+        self.admin.profile.save()
+        self.customer = User.objects.create_user(username='customer', password='testpass123')
+
+        self.restaurant = Restaurant.objects.create(
+            owner=self.owner,
+            name='Test Restaurant',
+            address='123 Test St',
+            phone='1234567890'
+        )
+        self.dishes = [
+            Visinia.objects.create(
+                restaurant=self.restaurant,
+                name=f'Dish {index}',
+                description='A delicious test dish',
+                price='4.00'
+            )
+            for index in range(3)
+        ]
+
+    def add_bookings(self, count):
+        for _ in range(count):
+            customer = User.objects.create(username=f'customer{User.objects.count()}')
+            place_booking(customer, self.restaurant.id, [{str(dish.id): 1} for dish in self.dishes])
+
+    def count_list_queries(self, user, url):
+        self.client.force_authenticate(user)
+        # Warm the role cache so only the listing itself is counted.
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context)
+
+    def test_query_count_constant_as_bookings_grow(self):
+        for user, url in [
+            (self.owner, '/api/bookings/'),
+            (self.admin, '/api/bookings/'),
+            (self.customer, '/api/bookings/'),
+            (self.customer, '/api/bookings/my_bookings/'),
+        ]:
+            self.add_bookings(2)
+            place_booking(self.customer, self.restaurant.id, [{str(self.dishes[0].id): 1}])
+            small = self.count_list_queries(user, url)
+            self.add_bookings(10)
+            place_booking(self.customer, self.restaurant.id, [{str(self.dishes[0].id): 2}])
+            self.assertEqual(self.count_list_queries(user, url), small, url)
+
+    def test_owner_list_query_count(self):
+        self.add_bookings(20)
+        self.client.force_authenticate(self.owner)
+        self.client.get('/api/bookings/')
+        # Bookings joined to customers and restaurants, items, then the one owner.
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/bookings/')
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(response.data['results'][0]['restaurant']['owner']['username'], self.owner.username)
+
+    def test_role_plans_join_only_what_varies_per_row(self):
+        for quantity in (1, 2, 3):
+            place_booking(self.customer, self.restaurant.id, [{str(self.dishes[0].id): quantity}])
+        self.assertEqual(
+            booking_queryset(self.owner, 'RESTAURANT_OWNER').query.select_related,
+            {'customer': {'profile': {}}, 'restaurant': {}},
+        )
+        self.assertEqual(
+            booking_queryset(self.customer, 'CUSTOMER').query.select_related,
+            {'restaurant': {'owner': {'profile': {}}}},
+        )
+        self.client.force_authenticate(self.customer)
+        self.client.get('/api/bookings/my_bookings/')
+        # Bookings joined to restaurants and owners, items, then the one customer.
+        with self.assertNumQueries(3):
+            results = self.client.get('/api/bookings/my_bookings/').data
+        self.assertEqual(len(results), 3)
+        self.assertEqual({booking['customer']['username'] for booking in results}, {self.customer.username})
+
+
+class PaginationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.owner = User.objects.create_user(username='owner', password='testpass123')
+        self.owner.profile.role = 'RESTAURANT_OWNER'
+        self.owner.profile.save()
+        self.restaurant = Restaurant.objects.create(
+            owner=self.owner,
+            name='Test Restaurant',
+            address='123 Test St',
+            phone='1234567890'
+        )
+        Visinia.objects.bulk_create([
+            Visinia(
+                restaurant=self.restaurant,
+                name=f'Dish {index}',
+                description='A delicious test dish',
+                price='1.00'
+            )
+            for index in range(7)
+        ])
+        self.client.force_authenticate(self.owner)
+
+    def test_cursor_pages_cover_every_row_once(self):
+        seen = []
+        url = '/api/visiinias/?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(sorted(seen), sorted(Visinia.objects.values_list('id', flat=True)))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_sparse_fieldset(self):
+        response = self.client.get('/api/restaurants/?fields=id,name')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name'})
+
+    def test_users_paginate_by_date_joined(self):
+        response = self.client.get('/api/users/?fields=id,username')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0], {'id': self.owner.id, 'username': 'owner'})
+
+    def test_users_filter_by_role(self):
+        User.objects.create_user(username='customer', password='testpass123')
+        response = self.client.get('/api/users/', {'role': 'RESTAURANT_OWNER', 'fields': 'username'})
+        self.assertEqual(response.data['results'], [{'username': 'owner'}])
+
+
+class RoleResolutionTestCase(TestCase):
+    def setUp(self):
+        clear_role_cache()
+        self.client = APIClient()
+        self.owner = User.objects.create_user(username='owner', password='testpass123')
+        self.owner.profile.role = 'RESTAURANT_OWNER'
+        self.owner.profile.save()
+
+    def profile_queries(self, context):
+        return [
+            query for query in context.captured_queries
+            if 'FROM "core_userprofile"' in query['sql'] or 'INTO "core_userprofile"' in query['sql']
+        ]
+
+    def test_token_role_claim_avoids_profile_queries(self):
+        token = RoleTokenObtainPairSerializer.get_token(self.owner).access_token
+        self.assertEqual(token['role'], 'RESTAURANT_OWNER')
+
+        clear_role_cache()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/restaurants/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.profile_queries(context), [])
+
+    def test_cached_role_invalidated_on_profile_save(self):
+        self.client.force_authenticate(self.owner)
+        self.client.get('/api/visiinias/')
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/visiinias/')
+        self.assertEqual(self.profile_queries(context), [])
+
+        self.owner.profile.role = 'CUSTOMER'
+        self.owner.profile.save()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/visiinias/')
+        self.assertEqual(len(self.profile_queries(context)), 1)
+
+
+class MenuCacheTestCase(TestCase):
+    def setUp(self):
+        menu_cache().clear()
+        self.client = APIClient()
+        self.owner = User.objects.create_user(username='owner', password='testpass123')
+        self.customer = User.objects.create_user(username='customer', password='testpass123')
+        self.restaurant = Restaurant.objects.create(
+            owner=self.owner,
+            name='Test Restaurant',
+            address='123 Test St',
+            phone='1234567890'
+        )
+        self.visinia = Visinia.objects.create(
+            restaurant=self.restaurant,
+            name='Test Dish',
+            description='A delicious test dish',
+            price='9.99'
+        )
+        self.url = f'/api/visiinias/by_restaurant/?restaurant_id={self.restaurant.id}'
+        self.client.force_authenticate(self.customer)
+        self.client.get(self.url)
+
+    def test_cached_menu_served_without_queries(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()[0]['name'], 'Test Dish')
+        self.assertTrue(response['ETag'])
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def test_visinia_save_invalidates_menu(self):
+        etag = self.client.get(self.url)['ETag']
+        self.visinia.name = 'Renamed Dish'
+        self.visinia.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()[0]['name'], 'Renamed Dish')
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        clear_role_cache()
+        self.client = APIClient()
+        self.owner = User.objects.create_user(username='owner', password='testpass123')
+        self.customer = User.objects.create_user(username='customer', password='testpass123')
+        self.restaurant = Restaurant.objects.create(
+            owner=self.owner,
+            name='Test Restaurant',
+            address='123 Test St',
+            phone='1234567890'
+        )
+        self.client.force_authenticate(self.customer)
+
+    def test_unchanged_list_costs_one_aggregate_query(self):
+        etag = self.client.get('/api/restaurants/')['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/restaurants/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def test_list_etag_changes_when_rows_change(self):
+        etag = self.client.get('/api/restaurants/')['ETag']
+        Restaurant.objects.create(owner=self.owner, name='Second', address='1 St', phone='1')
+        response = self.client.get('/api/restaurants/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_detail_if_modified_since(self):
+        url = f'/api/restaurants/{self.restaurant.id}/'
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_validators_cover_the_nested_owner(self):
+        url = f'/api/restaurants/{self.restaurant.id}/'
+        list_etag = self.client.get('/api/restaurants/')['ETag']
+        detail_etag = self.client.get(url)['ETag']
+
+        self.owner.email = 'owner@example.com'
+        self.owner.save()
+        response = self.client.get('/api/restaurants/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['owner']['email'], 'owner@example.com')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        detail_etag = response['ETag']
+        UserProfile.objects.get(user=self.owner).save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=detail_etag).status_code, status.HTTP_200_OK)
+
+    def test_missing_detail_still_404(self):
+        response = self.client.get('/api/visiinias/999999/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ImageVariantTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        os.makedirs(os.path.join(self.media_root, 'visiinias'))
+        Image.new('RGBA', (1200, 800), (200, 80, 20, 255)).save(
+            os.path.join(self.media_root, 'visiinias', 'dish.png')
+        )
+        self.owner = User.objects.create_user(username='owner', password='testpass123')
+        self.restaurant = Restaurant.objects.create(
+            owner=self.owner,
+            name='Test Restaurant',
+            address='123 Test St',
+            phone='1234567890'
+        )
+        self.visinia = Visinia.objects.create(
+            restaurant=self.restaurant,
+            name='Test Dish',
+            description='A delicious test dish',
+            price='9.99',
+            image='visiinias/dish.png'
+        )
+        self.client = APIClient()
+
+    def test_variant_redirect_and_immutable_media(self):
+        response = self.client.get(
+            f'/api/visiinias/{self.visinia.id}/image_file/?w=160', HTTP_ACCEPT='image/webp,*/*'
+        )
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertRegex(response['Location'], r'/media/visiinias/dish\.w160\.[0-9a-f]{12}\.webp$')
+
+        media = self.client.get(response['Location'])
+        self.assertEqual(media.status_code, status.HTTP_200_OK)
+        self.assertIn('immutable', media['Cache-Control'])
+        with Image.open(io.BytesIO(b''.join(media.streaming_content))) as variant:
+            self.assertEqual(variant.size, (160, 107))
+
+    def test_unsupported_width_rejected(self):
+        response = self.client.get(f'/api/visiinias/{self.visinia.id}/image_file/?w=123')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MediaDeliveryTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        os.makedirs(os.path.join(self.media_root, 'restaurants'))
+        # A PNG saved under a .jpeg name, like the bundled logos.
+        Image.new('RGB', (64, 64), (10, 120, 30)).save(
+            os.path.join(self.media_root, 'restaurants', 'logo.png.jpeg'), 'PNG'
+        )
+        self.owner = User.objects.create_user(username='owner', password='testpass123')
+        self.restaurant = Restaurant.objects.create(
+            owner=self.owner,
+            name='Test Restaurant',
+            address='123 Test St',
+            phone='1234567890',
+            logo='restaurants/logo.png.jpeg'
+        )
+        self.url = f'/api/restaurants/{self.restaurant.id}/logo_file/'
+        self.client = APIClient()
+
+    def test_sniffed_content_type_and_validators(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('max-age', response['Cache-Control'])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_byte_range(self):
+        size = os.path.getsize(os.path.join(self.media_root, 'restaurants', 'logo.png.jpeg'))
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-7')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), b'\x89PNG\r\n\x1a\n')
+        self.assertEqual(response['Content-Range'], f'bytes 0-7/{size}')
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={size}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    @override_settings(MEDIA_OFFLOAD='x-accel', MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_x_accel_offload(self):
+        response = self.client.get('/media/restaurants/logo.png.jpeg')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/restaurants/logo.png.jpeg')
+        self.assertEqual(response.content, b'')
+
+        shutil.copy(
+            os.path.join(self.media_root, 'restaurants', 'logo.png.jpeg'),
+            os.path.join(self.media_root, 'restaurants', 'café 100%?.jpeg'),
+        )
+        response = self.client.get('/media/restaurants/caf%C3%A9%20100%25%3F.jpeg')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/restaurants/caf%C3%A9%20100%25%3F.jpeg')
+
+    async def test_async_range_keeps_file_io_off_the_event_loop(self):
+        loop_thread = threading.get_ident()
+        calls = []
+
+        class RecordingFile(io.BytesIO):
+            def seek(self, *args):
+                calls.append(('seek', threading.get_ident()))
+                return super().seek(*args)
+
+            def close(self):
+                calls.append(('close', threading.get_ident()))
+                super().close()
+
+        storage = SimpleNamespace(open=lambda name, mode: RecordingFile(b'0123456789'))
+        body = b''.join([chunk async for chunk in _aiter_range(storage, 'file', 2, 5)])
+        self.assertEqual(body, b'23456')
+        self.assertEqual([name for name, _ in calls], ['seek', 'close'])
+        self.assertNotIn(loop_thread, [thread for _, thread in calls])
+
+    def test_media_route_rejects_traversal(self):
+        response = self.client.get('/media/../manage.py')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BenchmarkTestCase(TestCase):
+    def test_scenarios_produce_report(self):
+        dataset = generate_dataset(restaurants=2, items=4, bookings=10, customers=3)
+        runner = ScenarioRunner(dataset)
+        report = runner.report(runner.run(iterations=3))
+
+        self.assertEqual(
+            set(report['endpoints']),
+            {'restaurant-list', 'visinia-by-restaurant', 'booking-create', 'booking-list', 'booking-confirm'},
+        )
+        self.assertEqual(report['total']['requests'], 15)
+        for stats in report['endpoints'].values():
+            self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+        self.assertEqual(Booking.objects.count(), 13)
+
+
+class ServeConnectionWarmupTestCase(TestCase):
+    def test_each_request_thread_opens_its_connection(self):
+        opened = set()
+        with ThreadPoolExecutor(max_workers=3) as pool, mock.patch(
+            'core.management.commands.serve.open_connections', side_effect=lambda: opened.add(threading.get_ident())
+        ):
+            open_request_connections(SimpleNamespace(tpool=pool, cfg=SimpleNamespace(threads=3)))
+        self.assertEqual(len(opened), 3)
+        self.assertNotIn(threading.get_ident(), opened)
+
+    def test_asgi_workers_close_connections_per_request(self):
+        max_age = connection.settings_dict['CONN_MAX_AGE']
+        self.addCleanup(connection.settings_dict.__setitem__, 'CONN_MAX_AGE', max_age)
+        connection.settings_dict['CONN_MAX_AGE'] = 600
+        close_connections_per_request(SimpleNamespace())
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], 0)
+
+
+class QueryPlanIndexTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = generate_dataset(restaurants=40, items=25, bookings=4000, customers=200)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertNoSequentialScan(self, queryset):
+        self.assertEqual(sequential_scans(queryset), [], queryset.explain())
+
+    def test_helper_detects_sequential_scan(self):
+        self.assertEqual(sequential_scans(Visinia.objects.filter(description='rice platter')), ['core_visinia'])
+
+    def test_hot_queries_use_indexes(self):
+        owner = self.dataset['owners'][0]
+        customer = self.dataset['customers'][0]
+        restaurant = self.dataset['restaurants'][0]
+        page = slice(0, 51)
+        ordering = ('-created_at', '-id')
+
+        self.assertNoSequentialScan(
+            Visinia.objects.filter(restaurant_id=restaurant.id, is_available=True)
+        )
+        self.assertNoSequentialScan(Visinia.objects.filter(restaurant__owner=owner).order_by(*ordering)[page])
+        self.assertNoSequentialScan(booking_queryset(customer, 'CUSTOMER').order_by(*ordering)[page])
+        self.assertNoSequentialScan(booking_queryset(owner, 'RESTAURANT_OWNER').order_by(*ordering)[page])
+        self.assertNoSequentialScan(
+            Booking.objects.filter(restaurant=restaurant, status='PENDING').order_by(*ordering)[page]
+        )
+        self.assertNoSequentialScan(restaurant_queryset(is_active=True).order_by(*ordering)[page])
+
+
+class RestaurantStatsTestCase(TestCase):
+    def setUp(self):
+        clear_role_cache()
+        self.client = APIClient()
+        self.owner = User.objects.create_user(username='owner', password='testpass123')
+        self.owner.profile.role = 'RESTAURANT_OWNER'
+        self.owner.profile.save()
+        self.customer = User.objects.create_user(username='customer', password='testpass123')
+        self.restaurant = Restaurant.objects.create(
+            owner=self.owner,
+            name='Test Restaurant',
+            address='123 Test St',
+            phone='1234567890'
+        )
+        self.rice = Visinia.objects.create(
+            restaurant=self.restaurant, name='Rice', description='Rice', price='3.00'
+        )
+        self.fish = Visinia.objects.create(
+            restaurant=self.restaurant, name='Fish', description='Fish', price='5.00'
+        )
+
+    def stats(self):
+        self.client.force_authenticate(self.owner)
+        response = self.client.get(f'/api/restaurants/{self.restaurant.id}/stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_counters_follow_create_and_status_changes(self):
+        first = place_booking(self.customer, self.restaurant.id, [{str(self.rice.id): 2}, {str(self.fish.id): 1}])
+        second = place_booking(self.customer, self.restaurant.id, [{str(self.fish.id): 3}])
+
+        self.client.force_authenticate(self.owner)
+        self.client.post(f'/api/bookings/{first.id}/confirm/')
+        self.client.force_authenticate(self.customer)
+        self.client.post(f'/api/bookings/{second.id}/cancel/')
+
+        data = self.stats()
+        totals = data['totals']
+        self.assertEqual(totals['booking_count'], 2)
+        self.assertEqual(totals['pending_count'], 0)
+        self.assertEqual(totals['confirmed_count'], 1)
+        self.assertEqual(totals['cancelled_count'], 1)
+        self.assertEqual(Decimal(totals['revenue']), Decimal('11.00'))
+        self.assertEqual(
+            {item['visinia_name']: item['quantity'] for item in data['items']},
+            {'Rice': 2, 'Fish': 1},
+        )
+
+        rebuild_restaurant_stats()
+        self.assertEqual(self.stats()['totals'], totals)
+
+    def test_customers_cannot_read_stats(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.get(f'/api/restaurants/{self.restaurant.id}/stats/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class BookingExportTestCase(TestCase):
+    def setUp(self):
+        clear_role_cache()
+        self.client = APIClient()
+        self.owner = User.objects.create_user(username='owner', password='testpass123')
+        self.owner.profile.role = 'RESTAURANT_OWNER'
+        self.owner.profile.save()
+        self.other_owner = User.objects.create(username='other_owner')
+        self.customer = User.objects.create(username='customer')
+        self.restaurant = Restaurant.objects.create(
+            owner=self.owner, name='Mine', address='123 Test St', phone='1234567890'
+        )
+        other = Restaurant.objects.create(
+            owner=self.other_owner, name='Theirs', address='1 St', phone='1'
+        )
+        rice = Visinia.objects.create(restaurant=self.restaurant, name='Rice', description='Rice', price='3.00')
+        fish = Visinia.objects.create(restaurant=self.restaurant, name='Fish', description='Fish', price='5.00')
+        soup = Visinia.objects.create(restaurant=other, name='Soup', description='Soup', price='2.00')
+        for _ in range(3):
+            place_booking(self.customer, self.restaurant.id, [{str(rice.id): 1}, {str(fish.id): 2}])
+        self.cancelled = place_booking(self.customer, self.restaurant.id, [{str(rice.id): 1}])
+        Booking.objects.filter(pk=self.cancelled.pk).update(status='CANCELLED')
+        place_booking(self.customer, other.id, [{str(soup.id): 1}])
+        self.client.force_authenticate(self.owner)
+
+    def test_csv_export_is_scoped_to_owner(self):
+        response = self.client.get('/api/bookings/export/?format=csv')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 7)
+        self.assertEqual({row['restaurant'] for row in rows}, {'Mine'})
+
+    def test_ndjson_export_with_status_filter_and_small_chunks(self):
+        response = self.client.get('/api/bookings/export/?format=ndjson&status=cancelled')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([record['booking_id'] for record in records], [self.cancelled.id])
+        self.assertEqual(records[0]['quantity'], 1)
+
+    def test_keyset_batches_cover_every_row(self):
+        bookings = Booking.objects.filter(restaurant=self.restaurant)
+        self.assertEqual(
+            list(iter_booking_rows(bookings, chunk_size=2)),
+            list(iter_booking_rows(bookings, chunk_size=100)),
+        )
+
+    def test_invalid_date_rejected(self):
+        response = self.client.get('/api/bookings/export/?format=csv&from=yesterday')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkFixtureTestCase(TestCase):
+    # Children before parents and users referenced by username, as dumpdata
+    # --natural-foreign produces for this schema.
+    FIXTURE = [
+        {'model': 'contenttypes.contenttype', 'fields': {'app_label': 'core', 'model': 'booking'}},
+        {'model': 'core.bookingitem', 'pk': 7, 'fields': {'booking': 5, 'visinia': 3, 'quantity': 2, 'price': '4.50'}},
+        {'model': 'core.visinia', 'pk': 3, 'fields': {
+            'restaurant': 2, 'name': 'Pilau', 'description': 'rice', 'price': '4.50', 'image': '',
+            'is_available': True, 'created_at': '2026-02-10T09:33:06.854Z', 'updated_at': '2026-02-10T09:33:06.854Z',
+        }},
+        {'model': 'core.booking', 'pk': 5, 'fields': {
+            'customer': ['fixture_customer'], 'restaurant': 2, 'status': 'CONFIRMED', 'total_price': '9.00',
+            'notes': '', 'created_at': '2026-02-11T16:50:22.051Z', 'updated_at': '2026-02-12T05:27:06.784Z',
+        }},
+        {'model': 'core.restaurant', 'pk': 2, 'fields': {
+            'owner': ['fixture_owner'], 'name': 'Fixture Grill', 'description': '', 'address': 'x', 'phone': '1',
+            'logo': '', 'is_active': True, 'created_at': '2026-02-08T11:43:35.180Z', 'updated_at': '2026-02-08T11:43:35.180Z',
+        }},
+        {'model': 'core.userprofile', 'pk': 9, 'fields': {
+            'user': ['fixture_owner'], 'role': 'RESTAURANT_OWNER', 'phone': '', 'avatar': '',
+            'created_at': '2026-02-08T11:11:34.653Z', 'updated_at': '2026-02-08T11:11:34.653Z',
+        }},
+        {'model': 'auth.user', 'fields': {
+            'password': '!', 'username': 'fixture_owner', 'email': '', 'is_active': True,
+            'date_joined': '2026-01-17T07:51:18.566Z', 'groups': [], 'user_permissions': [],
+        }},
+        {'model': 'auth.user', 'fields': {
+            'password': '!', 'username': 'fixture_customer', 'email': '', 'is_active': True,
+            'date_joined': '2026-01-19T07:19:05.031Z', 'groups': [], 'user_permissions': [],
+        }},
+    ]
+
+    def load(self, objects, batch_size=2):
+        loader = FixtureLoader(batch_size=batch_size)
+        counts = loader.load(objects)
+        loader.finish()
+        return loader, counts
+
+    def test_stream_parser_matches_json_load(self):
+        text = json.dumps(self.FIXTURE, indent=2)
+        self.assertEqual(list(iter_fixture_objects(io.StringIO(text), read_size=7)), self.FIXTURE)
+        with self.assertRaises(ValueError):
+            list(iter_fixture_objects(io.StringIO(text[:-40]), read_size=7))
+
+    def test_import_resolves_natural_keys_in_any_order(self):
+        loader, counts = self.load(self.FIXTURE)
+        self.assertEqual(counts['core.bookingitem'], 1)
+        self.assertEqual(loader.skipped, {'contenttypes.contenttype': 1})
+
+        booking = Booking.objects.select_related('customer', 'restaurant__owner').get(pk=5)
+        self.assertEqual(booking.customer.username, 'fixture_customer')
+        self.assertEqual(booking.restaurant.owner.profile.role, 'RESTAURANT_OWNER')
+        self.assertEqual(booking.created_at.isoformat(), '2026-02-11T16:50:22.051000+00:00')
+        # No signal ran, so the customer gets the default profile afterwards.
+        self.assertEqual(UserProfile.objects.get(user=booking.customer).role, 'CUSTOMER')
+        self.assertEqual(RestaurantStats.objects.get(restaurant_id=2).confirmed_count, 1)
+
+        # Sequences continue past the imported primary keys.
+        restaurant = Restaurant.objects.create(owner=booking.customer, name='New', address='x', phone='1')
+        self.assertGreater(restaurant.pk, 2)
+
+    def test_unknown_user_aborts(self):
+        with self.assertRaises(ValueError), transaction.atomic():
+            self.load([record for record in self.FIXTURE if record['model'] != 'auth.user'])
+
+    def test_export_round_trip(self):
+        self.load(self.FIXTURE)
+        stream = io.StringIO()
+        write_fixture(stream, iter_export_objects())
+        exported = json.loads(stream.getvalue())
+        self.assertEqual([obj['model'] for obj in exported].count('core.userprofile'), 2)
+
+        Booking.objects.all().delete()
+        Restaurant.objects.all().delete()
+        User.objects.all().delete()
+        self.load(iter_fixture_objects(io.StringIO(stream.getvalue())), batch_size=100)
+        self.assertEqual(Booking.objects.get(pk=5).items.get().quantity, 2)
+
+    def test_profile_signal_suppression(self):
+        with suppress_profile_creation():
+            user = User.objects.create(username='no_profile')
+        self.assertFalse(UserProfile.objects.filter(user=user).exists())
+        self.assertTrue(UserProfile.objects.filter(user=User.objects.create(username='with_profile')).exists())
+
+
+class VisiniaSearchTestCase(TestCase):
+    def setUp(self):
+        clear_role_cache()
+        self.client = APIClient()
+        self.customer = User.objects.create(username='hungry')
+        self.client.force_authenticate(self.customer)
+        owner = User.objects.create(username='search_owner')
+        self.grill = Restaurant.objects.create(owner=owner, name='Grill', address='x', phone='1')
+        self.cafe = Restaurant.objects.create(owner=owner, name='Cafe', address='x', phone='1')
+        closed = Restaurant.objects.create(owner=owner, name='Closed', address='x', phone='1', is_active=False)
+
+        def dish(restaurant, name, description, price, **extra):
+            return Visinia.objects.create(
+                restaurant=restaurant, name=name, description=description, price=price, **extra
+            )
+
+        self.biriyani = dish(self.grill, 'Chicken Biriyani', 'spiced rice', '12.00')
+        self.platter = dish(self.cafe, 'Family platter', 'chips with a side of biriyani', '30.00')
+        dish(self.grill, 'Seafood Biriyani', 'prawns', '25.00', is_available=False)
+        dish(closed, 'Biriyani Special', 'rice', '10.00')
+        for index in range(5):
+            dish(self.cafe, f'Chips {index}', 'salted chips', '3.00')
+
+    def search(self, query):
+        response = self.client.get('/api/visiinias/search/', query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_name_matches_rank_first_and_hidden_items_excluded(self):
+        results = self.search({'q': 'biriyani'})['results']
+        self.assertEqual([row['id'] for row in results], [self.biriyani.id, self.platter.id])
+        self.assertEqual(results[0]['restaurant_name'], 'Grill')
+        # Prefix matching for search-as-you-type.
+        self.assertEqual(len(self.search({'q': 'biri'})['results']), 2)
+
+    def test_price_and_restaurant_filters(self):
+        self.assertEqual(
+            [row['id'] for row in self.search({'q': 'biriyani', 'max_price': '20'})['results']], [self.biriyani.id]
+        )
+        self.assertEqual(
+            [row['id'] for row in self.search({'q': 'biriyani', 'restaurant_id': self.cafe.id})['results']],
+            [self.platter.id],
+        )
+        response = self.client.get('/api/visiinias/search/', {'q': 'rice', 'min_price': '9', 'max_price': '1'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/visiinias/search/', {'q': '"*'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_index_follows_edits(self):
+        self.biriyani.name = 'Chicken Pilau'
+        self.biriyani.save()
+        self.assertEqual([row['id'] for row in self.search({'q': 'pilau'})['results']], [self.biriyani.id])
+        self.platter.delete()
+        self.assertEqual(self.search({'q': 'biriyani'})['results'], [])
+
+    def test_tied_ranks_paginate_without_repeats(self):
+        page = self.search({'q': 'chips', 'page_size': 2})
+        seen = [row['id'] for row in page['results']]
+        while page['next']:
+            page = self.client.get(page['next']).json()
+            seen += [row['id'] for row in page['results']]
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(len(set(seen)), 6)
+
+        previous = self.client.get(page['previous']).json()
+        self.assertEqual([row['id'] for row in previous['results']], seen[2:4])
+
+
+class IdempotentBookingTestCase(TestCase):
+    def setUp(self):
+        clear_role_cache()
+        self.client = APIClient()
+        self.customer = User.objects.create(username='retrying_customer')
+        self.client.force_authenticate(self.customer)
+        owner = User.objects.create(username='idem_owner')
+        self.restaurant = Restaurant.objects.create(owner=owner, name='Idem', address='x', phone='1')
+        self.dish = Visinia.objects.create(restaurant=self.restaurant, name='Pilau', description='rice', price='4.00')
+        self.payload = {'restaurant_id': self.restaurant.id, 'items': [{str(self.dish.id): 2}]}
+
+    def post(self, payload=None, key='order-1'):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post('/api/bookings/', payload or self.payload, format='json', **headers)
+
+    def test_retry_replays_first_response(self):
+        first = self.post()
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.post()
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertFalse(any('INSERT INTO "core_booking"' in query['sql'] for query in queries))
+
+        # Other users and other keys are independent.
+        self.assertEqual(self.post(key='order-2').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.post(key=None).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Booking.objects.count(), 3)
+
+    def test_key_reused_for_different_request(self):
+        self.post()
+        other = {'restaurant_id': self.restaurant.id, 'items': [{str(self.dish.id): 5}]}
+        self.assertEqual(self.post(other).status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(self.post(key='x' * 256).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_failed_request_releases_key(self):
+        bad = {'restaurant_id': self.restaurant.id, 'items': [{'999999': 1}]}
+        self.assertEqual(self.post(bad).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.post(bad).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_duplicate_waits_for_in_flight_original(self):
+        original = self.post(key='warm-up')
+        record = IdempotencyKey.objects.get(key='warm-up')
+        IdempotencyKey.objects.create(
+            user=self.customer, key='order-1', fingerprint=record.fingerprint, locked_at=timezone.now()
+        )
+
+        def original_finishes(seconds):
+            IdempotencyKey.objects.filter(key='order-1').update(response_status=201, response_body=original.json())
+
+        with override_settings(IDEMPOTENCY_WAIT=5), mock.patch('core.idempotency.time.sleep', original_finishes):
+            retry = self.post()
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.json()['id'], original.json()['id'])
+        self.assertEqual(Booking.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_WAIT=0)
+    def test_in_flight_conflict_and_stale_takeover(self):
+        self.post(key='warm-up')
+        fingerprint = IdempotencyKey.objects.get(key='warm-up').fingerprint
+        record = IdempotencyKey.objects.create(
+            user=self.customer, key='order-1', fingerprint=fingerprint, locked_at=timezone.now()
+        )
+        busy = self.post()
+        self.assertEqual(busy.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(busy['Retry-After'], '1')
+
+        IdempotencyKey.objects.filter(pk=record.pk).update(locked_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self.post().status_code, status.HTTP_201_CREATED)
+        self.assertEqual(IdempotencyKey.objects.get(pk=record.pk).response_status, 201)
+
+    def test_expired_keys_are_swept_and_reusable(self):
+        self.post()
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(self.post().status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Booking.objects.count(), 2)
+
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.post(key='fresh')
+        self.assertEqual(sweep_expired_keys(), 1)
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['fresh'])
+
+
+@override_settings(SSE_HEARTBEAT=0.2)
+class BookingEventsTestCase(TestCase):
+    def setUp(self):
+        clear_role_cache()
+        self.owner = User.objects.create(username='events_owner')
+        self.other_owner = User.objects.create(username='events_other_owner')
+        UserProfile.objects.filter(user__in=[self.owner, self.other_owner]).update(role='RESTAURANT_OWNER')
+        self.customer = User.objects.create(username='events_customer')
+        self.restaurant = Restaurant.objects.create(owner=self.owner, name='Live', address='x', phone='1')
+        Restaurant.objects.create(owner=self.other_owner, name='Elsewhere', address='y', phone='2')
+        self.dish = Visinia.objects.create(restaurant=self.restaurant, name='Mandazi', description='', price='1.50')
+
+    def token(self, user):
+        return str(RoleTokenObtainPairSerializer.get_token(user).access_token)
+
+    def ticket(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token(user)}')
+        response = client.post('/api/bookings/events/ticket/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['ticket']
+
+    def place(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return place_booking(self.customer, self.restaurant.id, [{str(self.dish.id): 2}])
+
+    async def open_stream(self, user):
+        ticket = await sync_to_async(self.ticket)(user)
+        response = await self.async_client.get('/api/bookings/events/', {'ticket': ticket})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        # The retry hint comes after the subscription is registered.
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))
+        return stream
+
+    async def test_owner_and_customer_receive_events(self):
+        owner_stream = await self.open_stream(self.owner)
+        customer_stream = await self.open_stream(self.customer)
+        other_stream = await self.open_stream(self.other_owner)
+
+        booking = await sync_to_async(self.place)()
+        for stream in (owner_stream, customer_stream):
+            frame = (await asyncio.wait_for(anext(stream), 2)).decode()
+            event, data = frame.strip().split('\n')
+            self.assertEqual(event, 'event: booking.created')
+            payload = json.loads(data.removeprefix('data: '))
+            self.assertEqual(payload['booking_id'], booking.id)
+            self.assertEqual(payload['status'], 'PENDING')
+        # Another restaurant's owner only gets heartbeats.
+        self.assertEqual(await asyncio.wait_for(anext(other_stream), 2), b': keep-alive\n\n')
+
+    async def test_status_change_is_pushed(self):
+        booking = await sync_to_async(self.place)()
+        stream = await self.open_stream(self.customer)
+
+        def confirm():
+            client = APIClient()
+            client.force_authenticate(self.owner)
+            with self.captureOnCommitCallbacks(execute=True):
+                return client.post(f'/api/bookings/{booking.id}/confirm/')
+        response = await sync_to_async(confirm)()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        frame = (await asyncio.wait_for(anext(stream), 2)).decode()
+        self.assertIn('event: booking.status', frame)
+        self.assertIn('"old_status": "PENDING"', frame)
+
+    def test_requires_asgi_and_ticket(self):
+        self.assertEqual(
+            self.client.get('/api/bookings/events/', {'ticket': self.ticket(self.owner)}).status_code,
+            status.HTTP_501_NOT_IMPLEMENTED
+        )
+        self.assertEqual(self.client.post('/api/bookings/events/ticket/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_rejects_missing_invalid_or_expired_ticket(self):
+        ticket = await sync_to_async(self.ticket)(self.owner)
+        token = await sync_to_async(self.token)(self.owner)
+        # Access tokens no longer travel in the query string.
+        for params in ({}, {'ticket': 'not-a-ticket'}, {'ticket': ticket[:-2]}, {'token': token}):
+            response = await self.async_client.get('/api/bookings/events/', params)
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED, params)
+        with override_settings(SSE_TICKET_TTL=-1):
+            response = await self.async_client.get('/api/bookings/events/', {'ticket': ticket})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_bearer_header_still_accepted(self):
+        token = await sync_to_async(self.token)(self.customer)
+        response = await self.async_client.get('/api/bookings/events/', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue((await anext(aiter(response.streaming_content))).startswith(b'retry:'))
+
+    async def test_broker_fan_out_and_unsubscribe(self):
+        broker = InProcessBroker()
+        staff = broker.subscribe([STAFF_CHANNEL])
+        customer = broker.subscribe([user_channel(1)])
+        message = {'event': 'booking.created', 'data': {}}
+        self.assertEqual(broker.publish([restaurant_channel(1), user_channel(1), STAFF_CHANNEL], message), 2)
+        self.assertEqual(await staff.get(timeout=1), message)
+        self.assertEqual(await customer.get(timeout=1), message)
+        self.assertIsNone(await customer.get(timeout=0.01))
+        customer.close()
+        staff.close()
+        self.assertEqual(broker.publish([user_channel(1), STAFF_CHANNEL], message), 0)
+        self.assertIsInstance(get_broker(), InProcessBroker)
+
+
+class ASGIURLconfHandler(AsyncClientHandler):
+    """Route like the ASGI server does, through settings.ASGI_URLCONF"""
+
+    async def get_response_async(self, request):
+        request.urlconf = settings.ASGI_URLCONF
+        return await super().get_response_async(request)
+
+
+class AsyncReadViewsTestCase(TestCase):
+    def setUp(self):
+        clear_role_cache()
+        menu_cache().clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(self.media_root, 'restaurants'))
+        Image.new('RGB', (64, 64), (10, 120, 30)).save(os.path.join(self.media_root, 'restaurants', 'logo.png'))
+
+        self.owner = User.objects.create(username='async_owner')
+        UserProfile.objects.filter(user=self.owner).update(role='RESTAURANT_OWNER')
+        self.customer = User.objects.create(username='async_customer')
+        self.restaurants = [
+            Restaurant.objects.create(
+                owner=self.owner, name=f'Async {index}', address='x', phone='1',
+                logo='restaurants/logo.png' if index == 0 else '',
+            )
+            for index in range(3)
+        ]
+        self.closed = Restaurant.objects.create(owner=self.owner, name='Closed', address='x', phone='1', is_active=False)
+        self.dish = Visinia.objects.create(restaurant=self.restaurants[0], name='Chapati', description='', price='1.00')
+        Visinia.objects.create(restaurant=self.restaurants[0], name='Sold out', description='', price='2.00', is_available=False)
+
+        self.asgi = AsyncClient()
+        self.asgi.handler = ASGIURLconfHandler(enforce_csrf_checks=False)
+
+    def auth(self, user):
+        token = RoleTokenObtainPairSerializer.get_token(user).access_token
+        return {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def body(self, response):
+        if not response.streaming:
+            return response.content
+
+        async def consume():
+            return b''.join([chunk async for chunk in response.streaming_content])
+        return async_to_sync(consume)() if response.is_async else b''.join(response.streaming_content)
+
+    def asgi_call(self, method, path, *args, **extra):
+        # AsyncClient takes real header names rather than META keys.
+        headers = {key[5:].replace('_', '-'): value for key, value in extra.items()}
+        return async_to_sync(getattr(self.asgi, method))(path, *args, headers=headers)
+
+    def fetch(self, path, user=None, **headers):
+        """(sync, async) responses for the same request, each starting from a cold menu cache"""
+        if user is not None:
+            headers.update(self.auth(user))
+        menu_cache().clear()
+        sync = APIClient().get(path, **headers)
+        menu_cache().clear()
+        return sync, self.asgi_call('get', path, **headers)
+
+    def assertSameResponse(self, path, user=None, **headers):
+        sync, asynchronous = self.fetch(path, user, **headers)
+        self.assertEqual(asynchronous.status_code, sync.status_code, path)
+        for header in ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control', 'WWW-Authenticate', 'Content-Range'):
+            self.assertEqual(asynchronous.get(header), sync.get(header), f'{path} {header}')
+        self.assertEqual(self.body(asynchronous), self.body(sync), path)
+        return asynchronous
+
+    def test_json_reads_match_sync_api(self):
+        for user in (self.customer, self.owner):
+            for path in (
+                '/api/restaurants/',
+                f'/api/restaurants/{self.restaurants[1].id}/',
+                f'/api/restaurants/{self.closed.id}/',
+                f'/api/visiinias/by_restaurant/?restaurant_id={self.restaurants[0].id}',
+                f'/api/visiinias/by_restaurant/?restaurant_id={self.restaurants[0].id}&fields=name,price',
+                '/api/visiinias/by_restaurant/',
+                '/api/visiinias/by_restaurant/?restaurant_id=abc',
+            ):
+                self.assertSameResponse(path, user)
+
+            path = '/api/restaurants/?page_size=1'
+            while path:
+                path = json.loads(self.assertSameResponse(path, user).content)['next']
+
+    def test_served_without_the_sync_views(self):
+        refuse = mock.Mock(side_effect=AssertionError('sync view called'))
+        with mock.patch.object(RestaurantViewSet, 'list', refuse), \
+                mock.patch.object(RestaurantViewSet, 'retrieve', refuse), \
+                mock.patch.object(VisioniaViewSet, 'by_restaurant', refuse):
+            for path in (
+                '/api/restaurants/',
+                f'/api/restaurants/{self.restaurants[0].id}/',
+                f'/api/visiinias/by_restaurant/?restaurant_id={self.restaurants[0].id}',
+            ):
+                response = self.asgi_call('get', path, **self.auth(self.customer))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.asgi_call('get', f'/api/restaurants/{self.restaurants[0].id}/logo_file/')
+        self.assertTrue(response.is_async)
+
+    def test_validators_and_auth_errors(self):
+        response = self.assertSameResponse('/api/restaurants/', self.customer)
+        self.assertSameResponse('/api/restaurants/', self.customer, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(self.fetch('/api/restaurants/', self.customer, HTTP_IF_NONE_MATCH=response['ETag'])[1].status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+        self.assertSameResponse('/api/restaurants/')
+        self.assertSameResponse('/api/restaurants/', HTTP_AUTHORIZATION='Bearer not-a-jwt')
+        self.assertSameResponse(f'/api/restaurants/{self.restaurants[0].id}/logo_file/', HTTP_AUTHORIZATION='Bearer x y')
+
+    def test_image_streaming_matches_sync_api(self):
+        logo = f'/api/restaurants/{self.restaurants[0].id}/logo_file/'
+        response = self.assertSameResponse(logo)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertSameResponse(logo, HTTP_RANGE='bytes=0-7')
+        self.assertSameResponse(logo, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertSameResponse(f'{logo}?w=123')
+        self.assertSameResponse(f'/api/restaurants/{self.restaurants[1].id}/logo_file/')
+        self.assertSameResponse(f'/api/visiinias/{self.dish.id}/image_file/')
+        self.assertSameResponse('/api/visiinias/999999/image_file/')
+
+    def test_writes_fall_through_to_sync_api(self):
+        payload = json.dumps({'name': 'New', 'address': 'x', 'phone': '1', 'owner_id': self.owner.id})
+        response = async_to_sync(self.asgi.post)(
+            '/api/restaurants/', payload, content_type='application/json',
+            headers={'Authorization': self.auth(self.customer)['HTTP_AUTHORIZATION']},
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(json.loads(response.content)['detail'], 'Only admin/staff can add restaurants.')
+
+
+class ClaimsAuthenticationTestCase(TestCase):
+    def setUp(self):
+        clear_role_cache()
+        cache.clear()
+        self.client = APIClient()
+        self.owner = User.objects.create_user(username='claims_owner', password='testpass123', email='o@example.com')
+        UserProfile.objects.filter(user=self.owner).update(role='RESTAURANT_OWNER')
+        Restaurant.objects.create(owner=self.owner, name='Claims', address='x', phone='1')
+
+    def login(self):
+        response = self.client.post('/api/token/', {'username': 'claims_owner', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def user_queries(self, context):
+        return [query for query in context.captured_queries if 'FROM "auth_user"' in query['sql']]
+
+    def test_request_skips_user_lookup(self):
+        tokens = self.login()
+        self.assertEqual(len(tokens['access'].split('.')), 3)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/restaurants/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['name'], 'Claims')
+        self.assertEqual(self.user_queries(context), [])
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.data['email'], 'o@example.com')
+        self.assertEqual(len(self.user_queries(context)), 1)
+
+    def test_role_or_staff_change_outdates_token(self):
+        access = self.login()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.get('/api/restaurants/').status_code, status.HTTP_200_OK)
+
+        profile = self.owner.profile
+        profile.role = 'CUSTOMER'
+        profile.save()
+        response = self.client.get('/api/restaurants/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data['code'], 'token_outdated')
+
+        access = self.login()['access']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.get('/api/restaurants/').status_code, status.HTTP_200_OK)
+        self.owner.is_staff = True
+        self.owner.save()
+        self.assertEqual(self.client.get('/api/restaurants/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.owner.delete()
+        response = self.client.get('/api/restaurants/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIsNone(current_auth_version(self.owner.pk))
+
+    def test_refresh_reissues_current_claims(self):
+        tokens = self.login()
+        profile = self.owner.profile
+        profile.role = 'ADMIN'
+        profile.save()
+        self.owner.is_staff = True
+        self.owner.save()
+
+        response = self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        access = AccessToken(response.data['access'])
+        self.assertEqual((access['role'], access['is_staff']), ('ADMIN', True))
+        self.assertEqual(access[AUTH_VERSION_CLAIM], current_auth_version(self.owner.pk))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(self.client.get('/api/users/me/').data['is_staff'], True)
+
+    def test_tokens_without_claims_use_the_database(self):
+        access = AccessToken.for_user(self.owner)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/restaurants/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(self.user_queries(context)), 1)
+
+
+class RequestMetricsTestCase(TestCase):
+    def setUp(self):
+        clear_role_cache()
+        menu_cache().clear()
+        request_metrics.reset()
+        self.staff = User.objects.create(username='metrics_staff', is_staff=True)
+        self.customer = User.objects.create(username='metrics_customer')
+        owner = User.objects.create(username='metrics_owner')
+        self.restaurant = Restaurant.objects.create(owner=owner, name='Measured', address='x', phone='1')
+        Visinia.objects.create(restaurant=self.restaurant, name='Ugali', description='', price='1.00')
+        self.client = APIClient()
+
+    def scrape(self):
+        self.client.force_authenticate(self.staff)
+        response = self.client.get('/api/_metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_records_per_endpoint(self):
+        self.client.force_authenticate(self.customer)
+        path = f'/api/visiinias/by_restaurant/?restaurant_id={self.restaurant.id}'
+        for _ in range(2):
+            self.assertEqual(self.client.get(path).status_code, status.HTTP_200_OK)
+        self.client.get('/api/no-such-endpoint/')
+
+        text = self.scrape()
+        labels = 'endpoint="visinia-by-restaurant",method="GET"'
+        self.assertIn(f'kisinia_requests_total{{{labels},status="200"}} 2', text)
+        self.assertIn(f'kisinia_request_duration_seconds_count{{{labels}}} 2', text)
+        self.assertIn(f'kisinia_request_queries_bucket{{{labels},le="+Inf"}} 2', text)
+        # The second read is served from the menu cache without a query.
+        self.assertIn(f'kisinia_request_queries_bucket{{{labels},le="0"}} 1', text)
+        self.assertIn(f'kisinia_request_queries_sum{{{labels}}} 1', text)
+        self.assertIn(f'kisinia_response_bytes_count{{{labels}}} 2', text)
+        self.assertIn('kisinia_requests_total{endpoint="<unresolved>",method="GET",status="404"} 1', text)
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get('/api/_metrics').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get('/api/_metrics/').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_duplicate_queries(self):
+        log, token, _ = start_request()
+        try:
+            for _ in range(3):
+                list(Visinia.objects.filter(restaurant=self.restaurant))
+            list(Restaurant.objects.all())
+        finally:
+            stop_request(token)
+        self.assertEqual((log.count, log.duplicates), (4, 2))
+
+    @override_settings(METRICS_SLOW_REQUEST_MS=0.001)
+    def test_slow_requests_logged_with_sql(self):
+        self.client.force_authenticate(self.customer)
+        with self.assertLogs('core.metrics', 'WARNING') as logs:
+            self.client.get(f'/api/restaurants/{self.restaurant.id}/')
+        self.assertIn('(restaurant-detail)', logs.output[0])
+        self.assertIn('FROM "core_restaurant"', logs.output[0])
+
+    def test_async_views_measured(self):
+        asgi = AsyncClient()
+        asgi.handler = ASGIURLconfHandler(enforce_csrf_checks=False)
+        token = RoleTokenObtainPairSerializer.get_token(self.customer).access_token
+        response = async_to_sync(asgi.get)('/api/restaurants/', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        labels = 'endpoint="async-restaurant-list",method="GET"'
+        text = self.scrape()
+        self.assertIn(f'kisinia_request_queries_count{{{labels}}} 1', text)
+        self.assertIn(f'kisinia_request_queries_bucket{{{labels},le="0"}} 0', text)
+
+
+class ThrottlingTestCase(TestCase):
+    def setUp(self):
+        clear_role_cache()
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='throttled', password='testpass123')
+        self.other = User.objects.create(username='browser')
+        owner = User.objects.create(username='throttle_owner')
+        self.restaurant = Restaurant.objects.create(owner=owner, name='Busy', address='x', phone='1')
+
+    def login(self, ip='10.0.0.1'):
+        return self.client.post(
+            '/api/token/', {'username': 'throttled', 'password': 'testpass123'}, REMOTE_ADDR=ip
+        )
+
+    def assertThrottled(self, response, max_wait):
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertTrue(0 < int(response['Retry-After']) <= max_wait)
+
+    def test_token_bucket_refills(self):
+        self.assertEqual(take_token('bucket', rate=1, burst=2, now=100), 0)
+        self.assertEqual(take_token('bucket', rate=1, burst=2, now=100), 0)
+        self.assertEqual(take_token('bucket', rate=1, burst=2, now=100.25), 0.75)
+        self.assertEqual(take_token('bucket', rate=1, burst=2, now=101), 0)
+
+    def test_bucket_lock_only_for_local_memory(self):
+        with mock.patch('core.throttling._bucket_lock') as lock:
+            take_token('bucket', rate=1, burst=2)
+            self.assertEqual(lock.__enter__.call_count, 1)
+            with mock.patch('core.throttling._cache', return_value=DummyCache('dummy', {})):
+                self.assertEqual(take_token('bucket', rate=1, burst=2), 0)
+            self.assertEqual(lock.__enter__.call_count, 1)
+
+    @override_settings(THROTTLE_BUCKETS={'auth': ('1/min', 2)})
+    def test_login_limited_per_ip_and_per_username(self):
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.assertThrottled(self.login(), 60)
+        # Another address is limited by the account's bucket.
+        self.assertThrottled(self.login(ip='10.0.0.2'), 60)
+
+        response = self.client.post('/api/register/', {'username': 'someone'}, REMOTE_ADDR='10.0.0.1')
+        self.assertThrottled(response, 60)
+
+    @override_settings(THROTTLE_BUCKETS={'read': ('1/min', 3), 'write': ('1/min', 1)})
+    def test_read_and_write_budgets_per_user(self):
+        self.client.force_authenticate(self.user)
+        for _ in range(3):
+            self.assertEqual(self.client.get('/api/restaurants/').status_code, status.HTTP_200_OK)
+        self.assertThrottled(self.client.get('/api/restaurants/'), 60)
+        response = self.client.post('/api/bookings/', {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertThrottled(self.client.post('/api/bookings/', {}, format='json'), 60)
+
+        # Other clients keep their own budgets.
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get('/api/restaurants/').status_code, status.HTTP_200_OK)
+
+    @override_settings(THROTTLE_BUCKETS={'read': ('1/min', 1)})
+    def test_async_views_throttled(self):
+        asgi = AsyncClient()
+        asgi.handler = ASGIURLconfHandler(enforce_csrf_checks=False)
+        token = RoleTokenObtainPairSerializer.get_token(self.user).access_token
+        headers = {'Authorization': f'Bearer {token}'}
+        self.assertEqual(async_to_sync(asgi.get)('/api/restaurants/', headers=headers).status_code, status.HTTP_200_OK)
+        self.assertThrottled(async_to_sync(asgi.get)('/api/restaurants/', headers=headers), 60)
+
+    @override_settings(CONCURRENCY_LIMITS={'auth': 1})
+    def test_password_hashing_shed_when_busy(self):
+        slots = concurrency_limit('auth')
+        self.assertTrue(slots.acquire(1))
+        try:
+            response = self.login()
+        finally:
+            slots.release()
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+
+    def test_admission_control(self):
+        self.client.force_authenticate(self.other)
+        waited = f't={time.time() - 2:.3f}'
+        with override_settings(MAX_QUEUE_WAIT_MS=500):
+            response = self.client.get('/api/restaurants/', HTTP_X_REQUEST_START=waited)
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            fresh = f't={int(time.time() * 1000)}'
+            response = self.client.get('/api/restaurants/', HTTP_X_REQUEST_START=fresh)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        inflight = concurrency_limit('inflight')
+        with override_settings(MAX_INFLIGHT_REQUESTS=1):
+            self.assertTrue(inflight.acquire(1))
+            try:
+                self.assertEqual(self.client.get('/api/restaurants/').status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            finally:
+                inflight.release()
+            self.assertEqual(self.client.get('/api/restaurants/').status_code, status.HTTP_200_OK)
+
+
+class BookingTransitionTestCase(TestCase):
+    def setUp(self):
+        clear_role_cache()
+        cache.clear()
+        self.client = APIClient()
+        self.owner = User.objects.create(username='transition_owner')
+        UserProfile.objects.filter(user=self.owner).update(role='RESTAURANT_OWNER')
+        self.customer = User.objects.create(username='transition_customer')
+        self.restaurant = Restaurant.objects.create(owner=self.owner, name='Rush', address='x', phone='1')
+        other_owner = User.objects.create(username='transition_other')
+        self.other_restaurant = Restaurant.objects.create(owner=other_owner, name='Other', address='x', phone='1')
+        self.dish = Visinia.objects.create(restaurant=self.restaurant, name='Pilau', description='', price='4.00')
+        self.other_dish = Visinia.objects.create(restaurant=self.other_restaurant, name='Chips', description='', price='2.00')
+
+    def book(self, dish=None):
+        dish = dish or self.dish
+        return place_booking(self.customer, dish.restaurant_id, [{str(dish.id): 1}])
+
+    def stats(self):
+        return RestaurantStats.objects.filter(restaurant=self.restaurant).values(
+            'pending_count', 'confirmed_count', 'completed_count', 'cancelled_count', 'revenue'
+        ).get()
+
+    def test_final_statuses_cannot_change(self):
+        booking = self.book()
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.client.post(f'/api/bookings/{booking.id}/complete/').status_code, status.HTTP_200_OK)
+
+        self.client.force_authenticate(self.customer)
+        response = self.client.post(f'/api/bookings/{booking.id}/cancel/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['status'], 'COMPLETED')
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'COMPLETED')
+        self.assertEqual(self.stats()['completed_count'], 1)
+        self.assertEqual(self.stats()['cancelled_count'], 0)
+
+    def test_repeated_action_is_a_no_op(self):
+        booking = self.book()
+        self.client.force_authenticate(self.owner)
+        for _ in range(2):
+            response = self.client.post(f'/api/bookings/{booking.id}/confirm/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['status'], 'CONFIRMED')
+        self.assertEqual((self.stats()['pending_count'], self.stats()['confirmed_count']), (0, 1))
+
+    def test_conditional_update_writes_only_status(self):
+        booking = self.book()
+        self.client.force_authenticate(self.owner)
+        with CaptureQueriesContext(connection) as context:
+            self.client.post(f'/api/bookings/{booking.id}/confirm/')
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE "core_booking"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"status" = \'PENDING\'', updates[0].split('WHERE')[1])
+        self.assertNotIn('total_price', updates[0])
+        self.assertNotIn('notes', updates[0])
+
+    def test_stale_read_does_not_overwrite(self):
+        booking = self.book()
+        stale = Booking.objects.get(pk=booking.pk)
+        # A concurrent request cancels the booking after it was read.
+        with transaction.atomic():
+            transition_bookings([Booking.objects.get(pk=booking.pk)], 'CANCELLED')
+        with transaction.atomic():
+            changed, refused = transition_bookings([stale], 'CONFIRMED')
+        self.assertEqual((changed, refused), ([], [stale]))
+        self.assertEqual(Booking.objects.get(pk=booking.pk).status, 'CANCELLED')
+        self.assertEqual((self.stats()['confirmed_count'], self.stats()['cancelled_count']), (0, 1))
+        self.assertEqual(self.stats()['revenue'], Decimal('0.00'))
+
+    def test_batch_confirm(self):
+        pending = [self.book() for _ in range(3)]
+        done = self.book()
+        Booking.objects.filter(pk=done.pk).update(status='COMPLETED')
+        elsewhere = self.book(self.other_dish)
+
+        self.client.force_authenticate(self.owner)
+        ids = [booking.id for booking in pending] + [done.id, elsewhere.id, 999999]
+        with CaptureQueriesContext(connection) as context, self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post('/api/bookings/batch_status/', {'status': 'CONFIRMED', 'ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], sorted(booking.id for booking in pending))
+        self.assertEqual(response.data['refused'], [{'id': done.id, 'status': 'COMPLETED'}])
+        self.assertEqual(response.data['not_found'], sorted([elsewhere.id, 999999]))
+
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE "core_booking"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(len(callbacks), 3)
+        self.assertEqual(self.stats()['confirmed_count'], 3)
+        self.assertEqual(Booking.objects.filter(status='CONFIRMED').count(), 3)
+
+    def test_batch_cancel_by_customer(self):
+        first, second = self.book(), self.book()
+        self.client.force_authenticate(self.customer)
+        response = self.client.post('/api/bookings/batch_status/', {'status': 'CONFIRMED', 'ids': [first.id]}, format='json')
+        self.assertEqual(response.data['not_found'], [first.id])
+
+        response = self.client.post(
+            '/api/bookings/batch_status/', {'status': 'CANCELLED', 'ids': [first.id, second.id]}, format='json'
+        )
+        self.assertEqual(response.data['updated'], [first.id, second.id])
+        self.assertEqual(self.stats()['cancelled_count'], 2)
+        self.assertEqual(self.stats()['revenue'], Decimal('0.00'))
+
+        response = self.client.post('/api/bookings/batch_status/', {'status': 'PENDING', 'ids': [first.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class StockReservationTestCase(TestCase):
+    def setUp(self):
+        clear_role_cache()
+        menu_cache().clear()
+        self.client = APIClient()
+        self.owner = User.objects.create(username='stock_owner')
+        self.customer = User.objects.create(username='stock_customer')
+        self.restaurant = Restaurant.objects.create(owner=self.owner, name='Limited', address='x', phone='1')
+        self.dish = Visinia.objects.create(
+            restaurant=self.restaurant, name='Nyama choma', description='', price='9.00', daily_capacity=3
+        )
+        self.side = Visinia.objects.create(restaurant=self.restaurant, name='Kachumbari', description='', price='1.00')
+
+    def order(self, quantity, dish=None):
+        self.client.force_authenticate(self.customer)
+        dish = dish or self.dish
+        return self.client.post('/api/bookings/', {
+            'restaurant_id': self.restaurant.id, 'items': [{str(dish.id): quantity}, {str(self.side.id): 1}],
+        }, format='json')
+
+    def menu_ids(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.get(f'/api/visiinias/by_restaurant/?restaurant_id={self.restaurant.id}')
+        return {item['id'] for item in response.json()}
+
+    def test_sells_out_and_switches_off(self):
+        self.assertIn(self.dish.id, self.menu_ids())
+        self.assertEqual(self.order(2).status_code, status.HTTP_201_CREATED)
+        response = self.order(2)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fewer than 2 portions', str(response.data))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.order(1).status_code, status.HTTP_201_CREATED)
+
+        self.dish.refresh_from_db()
+        self.assertFalse(self.dish.is_available)
+        self.assertEqual(self.dish.sold_out_on, timezone.localdate())
+        self.assertEqual(VisiniaStock.objects.get(visinia=self.dish).reserved, 3)
+        self.assertNotIn(self.dish.id, self.menu_ids())
+        # Items without a capacity are not tracked.
+        self.assertFalse(VisiniaStock.objects.filter(visinia=self.side).exists())
+
+    def test_cancel_releases_portions(self):
+        first = self.order(1).data['id']
+        second = self.order(2).data['id']
+        self.client.force_authenticate(self.customer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/bookings/{second}/cancel/')
+        self.dish.refresh_from_db()
+        self.assertTrue(self.dish.is_available)
+        self.assertIsNone(self.dish.sold_out_on)
+        self.assertEqual(VisiniaStock.objects.get(visinia=self.dish).reserved, 1)
+        self.assertIn(self.dish.id, self.menu_ids())
+
+        # Completed bookings keep their portions.
+        self.client.force_authenticate(self.owner)
+        self.client.post(f'/api/bookings/{first}/complete/')
+        self.assertEqual(VisiniaStock.objects.get(visinia=self.dish).reserved, 1)
+
+    def test_capacity_changes_apply_today(self):
+        self.order(3)
+        self.dish.refresh_from_db()
+        self.assertFalse(self.dish.is_available)
+
+        self.dish.daily_capacity = 5
+        self.dish.save()
+        self.dish.refresh_from_db()
+        self.assertTrue(self.dish.is_available)
+        self.assertEqual(VisiniaStock.objects.get(visinia=self.dish).capacity, 5)
+
+        self.dish.daily_capacity = 1
+        self.dish.save()
+        self.dish.refresh_from_db()
+        self.assertFalse(self.dish.is_available)
+        self.assertEqual(VisiniaStock.objects.get(visinia=self.dish).capacity, 3)
+
+    def test_restock_next_day(self):
+        manual = Visinia.objects.create(
+            restaurant=self.restaurant, name='Off', description='', price='1.00', is_available=False
+        )
+        Visinia.objects.filter(pk=self.dish.pk).update(
+            is_available=False, sold_out_on=timezone.localdate() - timedelta(days=1)
+        )
+        self.assertEqual(restock_sold_out(), 1)
+        self.dish.refresh_from_db()
+        manual.refresh_from_db()
+        self.assertTrue(self.dish.is_available)
+        self.assertFalse(manual.is_available)
+
+
+class StockConcurrencyTestCase(TransactionTestCase):
+    """Many threads booking the last portions of one item at once"""
+
+    def test_no_overselling_under_contention(self):
+        owner = User.objects.create(username='stress_owner')
+        restaurant = Restaurant.objects.create(owner=owner, name='Stress', address='x', phone='1')
+        dish = Visinia.objects.create(restaurant=restaurant, name='Special', description='', price='5.00', daily_capacity=7)
+        customers = [User.objects.create(username=f'stress_{index}') for index in range(24)]
+        barrier = threading.Barrier(len(customers))
+        outcomes = []
+
+        def order(customer, quantity):
+            barrier.wait()
+            try:
+                for _ in range(200):
+                    try:
+                        with transaction.atomic():
+                            place_booking(customer, restaurant.id, [{str(dish.id): quantity}])
+                        outcomes.append(('booked', quantity))
+                        return
+                    except ValidationError:
+                        outcomes.append(('refused', quantity))
+                        return
+                    except OperationalError:
+                        # SQLite refuses concurrent writers instead of waiting; retry like a client would.
+                        time.sleep(0.005)
+                outcomes.append(('gave up', quantity))
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=order, args=(customer, 1 + index % 2)) for index, customer in enumerate(customers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=60)
+        self.assertFalse(any(thread.is_alive() for thread in threads), 'a booking thread is stuck')
+
+        self.assertEqual(len(outcomes), len(customers))
+        self.assertNotIn('gave up', [outcome for outcome, _ in outcomes])
+        booked = sum(quantity for outcome, quantity in outcomes if outcome == 'booked')
+        stock = VisiniaStock.objects.get(visinia=dish)
+        self.assertEqual(stock.reserved, booked)
+        self.assertLessEqual(booked, 7)
+        self.assertGreaterEqual(booked, 6)
+        self.assertEqual(
+            sum(BookingItem.objects.filter(visinia=dish).values_list('quantity', flat=True)), booked
+        )
+        dish.refresh_from_db()
+        self.assertEqual(dish.is_available, booked < 7)
+
+
+task_calls = []
+
+
+@task(max_attempts=2)
+def record_call(value):
+    task_calls.append(value)
+
+
+@task(max_attempts=2)
+def burn_the_kitchen():
+    raise RuntimeError('kitchen on fire')
+
+
+@override_settings(TASKS_RUN_INLINE=False)
+class TaskQueueTestCase(TestCase):
+    def setUp(self):
+        task_calls.clear()
+
+    def test_enqueued_on_commit_only(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    record_call.enqueue('rolled back')
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertFalse(Task.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            record_call.enqueue('kept')
+        job = Task.objects.get()
+        self.assertEqual((job.name, job.args, job.status), ('core.tests.record_call', ['kept'], 'QUEUED'))
+
+        self.assertEqual(Worker().run_pending(), 1)
+        self.assertEqual(task_calls, ['kept'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_retries_with_backoff_then_fails(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            burn_the_kitchen.enqueue()
+        with self.assertLogs('core.tasks', 'WARNING') as logs:
+            self.assertEqual(Worker().run_pending(), 1)
+        self.assertIn('retrying in', logs.output[0])
+        job = Task.objects.get()
+        self.assertEqual((job.status, job.attempts), ('QUEUED', 1))
+        self.assertIn('kitchen on fire', job.last_error)
+        self.assertGreater(job.run_after, timezone.now())
+        # Not due yet.
+        self.assertEqual(Worker().run_pending(), 0)
+
+        Task.objects.update(run_after=timezone.now())
+        with self.assertLogs('core.tasks', 'ERROR'):
+            Worker().run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('FAILED', 2))
+        self.assertEqual(Worker().run_pending(), 0)
+
+    def test_each_task_claimed_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_call.enqueue(1)
+        first, second = Worker('first'), Worker('second')
+        self.assertIsNotNone(first.claim())
+        self.assertIsNone(second.claim())
+        self.assertEqual(Task.objects.get().locked_by, 'first')
+
+    def test_stale_tasks_requeued(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_call.enqueue(1)
+            burn_the_kitchen.enqueue()
+        worker = Worker('crashed')
+        worker.claim()
+        worker.claim()
+        Task.objects.filter(name__endswith='burn_the_kitchen').update(attempts=2)
+        Task.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(requeue_stale(), 1)
+        self.assertEqual(
+            dict(Task.objects.values_list('name', 'status')),
+            {'core.tests.record_call': 'QUEUED', 'core.tests.burn_the_kitchen': 'FAILED'},
+        )
+        self.assertEqual(Worker().run_pending(), 1)
+        self.assertEqual(task_calls, [1])
+
+    def test_uploaded_image_variants_built_by_worker(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        owner = User.objects.create(username='task_owner')
+        UserProfile.objects.filter(user=owner).update(role='RESTAURANT_OWNER')
+        clear_role_cache()
+        restaurant = Restaurant.objects.create(owner=owner, name='Uploads', address='x', phone='1')
+        visinia = Visinia.objects.create(restaurant=restaurant, name='Pilau', description='', price='3.00')
+        upload = io.BytesIO()
+        Image.new('RGB', (1000, 600), (10, 120, 40)).save(upload, 'JPEG')
+        upload.name = 'pilau.jpg'
+        upload.seek(0)
+
+        client = APIClient()
+        client.force_authenticate(owner)
+        with override_settings(MEDIA_ROOT=media_root), self.captureOnCommitCallbacks(execute=True):
+            response = client.patch(f'/api/visiinias/{visinia.id}/', {'image': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The save also queues a catalogue build.
+        self.assertEqual(
+            sorted(Task.objects.values_list('name', flat=True)),
+            ['core.catalogue.build_catalogue', 'core.images.build_variants'],
+        )
+        self.assertEqual(os.listdir(os.path.join(media_root, 'visiinias')), ['pilau.jpg'])
+
+        catalogue_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, catalogue_root, ignore_errors=True)
+        self.addCleanup(catalogue.clear)
+        with override_settings(MEDIA_ROOT=media_root, CATALOGUE_ROOT=catalogue_root):
+            self.assertEqual(Worker().run_pending(), 2)
+        self.assertEqual(len(os.listdir(os.path.join(media_root, 'visiinias'))), 7)
+
+
+class CatalogueTestCase(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        override = override_settings(CATALOGUE_ROOT=root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.root = root
+        menu_cache().clear()
+        catalogue.clear()
+        self.addCleanup(catalogue.clear)
+
+        owner = User.objects.create(username='catalogue_owner', email='owner@example.com')
+        self.first = Restaurant.objects.create(owner=owner, name='First', address='a', phone='1')
+        self.second = Restaurant.objects.create(owner=owner, name='Second', address='b', phone='2')
+        Restaurant.objects.create(owner=owner, name='Closed', address='c', phone='3', is_active=False)
+        self.dish = Visinia.objects.create(restaurant=self.first, name='Ugali', description='', price='2.50')
+        Visinia.objects.create(restaurant=self.first, name='Gone', description='', price='1.00', is_available=False)
+        Visinia.objects.create(restaurant=self.second, name='Chapati', description='', price='0.50')
+        self.client = APIClient()
+        self.client.force_authenticate(owner)
+
+    def test_compact_document_without_owners(self):
+        response = self.client.get('/api/catalogue/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn(b'owner', response.content)
+        self.assertNotIn(b'": ', response.content)
+        document = json.loads(response.content)
+        menus = {restaurant['name']: [item['name'] for item in restaurant['visiinias']] for restaurant in document['restaurants']}
+        self.assertEqual(menus, {'First': ['Ugali'], 'Second': ['Chapati']})
+        self.assertEqual(document['restaurants'][1]['visiinias'][0]['price'], '2.50')
+
+        again = self.client.get('/api/catalogue/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_precompressed_variants(self):
+        plain = self.client.get('/api/catalogue/')
+        response = self.client.get('/api/catalogue/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertNotEqual(response['ETag'], plain['ETag'])
+        # Either representation validates the other.
+        self.assertEqual(
+            self.client.get('/api/catalogue/', HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+            status.HTTP_304_NOT_MODIFIED,
+        )
+        refused = self.client.get('/api/catalogue/', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', refused)
+
+    @override_settings(TASKS_RUN_INLINE=False)
+    def test_saving_a_menu_queues_the_build(self):
+        first = catalogue.get()
+        # The version comes from the cache while nothing changes.
+        with self.assertNumQueries(0):
+            self.assertIs(catalogue.get(), first)
+        untouched = catalogue._fragments[self.second.id]
+
+        self.dish.name = 'Ugali na sukuma'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dish.save()
+        self.assertTrue(Task.objects.filter(name=build_catalogue.name).exists())
+        # The first request after the change recomputes the version, then keeps
+        # serving the last snapshot until the build has run.
+        with self.assertNumQueries(2):
+            self.assertIs(catalogue.get(), first)
+        with self.assertNumQueries(0):
+            self.assertIs(catalogue.get(), first)
+
+        # Data version, active restaurants, then the changed restaurant and its menu.
+        with CaptureQueriesContext(connection) as context:
+            Worker().run_pending()
+        self.assertIn(b'Ugali na sukuma', catalogue.get().body)
+        self.assertEqual(len([query for query in context if 'core_task' not in query['sql']]), 5)
+        self.assertIs(catalogue._fragments[self.second.id], untouched)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Visinia.objects.filter(restaurant=self.second).delete()
+        build_catalogue()
+        self.assertNotIn(b'Chapati', catalogue.get().body)
+
+    @override_settings(TASKS_RUN_INLINE=False)
+    def test_restarted_process_loads_from_disk(self):
+        body = catalogue.get().body
+        self.assertTrue(any(name.endswith('.json.gz') for name in os.listdir(self.root)))
+        catalogue.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(catalogue.get().body, body)
+
+        # A process that has not seen the latest build serves the newest one on disk.
+        with self.captureOnCommitCallbacks(execute=True):
+            Restaurant.objects.filter(pk=self.second.pk).update(is_active=False, updated_at=timezone.now())
+            schedule_build()
+        catalogue.clear()
+        self.assertEqual(catalogue.get().body, body)
+
+    def test_snapshots_are_ordered_by_when_they_were_written(self):
+        first = catalogue.get().version
+        with self.captureOnCommitCallbacks(execute=True):
+            extra = Visinia.objects.create(restaurant=self.second, name='Samosa', description='', price='0.20')
+        build_catalogue()
+        added = catalogue.snapshot.version
+        self.assertNotIn(f'catalogue.{first}.json', os.listdir(self.root))
+
+        # Deleting the latest change moves the version's timestamp back; the
+        # snapshot with the later timestamp is still the one pruned.
+        with self.captureOnCommitCallbacks(execute=True):
+            extra.delete()
+        build_catalogue()
+        self.assertEqual(catalogue.snapshot.version, first)
+        names = os.listdir(self.root)
+        self.assertIn(f'catalogue.{first}.json', names)
+        self.assertNotIn(f'catalogue.{added}.json', names)
+
+        # One written since, by another worker, is kept and preferred by a cold process.
+        later = time.time() + 60
+        for encoding, suffix in (('identity', ''), ('gzip', '.gz'), ('br', '.br')):
+            path = os.path.join(self.root, f'catalogue.0-0-0.json{suffix}')
+            with open(path, 'wb') as fh:
+                fh.write(gzip.compress(b'{}') if encoding == 'gzip' else b'{}')
+            os.utime(path, (later, later))
+        catalogue._prune(first)
+        catalogue.clear()
+        self.assertEqual(catalogue._load_latest().version, '0-0-0')
+
+    @skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack(self):
+        response = self.client.get('/api/catalogue/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), json.loads(self.client.get('/api/catalogue/').content))
@@ -0,0 +1,192 @@
+import contextlib
+import functools
+import math
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import Throttled
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+# Serializes read-modify-write of LocMemCache buckets, which makes them exact.
+# A shared backend is not locked: a lock would hold every request of the
+# process across the backend's round trips and still not be exact across
+# processes, so there the limits are approximate.
+_bucket_lock = threading.Lock()
+
+
+def parse_rate(rate):
+    """'10/min' -> tokens per second"""
+    count, _, period = rate.partition('/')
+    return int(count) / PERIODS[period.strip().lower()]
+
+
+def _cache():
+    return caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+
+
+def take_token(key, rate, burst, now=None):
+    """Take one token from a bucket refilled at ``rate``/s up to ``burst``; seconds to wait, 0 if taken"""
+    now = time.time() if now is None else now
+    cache = _cache()
+    with _bucket_lock if isinstance(cache, LocMemCache) else contextlib.nullcontext():
+        state = cache.get(key)
+        tokens, stamp = state if state is not None else (burst, now)
+        tokens = min(burst, tokens + (now - stamp) * rate)
+        if tokens < 1:
+            return (1 - tokens) / rate
+        # After this long the bucket is full again and the entry can go.
+        cache.set(key, (tokens - 1, now), math.ceil(burst / rate) + 1)
+    return 0
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Token bucket per user, or per client IP for anonymous requests.
+
+    The scope is the view's ``throttle_scope`` or, without one, 'read' for
+    safe methods and 'write' otherwise. Buckets are configured in
+    THROTTLE_BUCKETS as scope -> (rate, burst).
+    """
+    scope = None
+
+    def __init__(self):
+        self._wait = None
+
+    def get_scope(self, request, view):
+        scope = self.scope or getattr(view, 'throttle_scope', None)
+        if scope is None:
+            scope = 'read' if request.method in SAFE_METHODS else 'write'
+        return scope
+
+    def get_keys(self, request, scope):
+        if request.user and request.user.is_authenticated:
+            return [f'throttle:{scope}:user:{request.user.pk}']
+        return [f'throttle:{scope}:ip:{self.get_ident(request)}']
+
+    def allow_request(self, request, view):
+        if not getattr(settings, 'THROTTLE_ENABLED', True):
+            return True
+        scope = self.get_scope(request, view)
+        bucket = getattr(settings, 'THROTTLE_BUCKETS', {}).get(scope)
+        if bucket is None:
+            return True
+        rate, burst = parse_rate(bucket[0]), bucket[1]
+        # Every bucket is charged, so one that is empty does not refund the others.
+        waits = [take_token(key, rate, burst) for key in self.get_keys(request, scope)]
+        self._wait = max(waits)
+        return self._wait == 0
+
+    def wait(self):
+        return self._wait
+
+
+class AuthThrottle(TokenBucketThrottle):
+    """Login, refresh and registration: per client IP and per account named in the request"""
+    scope = 'auth'
+
+    def get_keys(self, request, scope):
+        keys = [f'throttle:{scope}:ip:{self.get_ident(request)}']
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if isinstance(username, str) and username:
+            # Caps guessing against one account from many addresses.
+            keys.append(f'throttle:{scope}:username:{username.strip().lower()}')
+        return keys
+
+
+def check_throttles(request, view=None):
+    """APIView.check_throttles for views outside DRF: raise Throttled if a default throttle refuses"""
+    durations = [
+        throttle.wait() for throttle in (cls() for cls in api_settings.DEFAULT_THROTTLE_CLASSES)
+        if not throttle.allow_request(request, view)
+    ]
+    if durations:
+        raise Throttled(max((duration for duration in durations if duration is not None), default=None))
+
+
+async def acheck_throttles(request, view=None):
+    if isinstance(_cache(), LocMemCache):
+        # Process memory only; no I/O to move off the event loop.
+        return check_throttles(request, view)
+    return await sync_to_async(check_throttles)(request, view)
+
+
+class ConcurrencyLimit:
+    """Non-blocking counter of requests in progress in this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+
+    def acquire(self, limit):
+        with self._lock:
+            if limit and self.active >= limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+
+_concurrency_limits = {}
+
+
+def concurrency_limit(scope):
+    limit = _concurrency_limits.get(scope)
+    if limit is None:
+        limit = _concurrency_limits.setdefault(scope, ConcurrencyLimit())
+    return limit
+
+
+def overloaded_response(retry_after=1):
+    response = JsonResponse(
+        {'detail': 'The server is busy. Please retry shortly.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def shed_when_busy(scope):
+    """Answer 503 at once when CONCURRENCY_LIMITS[scope] requests of the view are already running here.
+
+    For CPU-heavy views such as password hashing, so they cannot occupy every
+    worker thread and starve cheap requests.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            limit = getattr(settings, 'CONCURRENCY_LIMITS', {}).get(scope, 0)
+            slots = concurrency_limit(scope)
+            if not slots.acquire(limit):
+                return overloaded_response()
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                slots.release()
+        return wrapper
+    return decorator
+
+
+def queue_wait(request, now=None):
+    """Seconds since the front-end proxy received the request (X-Request-Start), or None"""
+    value = request.headers.get('X-Request-Start', '').removeprefix('t=')
+    try:
+        started = float(value)
+    except ValueError:
+        return None
+    # nginx sends seconds with a fraction, other proxies milli- or microseconds.
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return (time.time() if now is None else now) - started
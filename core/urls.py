@@ -1,9 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from .throttling import AuthThrottle, shed_when_busy
 from .views import (
     UserViewSet, UserProfileViewSet, RestaurantViewSet, VisioniaViewSet, BookingViewSet,
-    register, admin_register_owner
+    register, admin_register_owner, booking_events, booking_events_ticket, catalogue_snapshot, metrics
 )
 
 router = DefaultRouter()
@@ -19,7 +20,15 @@ urlpatterns = [
     path('register-owner/', admin_register_owner, name='register_owner'),
     path('admin/register-owner', admin_register_owner, name='admin_register_owner_no_slash'),
     path('admin/register-owner/', admin_register_owner, name='admin_register_owner'),
-    path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path(
+        'token/', shed_when_busy('auth')(TokenObtainPairView.as_view(throttle_classes=[AuthThrottle])),
+        name='token_obtain_pair'
+    ),
+    path('token/refresh/', TokenRefreshView.as_view(throttle_classes=[AuthThrottle]), name='token_refresh'),
+    path('bookings/events/', booking_events, name='booking_events'),
+    path('bookings/events/ticket/', booking_events_ticket, name='booking_events_ticket'),
+    path('catalogue/', catalogue_snapshot, name='catalogue'),
+    path('_metrics', metrics, name='metrics_no_slash'),
+    path('_metrics/', metrics, name='metrics'),
     path('', include(router.urls)),
 ]
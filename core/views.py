@@ -1,27 +1,140 @@
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
 from rest_framework import viewsets, status
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes, renderer_classes, throttle_classes
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIRequest
 from django.db import transaction
-from django.http import FileResponse, Http404
+from django.db.models import DecimalField, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse, HttpResponseNotModified, HttpResponseRedirect
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
 from django.shortcuts import get_object_or_404
-from rest_framework.exceptions import PermissionDenied, ValidationError
+from PIL import UnidentifiedImageError
+from rest_framework.exceptions import AuthenticationFailed, PermissionDenied, ValidationError
+from rest_framework_simplejwt.exceptions import InvalidToken
 
-from .models import UserProfile, Restaurant, Visinia, Booking, BookingItem
+from .authentication import ClaimsJWTAuthentication
+from .models import UserProfile, Restaurant, Visinia, Booking, RestaurantStats, RestaurantItemStats
 from .serializers import (
     UserSerializer, UserProfileSerializer, RestaurantSerializer,
     VisioniaSerializer, BookingSerializer, BookingCreateSerializer, BookingItemSerializer,
-    RegistrationSerializer, AdminOwnerRegistrationSerializer
+    BookingStatusBatchSerializer, RegistrationSerializer, AdminOwnerRegistrationSerializer,
+    RestaurantStatsSerializer, RestaurantStatsTotalsSerializer, RestaurantItemStatsSerializer,
+    VisiniaSearchSerializer, VisiniaSearchParamsSerializer,
 )
 from .permissions import IsRestaurantOwner, IsAdminUser
+from .bookings import can_cancel_booking, can_manage_booking, place_booking, transition_bookings
+from .query_plans import booking_queryset, restaurant_queryset, scoped_bookings
+from .pagination import DateJoinedCursorPagination, SearchRankCursorPagination
+from .roles import VALID_ROLES, get_request_role, get_user_role
+from .menu_cache import get_cached_menu
+from .catalogue import MessagePackRenderer, catalogue, msgpack, preferred_encoding
+from .mixins import ConditionalGetMixin
+from .images import VARIANT_WIDTHS, get_variant, preferred_format
+from .media import file_response
+from .events import channels_for, issue_stream_ticket, sse_stream, stream_ticket_channels
+from .exports import CSVRenderer, NDJSONRenderer, iter_booking_rows, stream_csv, stream_ndjson
+from .search import search_terms, search_visiinias
+from .idempotency import run_idempotent
+from .metrics import PROMETHEUS_CONTENT_TYPE, request_metrics
+from .throttling import AuthThrottle, shed_when_busy
+
+
+def start_of_day(value):
+    """Aware datetime for midnight of a YYYY-MM-DD string"""
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def serve_image(request, field_file):
+    """Stream an image field, or redirect ?w= requests to a resized variant"""
+    width = request.query_params.get('w')
+    if width is None:
+        try:
+            return file_response(request, field_file.storage, field_file.name)
+        except OSError:
+            raise Http404("Image not found")
+
+    if not width.isdigit() or int(width) not in VARIANT_WIDTHS:
+        return Response(
+            {"detail": f"w must be one of {', '.join(str(w) for w in VARIANT_WIDTHS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        variant = get_variant(field_file, int(width), preferred_format(request))
+    except (OSError, UnidentifiedImageError):
+        raise Http404("Image not found")
+
+    return variant_redirect(field_file, variant)
+
+
+def variant_redirect(field_file, variant):
+    response = HttpResponseRedirect(field_file.storage.url(variant))
+    patch_cache_control(response, public=True, max_age=300)
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def menu_response(request, etag, body):
+    """Cached menu bytes, or 304 when the client already has this version"""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def catalogue_response(request, snapshot):
+    """The catalogue in the most compact representation the client accepts, or 304"""
+    if request.accepted_renderer.format == 'msgpack':
+        representation, body, content_type = 'msgpack', snapshot.msgpack, MessagePackRenderer.media_type
+    else:
+        representation = preferred_encoding(request.headers.get('Accept-Encoding', ''), snapshot.encoded)
+        body, content_type = snapshot.encoded[representation], 'application/json'
+
+    if_none_match = request.headers.get('If-None-Match')
+    # Every representation of one snapshot carries the same data.
+    if if_none_match and (if_none_match.strip() == '*' or set(parse_etags(if_none_match)) & set(snapshot.etags.values())):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type=content_type)
+        if representation in ('gzip', 'br'):
+            response['Content-Encoding'] = representation
+    response['ETag'] = snapshot.etags[representation]
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Accept', 'Accept-Encoding'])
+    return response
 
 
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
     """User viewset for listing and retrieving users"""
-    queryset = User.objects.all()
+    queryset = User.objects.select_related('profile')
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = DateJoinedCursorPagination
+
+    def get_queryset(self):
+        # ?role= narrows the list, e.g. to the owners a restaurant can be assigned to.
+        role = self.request.query_params.get('role')
+        if role:
+            return self.queryset.filter(profile__role=role)
+        return self.queryset.all()
 
     @action(detail=False, methods=['get'])
     def me(self, request):
@@ -69,11 +182,13 @@ class UserProfileViewSet(viewsets.ModelViewSet):
         return UserProfile.objects.filter(user=self.request.user)
 
 
-class RestaurantViewSet(viewsets.ModelViewSet):
+class RestaurantViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """Restaurant viewset for CRUD operations"""
     queryset = Restaurant.objects.all()
     serializer_class = RestaurantSerializer
     permission_classes = [IsAuthenticated]
+    # The nested owner and profile; saving the owner touches the profile.
+    conditional_timestamps = ('updated_at', 'owner__profile__updated_at')
 
     def get_queryset(self):
         # Image endpoint must work without auth header from <img src="...">.
@@ -82,13 +197,12 @@ class RestaurantViewSet(viewsets.ModelViewSet):
 
         # Public/anonymous users should only see active restaurants.
         if not self.request.user.is_authenticated:
-            return Restaurant.objects.filter(is_active=True)
+            return restaurant_queryset(is_active=True)
 
         # Restaurant owners see their restaurants, others see active ones.
-        user_profile, _ = UserProfile.objects.get_or_create(user=self.request.user)
-        if user_profile.role == 'RESTAURANT_OWNER':
-            return Restaurant.objects.filter(owner=self.request.user)
-        return Restaurant.objects.filter(is_active=True)
+        if get_request_role(self.request) == 'RESTAURANT_OWNER':
+            return restaurant_queryset(owner=self.request.user)
+        return restaurant_queryset(is_active=True)
 
     def perform_create(self, serializer):
         """Only staff can create restaurants and assign owner."""
@@ -100,8 +214,7 @@ class RestaurantViewSet(viewsets.ModelViewSet):
             raise ValidationError({"owner_id": "owner_id is required when creating a restaurant."})
 
         owner = get_object_or_404(User, id=owner_id)
-        owner_profile, _ = UserProfile.objects.get_or_create(user=owner)
-        if owner_profile.role != 'RESTAURANT_OWNER':
+        if get_user_role(owner) != 'RESTAURANT_OWNER':
             raise ValidationError({"owner_id": "Selected owner must have RESTAURANT_OWNER role."})
 
         serializer.save(owner=owner)
@@ -119,20 +232,62 @@ class RestaurantViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def my_restaurants(self, request):
         """Get current user's restaurants"""
-        restaurants = Restaurant.objects.filter(owner=request.user)
+        restaurants = restaurant_queryset(owner=request.user)
         serializer = self.get_serializer(restaurants, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """Daily booking counts, revenue and items sold for a restaurant"""
+        restaurant = self.get_object()
+        if restaurant.owner != request.user and not request.user.is_staff:
+            return Response(
+                {"detail": "You can only view stats for your own restaurants."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        days = request.query_params.get('days', '30')
+        if not days.isdigit() or not 1 <= int(days) <= 366:
+            return Response(
+                {"detail": "days must be an integer between 1 and 366"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        since = timezone.localdate() - timedelta(days=int(days) - 1)
+
+        daily = RestaurantStats.objects.filter(restaurant=restaurant, date__gte=since)
+        totals = daily.aggregate(
+            booking_count=Coalesce(Sum('booking_count'), 0),
+            pending_count=Coalesce(Sum('pending_count'), 0),
+            confirmed_count=Coalesce(Sum('confirmed_count'), 0),
+            completed_count=Coalesce(Sum('completed_count'), 0),
+            cancelled_count=Coalesce(Sum('cancelled_count'), 0),
+            revenue=Coalesce(Sum('revenue'), Decimal('0'), output_field=DecimalField()),
+        )
+        items = (
+            RestaurantItemStats.objects.filter(restaurant=restaurant, date__gte=since)
+            .values('visinia_id', 'visinia__name')
+            .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+            .filter(quantity__gt=0)
+            .order_by('-quantity')
+        )
+        return Response({
+            'restaurant': restaurant.id,
+            'since': since,
+            'totals': RestaurantStatsTotalsSerializer(totals).data,
+            'days': RestaurantStatsSerializer(daily, many=True).data,
+            'items': RestaurantItemStatsSerializer(items, many=True).data,
+        })
+
     @action(detail=True, methods=['get'], permission_classes=[AllowAny])
     def logo_file(self, request, pk=None):
         """Serve restaurant logo directly through API."""
         restaurant = self.get_object()
         if not restaurant.logo:
             raise Http404("Logo not found")
-        return FileResponse(restaurant.logo.open('rb'), content_type='image/*')
+        return serve_image(request, restaurant.logo)
 
 
-class VisioniaViewSet(viewsets.ModelViewSet):
+class VisioniaViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """Visinia viewset for managing food items"""
     queryset = Visinia.objects.all()
     serializer_class = VisioniaSerializer
@@ -148,8 +303,7 @@ class VisioniaViewSet(viewsets.ModelViewSet):
             return Visinia.objects.filter(is_available=True)
 
         # Restaurant owners see their visiinias, customers see available ones.
-        user_profile, _ = UserProfile.objects.get_or_create(user=self.request.user)
-        if user_profile.role == 'RESTAURANT_OWNER':
+        if get_request_role(self.request) == 'RESTAURANT_OWNER':
             return Visinia.objects.filter(restaurant__owner=self.request.user)
         return Visinia.objects.filter(is_available=True)
 
@@ -174,9 +328,44 @@ class VisioniaViewSet(viewsets.ModelViewSet):
                 {"detail": "restaurant_id parameter is required"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        visiinias = Visinia.objects.filter(restaurant_id=restaurant_id, is_available=True)
-        serializer = self.get_serializer(visiinias, many=True)
-        return Response(serializer.data)
+        if not restaurant_id.isdigit():
+            return Response(
+                {"detail": "restaurant_id must be an integer"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        def render_menu():
+            visiinias = Visinia.objects.filter(restaurant_id=restaurant_id, is_available=True)
+            return JSONRenderer().render(self.get_serializer(visiinias, many=True).data)
+
+        # Sparse fieldsets change the payload, so only the full menu is cached.
+        if 'fields' in request.query_params:
+            return HttpResponse(render_menu(), content_type='application/json')
+
+        etag, body = get_cached_menu(int(restaurant_id), render_menu)
+        return menu_response(request, etag, body)
+
+    @action(detail=False, methods=['get'], pagination_class=SearchRankCursorPagination)
+    def search(self, request):
+        """Full-text search over available visiinias of active restaurants, best match first"""
+        params = VisiniaSearchParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        terms = search_terms(params.validated_data['q'])
+        if not terms:
+            raise ValidationError({'q': ['Enter at least one word to search for.']})
+
+        visiinias = Visinia.objects.filter(is_available=True, restaurant__is_active=True)
+        if 'min_price' in params.validated_data:
+            visiinias = visiinias.filter(price__gte=params.validated_data['min_price'])
+        if 'max_price' in params.validated_data:
+            visiinias = visiinias.filter(price__lte=params.validated_data['max_price'])
+        if 'restaurant_id' in params.validated_data:
+            visiinias = visiinias.filter(restaurant_id=params.validated_data['restaurant_id'])
+        visiinias = search_visiinias(visiinias.select_related('restaurant'), terms)
+
+        page = self.paginate_queryset(visiinias)
+        serializer = VisiniaSearchSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['get'], permission_classes=[AllowAny])
     def image_file(self, request, pk=None):
@@ -184,7 +373,7 @@ class VisioniaViewSet(viewsets.ModelViewSet):
         visinia = self.get_object()
         if not visinia.image:
             raise Http404("Image not found")
-        return FileResponse(visinia.image.open('rb'), content_type='image/*')
+        return serve_image(request, visinia.image)
 
 
 class BookingViewSet(viewsets.ModelViewSet):
@@ -194,123 +383,160 @@ class BookingViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        # Ensure a UserProfile exists to avoid RelatedObjectDoesNotExist
-        user_profile, _ = UserProfile.objects.get_or_create(user=self.request.user)
-        if user_profile.role == 'ADMIN':
-            return Booking.objects.all()
-        elif user_profile.role == 'RESTAURANT_OWNER':
-            return Booking.objects.filter(restaurant__owner=self.request.user)
-        else:  # CUSTOMER
-            return Booking.objects.filter(customer=self.request.user)
+        return booking_queryset(self.request.user, get_request_role(self.request))
 
-    @transaction.atomic
     def create(self, request, *args, **kwargs):
-        """Create a new booking"""
+        """Create a new booking; retries sent with the same Idempotency-Key get the first response"""
+        return run_idempotent(request, lambda: self._create_booking(request))
+
+    @transaction.atomic
+    def _create_booking(self, request):
         serializer = BookingCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        restaurant_id = serializer.validated_data['restaurant_id']
-        items_data = serializer.validated_data['items']
-        notes = serializer.validated_data.get('notes', '')
-
-        try:
-            restaurant = Restaurant.objects.get(id=restaurant_id)
-        except Restaurant.DoesNotExist:
-            return Response(
-                {"detail": "Restaurant not found"},
-                status=status.HTTP_404_NOT_FOUND
-            )
-
-        # Create booking
-        booking = Booking.objects.create(
+        booking = place_booking(
             customer=request.user,
-            restaurant=restaurant,
-            notes=notes
+            restaurant_id=serializer.validated_data['restaurant_id'],
+            items_data=serializer.validated_data['items'],
+            notes=serializer.validated_data.get('notes', ''),
         )
 
-        total_price = 0
-        for item in items_data:
-            visinia_id = list(item.keys())[0]
-            quantity = item[visinia_id]
-
-            try:
-                visinia = Visinia.objects.get(id=visinia_id, restaurant=restaurant)
-            except Visinia.DoesNotExist:
-                booking.delete()
-                return Response(
-                    {"detail": f"Visinia {visinia_id} not found in this restaurant"},
-                    status=status.HTTP_404_NOT_FOUND
-                )
-
-            item_price = visinia.price * quantity
-            BookingItem.objects.create(
-                booking=booking,
-                visinia=visinia,
-                quantity=quantity,
-                price=visinia.price
-            )
-            total_price += item_price
-
-        booking.total_price = total_price
-        booking.save()
-
         return Response(
             BookingSerializer(booking).data,
             status=status.HTTP_201_CREATED
         )
 
+    def _change_status(self, new_status, may_change, denied):
+        booking = self.get_object()
+        if not may_change(booking, self.request.user):
+            return Response({"detail": denied}, status=status.HTTP_403_FORBIDDEN)
+        if booking.status != new_status:
+            changed, _ = transition_bookings([booking], new_status)
+            if not changed:
+                current = Booking.objects.filter(pk=booking.pk).values_list('status', flat=True).first()
+                return Response(
+                    {"detail": f"A {current} booking cannot become {new_status}.", "status": current},
+                    status=status.HTTP_409_CONFLICT
+                )
+        return Response(BookingSerializer(booking).data)
+
     @action(detail=True, methods=['post'])
+    @transaction.atomic
     def confirm(self, request, pk=None):
         """Confirm a booking (restaurant owner only)"""
-        booking = self.get_object()
-        if booking.restaurant.owner != request.user and not request.user.is_staff:
-            return Response(
-                {"detail": "You can only confirm bookings for your restaurant."},
-                status=status.HTTP_403_FORBIDDEN
-            )
-
-        booking.status = 'CONFIRMED'
-        booking.save()
-        return Response(BookingSerializer(booking).data)
+        return self._change_status(
+            'CONFIRMED', can_manage_booking, "You can only confirm bookings for your restaurant."
+        )
 
     @action(detail=True, methods=['post'])
+    @transaction.atomic
     def complete(self, request, pk=None):
         """Mark booking as completed"""
-        booking = self.get_object()
-        if booking.restaurant.owner != request.user and not request.user.is_staff:
-            return Response(
-                {"detail": "Only restaurant owner or admin can complete bookings."},
-                status=status.HTTP_403_FORBIDDEN
-            )
-
-        booking.status = 'COMPLETED'
-        booking.save()
-        return Response(BookingSerializer(booking).data)
+        return self._change_status(
+            'COMPLETED', can_manage_booking, "Only restaurant owner or admin can complete bookings."
+        )
 
     @action(detail=True, methods=['post'])
+    @transaction.atomic
     def cancel(self, request, pk=None):
         """Cancel a booking"""
-        booking = self.get_object()
-        if booking.customer != request.user and booking.restaurant.owner != request.user and not request.user.is_staff:
+        return self._change_status(
+            'CANCELLED', can_cancel_booking, "You don't have permission to cancel this booking."
+        )
+
+    @action(detail=False, methods=['post'])
+    @transaction.atomic
+    def batch_status(self, request):
+        """Move many bookings to one status with one UPDATE per status they leave"""
+        serializer = BookingStatusBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        new_status = serializer.validated_data['status']
+        ids = set(serializer.validated_data['ids'])
+
+        bookings = Booking.objects.filter(pk__in=ids)
+        if not request.user.is_staff:
+            may_change = Q(restaurant__owner=request.user)
+            if new_status == 'CANCELLED':
+                may_change |= Q(customer=request.user)
+            bookings = bookings.filter(may_change)
+        bookings = list(bookings.only(
+            'id', 'status', 'restaurant_id', 'customer_id', 'total_price', 'created_at', 'updated_at'
+        ))
+
+        changed, refused = transition_bookings(bookings, new_status)
+        refused_ids = [booking.pk for booking in refused]
+        current = dict(Booking.objects.filter(pk__in=refused_ids).values_list('pk', 'status')) if refused_ids else {}
+        found = {booking.pk for booking in bookings}
+        return Response({
+            'status': new_status,
+            'updated': sorted(booking.pk for booking in changed),
+            'refused': [{'id': pk, 'status': current.get(pk)} for pk in sorted(refused_ids)],
+            'not_found': sorted(ids - found),
+        })
+
+    @action(detail=False, methods=['get'], renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        """Stream bookings as CSV or NDJSON, one row per booking item"""
+        bookings = scoped_bookings(request.user, get_request_role(request))
+
+        date_from = request.query_params.get('from')
+        date_to = request.query_params.get('to')
+        try:
+            if date_from:
+                bookings = bookings.filter(created_at__gte=start_of_day(date_from))
+            if date_to:
+                bookings = bookings.filter(created_at__lt=start_of_day(date_to) + timedelta(days=1))
+        except ValueError:
             return Response(
-                {"detail": "You don't have permission to cancel this booking."},
-                status=status.HTTP_403_FORBIDDEN
+                {"detail": "from and to must be dates in YYYY-MM-DD format"},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-        booking.status = 'CANCELLED'
-        booking.save()
-        return Response(BookingSerializer(booking).data)
+        statuses = [value for value in request.query_params.get('status', '').upper().split(',') if value]
+        valid_statuses = {value for value, _ in Booking.STATUS_CHOICES}
+        if any(value not in valid_statuses for value in statuses):
+            return Response(
+                {"detail": f"status must be one of {', '.join(sorted(valid_statuses))}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if statuses:
+            bookings = bookings.filter(status__in=statuses)
+
+        rows = iter_booking_rows(bookings)
+        if request.accepted_renderer.format == 'ndjson':
+            response = StreamingHttpResponse(stream_ndjson(rows), content_type='application/x-ndjson')
+        else:
+            response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv; charset=utf-8')
+        filename = f"bookings-{timezone.localdate():%Y%m%d}.{request.accepted_renderer.format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
     @action(detail=False, methods=['get'])
     def my_bookings(self, request):
         """Get current user's bookings"""
-        bookings = Booking.objects.filter(customer=request.user)
+        bookings = booking_queryset(request.user, 'CUSTOMER')
         serializer = self.get_serializer(bookings, many=True)
         return Response(serializer.data)
 
 
+@api_view(['GET'])
+@renderer_classes([JSONRenderer, MessagePackRenderer] if msgpack else [JSONRenderer])
+def catalogue_snapshot(request):
+    """All active restaurants with their available visiinias in one document, without owner details"""
+    return catalogue_response(request, catalogue.get())
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def metrics(request):
+    """Per-endpoint request metrics of this process in Prometheus text format (staff only)"""
+    return HttpResponse(request_metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@shed_when_busy('auth')
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([AuthThrottle])
 def register(request):
     """User registration endpoint"""
     serializer = RegistrationSerializer(data=request.data)
@@ -338,8 +564,10 @@ def register(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@shed_when_busy('auth')
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([AuthThrottle])
 def admin_register_owner(request):
     """Superuser-only endpoint to create restaurant owner accounts."""
     if not request.user.is_superuser:
@@ -371,3 +599,61 @@ def admin_register_owner(request):
             }
         }, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _stream_listener(request):
+    """(expires_at, channels) for a stream ticket or a bearer token, or None.
+
+    EventSource cannot send headers, so browsers pass a ?ticket= from
+    booking_events_ticket instead of their access token.
+    """
+    max_end = time.time() + settings.SSE_MAX_DURATION
+    auth = ClaimsJWTAuthentication()
+    header = auth.get_header(request)
+    if header is None:
+        ticket = request.GET.get('ticket')
+        channels = stream_ticket_channels(ticket) if ticket else None
+        return None if channels is None else (max_end, channels)
+    try:
+        raw = auth.get_raw_token(header)
+        if not raw:
+            return None
+        token = auth.get_validated_token(raw)
+        user = auth.get_user(token)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    role = token.get('role')
+    if role not in VALID_ROLES:
+        role = get_user_role(user)
+    # Close before the token expires; the client reconnects on its own.
+    return min(max_end, token['exp']), channels_for(user, role)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def booking_events_ticket(request):
+    """Short-lived ticket for opening the booking event stream with EventSource"""
+    return Response({
+        'ticket': issue_stream_ticket(request.user, get_request_role(request)),
+        'expires_in': settings.SSE_TICKET_TTL,
+    })
+
+
+async def booking_events(request):
+    """Server-Sent Events for bookings: owners see their restaurants, customers their own, staff all"""
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'detail': 'Event streams are only served by the ASGI server (serve --asgi).'},
+            status=status.HTTP_501_NOT_IMPLEMENTED
+        )
+    listener = await sync_to_async(_stream_listener)(request)
+    if listener is None:
+        return JsonResponse(
+            {'detail': 'Authentication credentials were not provided or are invalid.'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    expires_at, channels = listener
+    response = StreamingHttpResponse(sse_stream(channels, expires_at), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,5 +1,36 @@
 import apiClient from './client';
 
+// Router list endpoints are cursor-paginated. listPage fetches one page:
+// `response.data.results`, and `response.data.next` to pass back for the
+// page after it (null on the last one). Lists that grow without bound, such
+// as bookings and users, are paged through in the UI this way.
+function listPage(path, next, config) {
+  return next ? apiClient.get(next) : apiClient.get(path, config);
+}
+
+// Append a page to the rows already shown; a row in both keeps its first copy.
+export function mergePages(first, second) {
+  const ids = new Set(first.map((row) => row.id));
+  return [...first, ...second.filter((row) => !ids.has(row.id))];
+}
+
+// Small, bounded lists: follow `next` until exhausted so callers receive a
+// plain array in `response.data`.
+async function listAllPages(path, config) {
+  const response = await apiClient.get(path, config);
+  if (!response.data || !Array.isArray(response.data.results)) {
+    return response;
+  }
+  const results = [...response.data.results];
+  let next = response.data.next;
+  while (next) {
+    const page = await apiClient.get(next);
+    results.push(...page.data.results);
+    next = page.data.next;
+  }
+  return { ...response, data: results };
+}
+
 export const authAPI = {
   login: (username, password) =>
     apiClient.post('/token/', { username, password }),
@@ -29,11 +60,11 @@ export const authAPI = {
   
   me: () => apiClient.get('/users/me/'),
   
-  getProfile: () => apiClient.get('/profiles/'),
+  getProfile: () => listAllPages('/profiles/'),
 };
 
 export const restaurantAPI = {
-  list: () => apiClient.get('/restaurants/'),
+  list: () => listAllPages('/restaurants/'),
   
   create: (data) => apiClient.post('/restaurants/', data),
   
@@ -46,8 +77,13 @@ export const restaurantAPI = {
   myRestaurants: () => apiClient.get('/restaurants/my_restaurants/'),
 };
 
+// Active restaurants with their available visiinias in one cacheable document.
+export const catalogueAPI = {
+  get: () => apiClient.get('/catalogue/'),
+};
+
 export const visioniaAPI = {
-  list: () => apiClient.get('/visiinias/'),
+  list: () => listAllPages('/visiinias/'),
   
   create: (data) => apiClient.post('/visiinias/', data),
   
@@ -61,12 +97,29 @@ export const visioniaAPI = {
     apiClient.get('/visiinias/by_restaurant/', {
       params: { restaurant_id: restaurantId },
     }),
+
+  // One page of ranked results; pass `cursor` from response.data.next for more.
+  search: (q, { minPrice, maxPrice, restaurantId, cursor } = {}) =>
+    apiClient.get('/visiinias/search/', {
+      params: {
+        q,
+        min_price: minPrice,
+        max_price: maxPrice,
+        restaurant_id: restaurantId,
+        cursor,
+      },
+    }),
 };
 
 export const bookingAPI = {
-  list: () => apiClient.get('/bookings/'),
+  // One page; pass `next` from the previous response for the one after it.
+  list: (next) => listPage('/bookings/', next),
   
-  create: (data) => apiClient.post('/bookings/', data),
+  // Reuse the same key when retrying one order so the server creates it once.
+  create: (data, idempotencyKey) =>
+    apiClient.post('/bookings/', data, {
+      headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {},
+    }),
   
   get: (id) => apiClient.get(`/bookings/${id}/`),
   
@@ -77,10 +130,64 @@ export const bookingAPI = {
   complete: (id) => apiClient.post(`/bookings/${id}/complete/`),
   
   cancel: (id) => apiClient.post(`/bookings/${id}/cancel/`),
+
+  // Move many bookings to CONFIRMED, COMPLETED or CANCELLED in one request.
+  batchStatus: (ids, status) => apiClient.post('/bookings/batch_status/', { ids, status }),
+
+  // Server-Sent Events for bookings the user can see. EventSource cannot set
+  // headers, so each connection opens with a short-lived ticket fetched
+  // through apiClient, which refreshes an expired access token first. On any
+  // error the stream is reopened with a fresh ticket, backing off up to a
+  // minute; onStatus(false) tells the caller to poll meanwhile. Returns a closer.
+  subscribe: (onEvent, onStatus = () => {}) => {
+    let source = null;
+    let timer = null;
+    let closed = false;
+    let delay = 1000;
+    const handle = (event) => onEvent(event.type, JSON.parse(event.data));
+    const reconnect = () => {
+      onStatus(false);
+      timer = setTimeout(open, delay);
+      delay = Math.min(delay * 2, 60000);
+    };
+    const open = async () => {
+      let ticket;
+      try {
+        ticket = (await apiClient.post('/bookings/events/ticket/')).data.ticket;
+      } catch (error) {
+        if (!closed) reconnect();
+        return;
+      }
+      if (closed) return;
+      source = new EventSource(
+        `${apiClient.defaults.baseURL}/bookings/events/?ticket=${encodeURIComponent(ticket)}`
+      );
+      source.addEventListener('booking.created', handle);
+      source.addEventListener('booking.status', handle);
+      source.onopen = () => {
+        delay = 1000;
+        onStatus(true);
+      };
+      source.onerror = () => {
+        // EventSource would retry with the same, possibly expired, ticket.
+        source.close();
+        if (!closed) reconnect();
+      };
+    };
+    open();
+    return () => {
+      closed = true;
+      clearTimeout(timer);
+      if (source) source.close();
+    };
+  },
 };
 
 export const userAPI = {
-  list: () => apiClient.get('/users/'),
+  // One page; pass `next` from the previous response for the one after it.
+  list: (next) => listPage('/users/', next),
+
+  owners: () => listAllPages('/users/', { params: { role: 'RESTAURANT_OWNER' } }),
   
   get: (id) => apiClient.get(`/users/${id}/`),
 
@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { authAPI, userAPI, restaurantAPI, visioniaAPI, bookingAPI } from '../api/endpoints';
+import { authAPI, userAPI, restaurantAPI, visioniaAPI, bookingAPI, mergePages } from '../api/endpoints';
 import { buildImageUrl } from '../api/client';
 import './AdminDashboard.css';
 
@@ -15,7 +15,10 @@ export default function AdminDashboard() {
   const [activeTab, setActiveTab] = useState('restaurants');
   const [restaurants, setRestaurants] = useState([]);
   const [users, setUsers] = useState([]);
+  const [usersNext, setUsersNext] = useState(null);
   const [bookings, setBookings] = useState([]);
+  const [bookingsNext, setBookingsNext] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [visiinias, setVisiinias] = useState([]);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
@@ -68,18 +71,20 @@ export default function AdminDashboard() {
     setLoading(true);
     try {
       if (tab === 'restaurants') {
-        const [restaurantRes, usersRes] = await Promise.all([
+        const [restaurantRes, ownersRes] = await Promise.all([
           restaurantAPI.list(),
-          userAPI.list()
+          userAPI.owners()
         ]);
         setRestaurants(restaurantRes.data);
-        setOwnerUsers(usersRes.data.filter(u => u.profile?.role === 'RESTAURANT_OWNER'));
+        setOwnerUsers(ownersRes.data);
       } else if (tab === 'users') {
         const res = await userAPI.list();
-        setUsers(res.data);
+        setUsers(res.data.results);
+        setUsersNext(res.data.next);
       } else if (tab === 'bookings') {
         const res = await bookingAPI.list();
-        setBookings(res.data);
+        setBookings(res.data.results);
+        setBookingsNext(res.data.next);
       } else if (tab === 'visiinias') {
         const res = await visioniaAPI.list();
         setVisiinias(res.data);
@@ -92,6 +97,19 @@ export default function AdminDashboard() {
     }
   };
 
+  const loadMore = async (list, next, setRows, setNext) => {
+    setLoadingMore(true);
+    try {
+      const res = await list(next);
+      setRows((prev) => mergePages(prev, res.data.results));
+      setNext(res.data.next);
+    } catch (err) {
+      setError('Failed to load more');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleLogout = () => {
     localStorage.clear();
     navigate('/login');
@@ -255,8 +273,9 @@ export default function AdminDashboard() {
     return {
       totalRestaurants: restaurants.length,
       activeRestaurants: restaurants.filter(r => r.is_active).length,
-      totalUsers: users.length,
-      totalBookings: bookings.length,
+      // Only the pages loaded so far are counted.
+      totalUsers: usersNext ? `${users.length}+` : users.length,
+      totalBookings: bookingsNext ? `${bookings.length}+` : bookings.length,
       pendingBookings: bookings.filter(b => b.status === 'PENDING').length,
       totalMenuItems: visiinias.length,
       availableItems: visiinias.filter(v => v.is_available).length
@@ -569,6 +588,17 @@ export default function AdminDashboard() {
                         </div>
                       ))}
                     </div>
+                    {usersNext && (
+                      <div className="load-more">
+                        <button
+                          className="btn-primary"
+                          disabled={loadingMore}
+                          onClick={() => loadMore(userAPI.list, usersNext, setUsers, setUsersNext)}
+                        >
+                          {loadingMore ? 'Loading...' : 'Load more'}
+                        </button>
+                      </div>
+                    )}
                   </div>
                 )}
               </div>
@@ -618,7 +648,7 @@ export default function AdminDashboard() {
                           </div>
                           <div className="table-cell">
                             <div className="action-buttons">
-                              {booking.status !== 'COMPLETED' && (
+                              {['PENDING', 'CONFIRMED'].includes(booking.status) && (
                                 <button 
                                   className="action-btn complete"
                                   onClick={() => handleCompleteBooking(booking.id)}
@@ -626,7 +656,7 @@ export default function AdminDashboard() {
                                   Complete
                                 </button>
                               )}
-                              {booking.status !== 'CANCELLED' && (
+                              {['PENDING', 'CONFIRMED'].includes(booking.status) && (
                                 <button 
                                   className="action-btn cancel"
                                   onClick={() => handleCancelBooking(booking.id)}
@@ -639,6 +669,17 @@ export default function AdminDashboard() {
                         </div>
                       ))}
                     </div>
+                    {bookingsNext && (
+                      <div className="load-more">
+                        <button
+                          className="btn-primary"
+                          disabled={loadingMore}
+                          onClick={() => loadMore(bookingAPI.list, bookingsNext, setBookings, setBookingsNext)}
+                        >
+                          {loadingMore ? 'Loading...' : 'Load more'}
+                        </button>
+                      </div>
+                    )}
                   </div>
                 )}
               </div>
@@ -1,9 +1,11 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { restaurantAPI, visioniaAPI, bookingAPI } from '../api/endpoints';
+import { catalogueAPI, bookingAPI } from '../api/endpoints';
 import { buildImageUrl } from '../api/client';
 import './CustomerDashboard.css';
 
+const BOOKING_POLL_INTERVAL_MS = 15000;
+
 const AUTO_RESTAURANT_IMAGES = [
   '/media/restaurants/poaz_logo.jpg',
   '/media/restaurants/taste_me.jpeg',
@@ -50,6 +52,7 @@ export default function CustomerDashboard() {
   const [restaurants, setRestaurants] = useState([]);
   const [visiinias, setVisiinias] = useState([]);
   const [bookings, setBookings] = useState([]);
+  const [liveBookings, setLiveBookings] = useState(false);
   const [selectedRestaurant, setSelectedRestaurant] = useState(null);
   const [cart, setCart] = useState([]);
   const [loading, setLoading] = useState(false);
@@ -61,6 +64,8 @@ export default function CustomerDashboard() {
   const [failedFallbackImages, setFailedFallbackImages] = useState({});
   const [showDescriptionModal, setShowDescriptionModal] = useState(false);
   const [selectedDescription, setSelectedDescription] = useState({ title: '', content: '' });
+  // One key per order: resubmitting the same cart never creates a second booking.
+  const orderKeyRef = useRef(null);
   const user = JSON.parse(localStorage.getItem('user') || '{}');
 
   // Check if user is authenticated
@@ -100,6 +105,41 @@ export default function CustomerDashboard() {
     fetchData(activeTab);
   }, [activeTab]);
 
+  const refreshBookings = () => bookingAPI.myBookings().then((res) => setBookings(res.data)).catch(() => {});
+
+  // Live updates: status changes are patched in place and new bookings
+  // trigger one refetch. Events missed while disconnected are caught up on
+  // reconnect.
+  useEffect(() => {
+    if (activeTab !== 'bookings') return undefined;
+    let connected = false;
+    const close = bookingAPI.subscribe(
+      (type, data) => {
+        if (type === 'booking.status') {
+          setBookings((prev) => prev.map((b) => (b.id === data.booking_id ? { ...b, status: data.status } : b)));
+        } else {
+          refreshBookings();
+        }
+      },
+      (open) => {
+        if (open && !connected) refreshBookings();
+        connected = open;
+        setLiveBookings(open);
+      },
+    );
+    return () => {
+      close();
+      setLiveBookings(false);
+    };
+  }, [activeTab]);
+
+  // Poll while the event stream is unavailable.
+  useEffect(() => {
+    if (activeTab !== 'bookings' || liveBookings) return undefined;
+    const timer = setInterval(refreshBookings, BOOKING_POLL_INTERVAL_MS);
+    return () => clearInterval(timer);
+  }, [activeTab, liveBookings]);
+
   useEffect(() => {
     if (error) {
       const timer = setTimeout(() => setError(''), 5000);
@@ -118,8 +158,8 @@ export default function CustomerDashboard() {
     setLoading(true);
     try {
       if (tab === 'restaurants') {
-        const res = await restaurantAPI.list();
-        setRestaurants(res.data.filter(r => r.is_active));
+        const res = await catalogueAPI.get();
+        setRestaurants(res.data.restaurants);
       } else if (tab === 'bookings') {
         const res = await bookingAPI.myBookings();
         setBookings(res.data);
@@ -136,8 +176,10 @@ export default function CustomerDashboard() {
     setSelectedRestaurant(restaurant);
     setLoading(true);
     try {
-      const res = await visioniaAPI.byRestaurant(restaurant.id);
-      setVisiinias(res.data.filter(v => v.is_available));
+      // Revalidated with its ETag, so this is usually a 304.
+      const res = await catalogueAPI.get();
+      const current = res.data.restaurants.find(r => r.id === restaurant.id);
+      setVisiinias(current ? current.visiinias : []);
     } catch (err) {
       console.error('Error fetching visiinias:', err);
       setError(err.response?.data?.detail || 'Failed to load menu items');
@@ -178,6 +220,11 @@ export default function CustomerDashboard() {
     setSuccess(`${item.name} removed from cart`);
   };
 
+  // A changed order is a new request and needs a new key.
+  useEffect(() => {
+    orderKeyRef.current = null;
+  }, [cart, bookingNotes, selectedRestaurant]);
+
   const handlePlaceOrder = async (e) => {
     e.preventDefault();
     if (cart.length === 0) {
@@ -187,11 +234,15 @@ export default function CustomerDashboard() {
 
     try {
       const items = cart.map(item => ({ [item.id]: item.quantity }));
+      if (!orderKeyRef.current) {
+        orderKeyRef.current = crypto.randomUUID();
+      }
       await bookingAPI.create({
         restaurant_id: selectedRestaurant.id,
         items,
         notes: bookingNotes,
-      });
+      }, orderKeyRef.current);
+      orderKeyRef.current = null;
       setSuccess('Order placed successfully!');
       setCart([]);
       setShowBookingForm(false);
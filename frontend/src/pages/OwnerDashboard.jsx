@@ -1,9 +1,11 @@
 import { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { restaurantAPI, visioniaAPI, bookingAPI } from '../api/endpoints';
+import { restaurantAPI, visioniaAPI, bookingAPI, mergePages } from '../api/endpoints';
 import { buildImageUrl } from '../api/client';
 import './OwnerDashboard.css';
 
+const BOOKING_POLL_INTERVAL_MS = 15000;
+
 const RESTAURANT_LOGO_OPTIONS = [
   { value: 'restaurants/poaz_logo.jpg', label: 'Poaz Logo' },
   { value: 'restaurants/taste_me.jpeg', label: 'Taste Me Logo' },
@@ -33,6 +35,9 @@ export default function OwnerDashboard() {
   const [restaurants, setRestaurants] = useState([]);
   const [visiinias, setVisiinias] = useState([]);
   const [bookings, setBookings] = useState([]);
+  const [bookingsNext, setBookingsNext] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [liveBookings, setLiveBookings] = useState(false);
   const [loading, setLoading] = useState(false);
   const [showEditRestaurant, setShowEditRestaurant] = useState(false);
   const [showAddVisinia, setShowAddVisinia] = useState(false);
@@ -64,6 +69,56 @@ export default function OwnerDashboard() {
     fetchData(activeTab);
   }, [activeTab]);
 
+  // The newest page again, on top of any older pages already loaded.
+  const refreshBookings = () =>
+    bookingAPI.list().then((res) => setBookings((prev) => mergePages(res.data.results, prev))).catch(() => {});
+
+  const loadMoreBookings = async () => {
+    setLoadingMore(true);
+    try {
+      const res = await bookingAPI.list(bookingsNext);
+      setBookings((prev) => mergePages(prev, res.data.results));
+      setBookingsNext(res.data.next);
+    } catch (err) {
+      setError('Failed to load more orders');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  // Live updates: status changes are patched in place and new bookings
+  // trigger one refetch. Events missed while disconnected are caught up on
+  // reconnect.
+  useEffect(() => {
+    if (activeTab !== 'bookings') return undefined;
+    let connected = false;
+    const close = bookingAPI.subscribe(
+      (type, data) => {
+        if (type === 'booking.status') {
+          setBookings((prev) => prev.map((b) => (b.id === data.booking_id ? { ...b, status: data.status } : b)));
+        } else {
+          refreshBookings();
+        }
+      },
+      (open) => {
+        if (open && !connected) refreshBookings();
+        connected = open;
+        setLiveBookings(open);
+      },
+    );
+    return () => {
+      close();
+      setLiveBookings(false);
+    };
+  }, [activeTab]);
+
+  // Poll while the event stream is unavailable.
+  useEffect(() => {
+    if (activeTab !== 'bookings' || liveBookings) return undefined;
+    const timer = setInterval(refreshBookings, BOOKING_POLL_INTERVAL_MS);
+    return () => clearInterval(timer);
+  }, [activeTab, liveBookings]);
+
   useEffect(() => {
     if (error) {
       const timer = setTimeout(() => setError(''), 5000);
@@ -91,7 +146,8 @@ export default function OwnerDashboard() {
         setVisiinias(res.data.filter(v => ownerIds.includes(v.restaurant)));
       } else if (tab === 'bookings') {
         const res = await bookingAPI.list();
-        setBookings(res.data);
+        setBookings(res.data.results);
+        setBookingsNext(res.data.next);
       }
     } catch (err) {
       setError('Failed to load data');
@@ -592,6 +648,13 @@ export default function OwnerDashboard() {
                       </div>
                     ))}
                   </div>
+                  {bookingsNext && (
+                    <div className="load-more">
+                      <button className="btn-primary" disabled={loadingMore} onClick={loadMoreBookings}>
+                        {loadingMore ? 'Loading...' : 'Load more'}
+                      </button>
+                    </div>
+                  )}
                 </div>
               )}
             </div>
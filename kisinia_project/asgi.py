@@ -9,8 +9,22 @@ https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'kisinia_project.settings')
 
-application = get_asgi_application()
+
+class KisiniaASGIHandler(ASGIHandler):
+    """Route requests through settings.ASGI_URLCONF, which puts async read views in front of the sync API"""
+
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = settings.ASGI_URLCONF
+        return request, error_response
+
+
+django.setup(set_prefix=False)
+application = KisiniaASGIHandler()
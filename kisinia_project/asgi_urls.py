@@ -0,0 +1,15 @@
+"""
+URL configuration used by the ASGI server (see asgi.py).
+
+Async views answer reads on the busiest API paths without tying up a
+thread per request; every other path, and non-GET methods on those, are
+served by the sync API in kisinia_project.urls.
+"""
+from django.urls import include, path
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/', include('core.async_urls')),
+    *sync_urlpatterns,
+]
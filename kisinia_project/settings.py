@@ -14,6 +14,8 @@ from pathlib import Path
 from datetime import timedelta
 import os
 
+from corsheaders.defaults import default_headers
+
 try:
     import dj_database_url
 except ModuleNotFoundError:
@@ -58,6 +60,8 @@ if HAS_DRF_YASG:
     INSTALLED_APPS.insert(INSTALLED_APPS.index('corsheaders'), 'drf_yasg')
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
+    'core.middleware.AdmissionControlMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -71,6 +75,8 @@ MIDDLEWARE = [
 
 
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed', 'Retry-After']
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 USE_X_FORWARDED_HOST = True
 
@@ -93,6 +99,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'kisinia_project.wsgi.application'
 
+# The ASGI server routes through this URLconf: async read views first, then ROOT_URLCONF.
+ASGI_URLCONF = 'kisinia_project.asgi_urls'
+
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
@@ -104,7 +113,14 @@ DATABASE_URL = os.getenv(
 
 if dj_database_url and DATABASE_URL:
     DATABASES = {
-        'default': dj_database_url.parse(DATABASE_URL, conn_max_age=600, ssl_require=True)
+        'default': dj_database_url.parse(
+            DATABASE_URL,
+            # Keep connections open across requests in each worker, and
+            # re-check them before reuse so pooler restarts are survived.
+            conn_max_age=int(os.getenv('DB_CONN_MAX_AGE', '600')),
+            conn_health_checks=True,
+            ssl_require=True,
+        )
     }
 else:
     DATABASES = {
@@ -145,14 +161,121 @@ STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = Path(os.getenv('MEDIA_ROOT', str(BASE_DIR / 'media')))
 
+# Hand media transfers to the front-end server instead of streaming them
+# from a Django worker: '' (stream), 'x-accel' (nginx) or 'x-sendfile'.
+MEDIA_OFFLOAD = os.getenv('MEDIA_OFFLOAD', '')
+# nginx "internal" location aliased to MEDIA_ROOT, used with x-accel.
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-media/')
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.ClaimsJWTAuthentication',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.CreatedAtCursorPagination',
+    'DEFAULT_THROTTLE_CLASSES': (
+        'core.throttling.TokenBucketThrottle',
+    ),
+    # Hops of trusted proxies in X-Forwarded-For (Render adds one).
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '1')),
+    'PAGE_SIZE': 50,
 }
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
+    'TOKEN_OBTAIN_SERIALIZER': 'core.serializers.RoleTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'core.serializers.RoleTokenRefreshSerializer',
+}
+
+# Seconds a user's claims version stays cached. Role and staff changes
+# invalidate it through signals; with a per-process cache other workers
+# keep accepting older tokens for up to this long.
+AUTH_VERSION_CACHE_TTL = int(os.getenv('AUTH_VERSION_CACHE_TTL', '300'))
+
+# Cache backend for serialized menus and other shared caches.
+# locmem is per process; use "file" or "db" (run createcachetable first)
+# when several worker processes must see the same invalidations.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'kisinia',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / '.cache')),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', 'kisinia_cache'),
+    },
+}
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
+}
+MENU_CACHE_ALIAS = 'default'
+
+# /api/catalogue/ snapshots are also written here, pre-compressed, so a
+# restarted worker does not have to rebuild them. Keep it outside MEDIA_ROOT.
+CATALOGUE_ROOT = Path(os.getenv('CATALOGUE_ROOT', str(BASE_DIR / 'var' / 'catalogue')))
+
+# Seconds a resolved UserProfile role is kept in the per-process cache.
+ROLE_CACHE_TTL = int(os.getenv('ROLE_CACHE_TTL', '300'))
+
+# Idempotency-Key handling for POST /api/bookings/ (seconds): how long a
+# stored response is replayed, how long a duplicate waits for an in-flight
+# original, when an unfinished original is presumed dead, and how often a
+# background task deletes expired keys (0 disables it).
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', str(24 * 60 * 60)))
+IDEMPOTENCY_WAIT = float(os.getenv('IDEMPOTENCY_WAIT', '5'))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', '30'))
+IDEMPOTENCY_SWEEP_INTERVAL = int(os.getenv('IDEMPOTENCY_SWEEP_INTERVAL', '3600'))
+
+# Booking event push (/api/bookings/events/). The in-process broker only
+# reaches streams served by the same process; see DEPLOYMENT.md.
+EVENT_BROKER = os.getenv('EVENT_BROKER', 'core.events.InProcessBroker')
+SSE_HEARTBEAT = int(os.getenv('SSE_HEARTBEAT', '15'))
+SSE_MAX_DURATION = int(os.getenv('SSE_MAX_DURATION', '300'))
+# Seconds a stream ticket (the EventSource stand-in for the access token) is accepted.
+SSE_TICKET_TTL = int(os.getenv('SSE_TICKET_TTL', '60'))
+
+
+# Request metrics (/api/_metrics, staff only). Requests slower than this many
+# milliseconds are logged with their SQL to the core.metrics logger; 0 disables.
+METRICS_SLOW_REQUEST_MS = int(os.getenv('METRICS_SLOW_REQUEST_MS', '0'))
+
+# Token-bucket rate limits per user (per client IP when anonymous), kept in
+# the THROTTLE_CACHE_ALIAS cache: scope -> (sustained rate, burst). "auth"
+# covers login, refresh and registration and is also charged per username.
+# With several workers use a shared CACHE_BACKEND so they share buckets.
+THROTTLE_ENABLED = os.getenv('THROTTLE_ENABLED', 'true').lower() == 'true'
+THROTTLE_CACHE_ALIAS = 'default'
+THROTTLE_BUCKETS = {
+    'auth': (os.getenv('THROTTLE_AUTH_RATE', '10/min'), int(os.getenv('THROTTLE_AUTH_BURST', '10'))),
+    'write': (os.getenv('THROTTLE_WRITE_RATE', '60/min'), int(os.getenv('THROTTLE_WRITE_BURST', '30'))),
+    'read': (os.getenv('THROTTLE_READ_RATE', '10/s'), int(os.getenv('THROTTLE_READ_BURST', '200'))),
 }
 
+# Admission control, per process (0 disables): concurrent password-hashing
+# requests, requests in flight, and the longest wait behind the front-end
+# proxy (X-Request-Start) before a request is refused with 503.
+CONCURRENCY_LIMITS = {
+    'auth': int(os.getenv('AUTH_MAX_CONCURRENT', '2')),
+}
+MAX_INFLIGHT_REQUESTS = int(os.getenv('MAX_INFLIGHT_REQUESTS', '0'))
+MAX_QUEUE_WAIT_MS = int(os.getenv('MAX_QUEUE_WAIT_MS', '0'))
+
+# Items that sold out their daily capacity are switched back on by the first
+# booking after midnight, checked at most once per this many seconds.
+STOCK_RESTOCK_INTERVAL = int(os.getenv('STOCK_RESTOCK_INTERVAL', '300'))
+
+# Background tasks (core.tasks), run by `manage.py run_workers` or by the
+# workers `serve` starts. TASKS_RUN_INLINE runs them in the request after
+# commit instead, for runserver without workers. Failed tasks are retried
+# after TASK_RETRY_DELAY seconds, doubling up to TASK_RETRY_MAX_DELAY; a task
+# RUNNING for longer than TASK_LEASE_SECONDS is presumed lost and retried.
+TASKS_RUN_INLINE = os.getenv('TASKS_RUN_INLINE', str(DEBUG)).lower() == 'true'
+TASK_POLL_INTERVAL = float(os.getenv('TASK_POLL_INTERVAL', '1'))
+TASK_RETRY_DELAY = int(os.getenv('TASK_RETRY_DELAY', '10'))
+TASK_RETRY_MAX_DELAY = int(os.getenv('TASK_RETRY_MAX_DELAY', '3600'))
+TASK_LEASE_SECONDS = int(os.getenv('TASK_LEASE_SECONDS', '600'))
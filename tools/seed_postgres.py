@@ -4,7 +4,6 @@ import time
 
 import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
-import os
 
 # Postgres connection info - matches kisinia_project/settings.py
 PG_HOST = 'localhost'
@@ -56,13 +55,10 @@ def main():
         if conn:
             conn.close()
 
-    # run migrations and load fixture with env var to disable auto-profile creation
-    env = dict(**os.environ)
-    env['DISABLE_AUTO_CREATE_PROFILE'] = '1'
-    run([PYTHON_EXE, MANAGE_PY, 'migrate'], env=env)
+    run([PYTHON_EXE, MANAGE_PY, 'migrate'])
 
-    # load fixture
-    run([PYTHON_EXE, MANAGE_PY, 'loaddata', FIXTURE], env=env)
+    # bulk load (COPY, no signals); users without a profile get the default one
+    run([PYTHON_EXE, MANAGE_PY, 'bulk_fixture', 'import', FIXTURE])
 
     print('Seeding complete')
 